@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""股票數據處理效能測試 (離線，不需連網)
+
+使用方式:
+    python benchmark_stock_data.py
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def _timeit(func, repeat: int = 5) -> float:
+    """執行多次並回傳最短耗時 (秒)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def make_raw_bars(rows: int, seed: int = 0) -> pd.DataFrame:
+    """產生與 TWSE STOCK_DAY 原始回應相同格式的字串資料 (含千分位、'--'、'X' 與正負號)"""
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.normal(0, 1, rows).cumsum()
+    volume = rng.integers(1_000, 50_000_000, rows)
+    change = rng.normal(0, 1, rows)
+
+    def fmt(values, pattern):
+        return [pattern.format(v) for v in values]
+
+    # 約 5 年的交易日，多檔股票共用相同日期
+    days = pd.bdate_range('2021-01-01', periods=1250)[np.arange(rows) % 1250]
+    df = pd.DataFrame({
+        'date': [f"{d.year - 1911}/{d.month:02d}/{d.day:02d}" for d in days],
+        'volume': fmt(volume, "{:,}"),
+        'value': fmt(volume * 100, "{:,}"),
+        'open': fmt(close, "{:.2f}"),
+        'high': fmt(close + 1, "{:.2f}"),
+        'low': fmt(close - 1, "{:.2f}"),
+        'close': fmt(close, "{:.2f}"),
+        'change': fmt(change, "{:+.2f}"),
+        'transaction': fmt(volume // 1000, "{:,}"),
+    })
+    df.loc[::50, ['open', 'high', 'low', 'close']] = '--'
+    df.loc[::37, 'change'] = 'X0.00'
+    return df
+
+
+def legacy_clean_data(df: pd.DataFrame) -> pd.DataFrame:
+    """原本的逐欄字串替換與逐列 _parse_change 實作 (作為比較基準)"""
+    def parse_change(value):
+        try:
+            value = str(value).strip()
+            if value.startswith('+'):
+                return float(value[1:])
+            elif value.startswith('-'):
+                return -float(value[1:])
+            elif value.startswith('X'):
+                return 0.0
+            else:
+                return float(value) if value else 0.0
+        except Exception:
+            return 0.0
+
+    df = df.copy()
+    for col in ['volume', 'value', 'open', 'high', 'low', 'close', 'transaction']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.replace(',', '').str.replace('--', '0')
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    if 'change' in df.columns:
+        df['change'] = df['change'].astype(str).str.replace(',', '')
+        df['change'] = df['change'].apply(parse_change)
+    return df
+
+
+def make_indicator_bars(rows: int, seed: int = 0) -> pd.DataFrame:
+    """產生含 close、MA5、MA20、RSI、K、D 欄位的日 K (指標暖身期為 NaN)"""
+    rng = np.random.default_rng(seed)
+    close = pd.Series(100 + rng.normal(0, 1, rows).cumsum())
+    k = pd.Series(rng.uniform(0, 100, rows)).ewm(alpha=1 / 3).mean()
+    df = pd.DataFrame({
+        'close': close,
+        'MA5': close.rolling(5).mean(),
+        'MA20': close.rolling(20).mean(),
+        'RSI': pd.Series(rng.uniform(0, 100, rows)).ewm(alpha=0.2).mean().where(lambda s: s.index >= 14),
+        'K': k,
+        'D': k.ewm(alpha=1 / 3).mean(),
+    })
+    df.index = pd.bdate_range('2016-01-01', periods=rows)
+    return df
+
+
+def legacy_find_buy_sell_points(df: pd.DataFrame) -> dict:
+    """原本逐列 (df.iloc) 計算的 find_buy_sell_points 實作 (作為比較基準)"""
+    buy_points = []
+    sell_points = []
+
+    if df.empty or len(df) < 20:
+        return {'buy_points': buy_points, 'sell_points': sell_points}
+
+    for i in range(2, len(df)):
+        curr = df.iloc[i]
+        prev = df.iloc[i - 1]
+
+        buy_score = 0
+        sell_score = 0
+
+        # MA 交叉
+        if pd.notna(curr.get('MA5')) and pd.notna(curr.get('MA20')) and \
+           pd.notna(prev.get('MA5')) and pd.notna(prev.get('MA20')):
+            if prev['MA5'] <= prev['MA20'] and curr['MA5'] > curr['MA20']:
+                buy_score += 2
+            elif prev['MA5'] >= prev['MA20'] and curr['MA5'] < curr['MA20']:
+                sell_score += 2
+
+        # RSI
+        if pd.notna(curr.get('RSI')):
+            if curr['RSI'] < 30:
+                buy_score += 1
+            elif curr['RSI'] > 70:
+                sell_score += 1
+
+        # KD 交叉
+        if pd.notna(curr.get('K')) and pd.notna(curr.get('D')) and \
+           pd.notna(prev.get('K')) and pd.notna(prev.get('D')):
+            if curr['K'] < 30 and prev['K'] <= prev['D'] and curr['K'] > curr['D']:
+                buy_score += 2
+            elif curr['K'] > 70 and prev['K'] >= prev['D'] and curr['K'] < curr['D']:
+                sell_score += 2
+
+        if buy_score >= 2:
+            buy_points.append({'index': i, 'date': df.index[i], 'price': curr.get('close', 0), 'score': buy_score})
+        elif sell_score >= 2:
+            sell_points.append({'index': i, 'date': df.index[i], 'price': curr.get('close', 0), 'score': sell_score})
+
+    return {'buy_points': buy_points, 'sell_points': sell_points}
+
+
+def legacy_support_resistance(df: pd.DataFrame) -> dict:
+    """原本逐列比較 5 根 K 線的 calculate_support_resistance 實作 (作為比較基準)"""
+    if df.empty or len(df) < 5:
+        return {'support': [], 'resistance': []}
+
+    highs = df['high'].values
+    lows = df['low'].values
+    closes = df['close'].values
+
+    resistance_levels = []
+    support_levels = []
+    for i in range(2, len(df) - 2):
+        if highs[i] > highs[i-1] and highs[i] > highs[i-2] and \
+           highs[i] > highs[i+1] and highs[i] > highs[i+2]:
+            resistance_levels.append(highs[i])
+        if lows[i] < lows[i-1] and lows[i] < lows[i-2] and \
+           lows[i] < lows[i+1] and lows[i] < lows[i+2]:
+            support_levels.append(lows[i])
+
+    current_price = closes[-1]
+    valid_support = sorted([s for s in support_levels if s < current_price], reverse=True)[:3]
+    valid_resistance = sorted([r for r in resistance_levels if r > current_price])[:3]
+    return {'support': valid_support, 'resistance': valid_resistance, 'current_price': current_price}
+
+
+def bench_clean_data(rows: int = 250 * 5 * 100) -> None:
+    """_clean_data: 目前實作 vs 原本實作 (預設約 100 檔股票 × 5 年日 K)"""
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    raw = make_raw_bars(rows)
+
+    expected = legacy_clean_data(raw)
+    actual = fetcher._clean_data(raw)
+    cols = TWSEDataFetcher.NUMERIC_COLUMNS + ['change']
+    # 目前實作將價量欄位的 '--' (無成交) 視為 NaN，原本實作為 0
+    for col in TWSEDataFetcher.NUMERIC_COLUMNS:
+        expected.loc[raw[col] == '--', col] = np.nan
+    np.testing.assert_allclose(actual[cols].to_numpy(float), expected[cols].to_numpy(float))
+
+    legacy = _timeit(lambda: legacy_clean_data(raw))
+    current = _timeit(lambda: fetcher._clean_data(raw))
+    print(f"_clean_data ({rows:,} 列): 原本 {legacy * 1000:.1f} ms, "
+          f"目前 {current * 1000:.1f} ms, 加速 {legacy / current:.1f}x")
+
+
+def bench_roc_dates(rows: int = 250 * 5 * 100) -> None:
+    """民國年日期: 匯入時一次轉換 vs 原本繪圖時逐列解析"""
+    from datetime import datetime
+    from knowledge_base.tools.history_store import roc_to_datetime
+
+    def parse_date(date_str):
+        parts = date_str.split('/')
+        return datetime(int(parts[0]) + 1911, int(parts[1]), int(parts[2]))
+
+    dates = make_raw_bars(rows)['date']
+    assert (pd.DatetimeIndex(dates.apply(parse_date)) == roc_to_datetime(dates)).all()
+
+    legacy = _timeit(lambda: dates.apply(parse_date))
+    current = _timeit(lambda: roc_to_datetime(dates))
+    print(f"民國年日期 ({rows:,} 列): 原本 {legacy * 1000:.1f} ms, "
+          f"目前 {current * 1000:.1f} ms, 加速 {legacy / current:.1f}x")
+
+
+def bench_fetch_throughput(symbols: int = 20, months: int = 12, latency: float = 0.02) -> None:
+    """抓取流程: 經由本地模擬伺服器 (固定延遲) 下載 symbols 檔 × months 個月，再由本地快取讀取"""
+    import os
+    import tempfile
+    from knowledge_base.tools.fixture_server import FixtureServer
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.http_cache import ResponseCache
+    from knowledge_base.tools.market_snapshot import DailySnapshotCache
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+    from knowledge_base.tools.replay import FixtureStore
+    from knowledge_base.tools.request_executor import RequestExecutor
+    from knowledge_base.tools.symbol_master import SymbolMaster
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    tmpdir = tempfile.mkdtemp()
+    base = "https://www.twse.com.tw/exchangeReport"
+    store = FixtureStore(os.path.join(tmpdir, 'fixtures'))
+    stock_ids = [f"9{i:03d}" for i in range(symbols)]
+    periods = pd.period_range('2023-01', periods=months, freq='M')
+    for period in periods:
+        days = pd.bdate_range(period.start_time, period.end_time)
+        rows = [f"{d.year - 1911}/{d.month:02d}/{d.day:02d}" for d in days]
+        date_str = f"{period.year}{period.month:02d}01"
+        store.put_json(f"{base}/FMTQIK?response=json&date={date_str}", {'stat': 'OK', 'data': [[r] for r in rows]})
+        for stock_id in stock_ids:
+            store.put_json(f"{base}/STOCK_DAY?response=json&date={date_str}&stockNo={stock_id}",
+                           {'stat': 'OK', 'data': [[r, "1,000", "100,000", "100.00", "101.00", "99.00",
+                                                    "100.50", "+0.50", "50", ""] for r in rows]})
+    TWSEDataFetcher._market_cache.update({stock_id: 'TWSE' for stock_id in stock_ids})
+
+    def make_fetcher(name, upstream):
+        path = os.path.join(tmpdir, name)
+        return TWSEDataFetcher(
+            history_store=HistoryStore(os.path.join(path, 'history.db')),
+            tpex_snapshots=DailySnapshotCache('TPEX', directory=path),
+            rate_limiter=HostRateLimiter(rates={}, default_rate=1000),
+            response_cache=ResponseCache(os.path.join(path, 'http_cache.db')),
+            symbol_master=SymbolMaster(lambda url: None, path=os.path.join(path, 'symbols.json')),
+            request_executor=RequestExecutor(hedge=False),
+            upstream=upstream,
+        )
+
+    start, end = periods[0].start_time.date(), periods[-1].end_time.date()
+    with FixtureServer(store, latency=latency) as server:
+        fetcher = make_fetcher('run', server.url)
+        began = time.perf_counter()
+        bars = sum(len(fetcher.get_stock_history(s, start=start, end=end)) for s in stock_ids)
+        cold = time.perf_counter() - began
+        requests_sent = len(server.requests)
+        warm = _timeit(lambda: [fetcher.get_stock_history(s, start=start, end=end) for s in stock_ids], repeat=3)
+        assert len(server.requests) == requests_sent
+
+    print(f"抓取流程 ({symbols} 檔 × {months} 個月，延遲 {latency * 1000:.0f} ms): "
+          f"下載 {requests_sent} 個請求 {cold:.2f}s ({requests_sent / cold:.0f} req/s，{bars:,} 筆)，"
+          f"本地讀取 {warm * 1000:.1f} ms")
+
+
+def bench_price_panel(symbols: int = 1800, days: int = 1250) -> None:
+    """全市場價量面板: 取得某一交易日全市場收盤價 (記憶體映射) vs 逐檔由歷史資料庫讀取"""
+    import os
+    import tempfile
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.price_panel import PricePanel
+
+    tmpdir = tempfile.mkdtemp()
+    dates = pd.bdate_range('2021-01-01', periods=days)
+    stock_ids = [f"{1000 + i}" for i in range(symbols)]
+    rng = np.random.default_rng(0)
+
+    writer = PricePanel(os.path.join(tmpdir, 'panel'), writable=True)
+    writer.add_dates(dates)
+    writer.add_symbols(stock_ids)
+    for name in PricePanel.FIELDS:
+        writer._arrays[name][:symbols, :days] = 100 + rng.normal(0, 1, (symbols, days)).cumsum(axis=1)
+    writer.flush()
+
+    # 比較基準: 其中 100 檔寫入歷史資料庫，逐檔讀取後取該日收盤價
+    store = HistoryStore(os.path.join(tmpdir, 'history.db'))
+    sample = stock_ids[:100]
+    for i, stock_id in enumerate(sample):
+        df = pd.DataFrame({col: writer._arrays['close'][i, :days] for col in HistoryStore.COLUMNS})
+        df['date'] = dates
+        store.upsert_bars(stock_id, 'TWSE', df)
+    day = dates[-1]
+
+    reader = PricePanel(os.path.join(tmpdir, 'panel'))
+    panel = _timeit(lambda: reader.column('close', day), repeat=100)
+    opened = _timeit(lambda: PricePanel(os.path.join(tmpdir, 'panel')).column('close', day), repeat=5)
+    legacy = _timeit(lambda: [store.load_bars(s, start=day.date(), end=day.date())['close'] for s in sample],
+                     repeat=3) * symbols / len(sample)
+    store.close()
+    print(f"全市場單日收盤價 ({symbols:,} 檔 × {days:,} 日): 逐檔讀取約 {legacy * 1000:.0f} ms, "
+          f"面板切片 {panel * 1e6:.1f} µs (含開啟 {opened * 1000:.1f} ms)")
+
+
+def bench_find_buy_sell_points(symbols: int = 1000, days: int = 2500) -> None:
+    """find_buy_sell_points: 陣列運算 vs 原本逐列實作 (預設 1,000 檔 × 10 年日 K)"""
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    frames = [make_indicator_bars(days, seed=i) for i in range(symbols)]
+
+    # 原本實作每檔約需數百毫秒，只取前 10 檔測量後換算全部
+    sample = frames[:10]
+    for df in sample:
+        assert fetcher.find_buy_sell_points(df) == legacy_find_buy_sell_points(df)
+
+    legacy = _timeit(lambda: [legacy_find_buy_sell_points(df) for df in sample], repeat=1) * symbols / len(sample)
+    current = _timeit(lambda: [fetcher.find_buy_sell_points(df) for df in frames], repeat=3)
+    print(f"find_buy_sell_points ({symbols:,} 檔 × {days:,} 日): 原本約 {legacy:.1f} s, "
+          f"目前 {current * 1000:.0f} ms, 加速 {legacy / current:.0f}x")
+
+
+def bench_support_resistance(symbols: int = 1800, days: int = 2500) -> None:
+    """支撐壓力位: 全市場 2-D 滑動視窗 vs 原本逐檔逐列迴圈 (預設全市場約 1,800 檔 × 10 年)"""
+    from knowledge_base.tools.pivots import nearest_levels
+
+    rng = np.random.default_rng(0)
+    close = 100 + rng.normal(0, 1, (symbols, days)).cumsum(axis=1)
+    high = close + rng.uniform(0, 1, (symbols, days))
+    low = close - rng.uniform(0, 1, (symbols, days))
+
+    # 原本實作逐檔執行，只取前 50 檔測量後換算全部
+    sample = [pd.DataFrame({'high': high[i], 'low': low[i], 'close': close[i]}) for i in range(50)]
+    levels = nearest_levels(high[:50], low[:50], close[:50])
+    for i, df in enumerate(sample):
+        expected = legacy_support_resistance(df)
+        np.testing.assert_equal(levels['support'][i], (expected['support'] or [np.nan])[0])
+        np.testing.assert_equal(levels['resistance'][i], (expected['resistance'] or [np.nan])[0])
+
+    legacy = _timeit(lambda: [legacy_support_resistance(df) for df in sample], repeat=1) * symbols / len(sample)
+    current = _timeit(lambda: nearest_levels(high, low, close), repeat=3)
+    print(f"全市場支撐壓力位 ({symbols:,} 檔 × {days:,} 日): 原本約 {legacy:.1f} s, "
+          f"目前 {current * 1000:.0f} ms, 加速 {legacy / current:.0f}x")
+
+
+def bench_indicator_engine(days: int = 2500) -> None:
+    """新增一根 K 線的技術指標: 串流引擎逐根更新 vs 整段重新計算 (預設 10 年日 K)"""
+    from knowledge_base.tools.indicator_engine import IndicatorEngine
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    df = make_indicator_bars(days + 1)[['close']]
+    df['high'] = df['close'] + 0.5
+    df['low'] = df['close'] - 0.5
+
+    engine = IndicatorEngine()
+    engine.update_frame(df.iloc[:days])
+    last = df.iloc[-1]
+    expected = fetcher.calculate_technical_indicators(df).iloc[-1]
+    latest = engine.copy().update(last['high'], last['low'], last['close'])
+    np.testing.assert_allclose([latest[c] for c in IndicatorEngine.COLUMNS],
+                               expected[IndicatorEngine.COLUMNS].astype(float), rtol=1e-9)
+
+    batch = _timeit(lambda: fetcher.calculate_technical_indicators(df))
+    state = engine.to_dict()
+    step = _timeit(lambda: IndicatorEngine.from_dict(state).update(last['high'], last['low'], last['close']),
+                   repeat=100)
+    print(f"新增一根 K 線的技術指標 ({days:,} 日歷史): 整段計算 {batch * 1000:.1f} ms, "
+          f"串流更新 (含還原狀態) {step * 1e6:.0f} µs, 加速 {batch / step:.0f}x")
+
+
+def bench_panel_indicators(symbols: int = 1800, days: int = 2500) -> None:
+    """全市場技術指標: 股票 × 交易日陣列一次計算 vs 逐檔 calculate_technical_indicators"""
+    from knowledge_base.tools.panel_indicators import panel_indicators
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    rng = np.random.default_rng(0)
+    close = 100 + rng.normal(0, 1, (symbols, days)).cumsum(axis=1)
+    high = close + rng.uniform(0, 1, close.shape)
+    low = close - rng.uniform(0, 1, close.shape)
+    # 約三分之一的股票較晚上市 (前段為 NaN)
+    listed = rng.integers(0, days - 100, symbols)
+    close[np.arange(days) < listed[:, None] * (np.arange(symbols) % 3 == 0)[:, None]] = np.nan
+
+    dates = pd.bdate_range('2016-01-01', periods=days)
+    sample = [pd.DataFrame({'high': high[i], 'low': low[i], 'close': close[i]}, index=dates).dropna(subset=['close'])
+              for i in range(30)]
+    legacy = _timeit(lambda: [fetcher.calculate_technical_indicators(df) for df in sample],
+                     repeat=1) * symbols / len(sample)
+    current = _timeit(lambda: panel_indicators(high, low, close), repeat=1)
+    print(f"全市場技術指標 ({symbols:,} 檔 × {days:,} 日): 逐檔計算約 {legacy:.1f} s, "
+          f"陣列計算 {current:.1f} s, 加速 {legacy / current:.1f}x")
+
+
+def bench_indicator_cache(tools: int = 4, months: int = 12) -> None:
+    """同一輪對話多個工具查詢同一檔股票的技術指標: 快取命中 vs 每次重新計算"""
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    df = make_indicator_bars(months * 21)[['close']]
+    df['high'] = df['close'] + 0.5
+    df['low'] = df['close'] - 0.5
+
+    fetcher._indicator_cache.clear()
+    pd.testing.assert_frame_equal(fetcher.calculate_technical_indicators(df, stock_id='2330'),
+                                  fetcher.calculate_technical_indicators(df))
+    legacy = _timeit(lambda: [fetcher.calculate_technical_indicators(df) for _ in range(tools)])
+    cached = _timeit(lambda: [fetcher.calculate_technical_indicators(df, stock_id='2330') for _ in range(tools)])
+    fetcher._indicator_cache.clear()
+    print(f"同一輪 {tools} 個工具的技術指標 ({months} 個月日 K): 每次計算 {legacy * 1000:.1f} ms, "
+          f"快取 {cached * 1000:.2f} ms, 加速 {legacy / cached:.0f}x")
+
+
+def main():
+    """主函數"""
+    print("=" * 50)
+    print("股票數據處理效能測試")
+    print("=" * 50)
+
+    benchmarks = [
+        bench_clean_data,
+        bench_roc_dates,
+        bench_fetch_throughput,
+        bench_price_panel,
+        bench_find_buy_sell_points,
+        bench_support_resistance,
+        bench_indicator_engine,
+        bench_panel_indicators,
+        bench_indicator_cache,
+    ]
+    for bench in benchmarks:
+        bench()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
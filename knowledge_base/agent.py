@@ -20,6 +20,7 @@ from knowledge_base.tools.stock_tools import (
     TradingSignalTool,
     StockPredictionTool
 )
+from knowledge_base.tools.prefetch import start_watchlist_prefetcher
 
 
 class NoStopChatOpenAI(ChatOpenAI):
@@ -101,6 +102,9 @@ class KnowledgeAgent:
         # 建立工具
         self.tools = self._create_tools()
         
+        # 收盤後預先下載自選股 (有設定 STOCK_WATCHLIST 時)
+        start_watchlist_prefetcher(verbose=verbose)
+        
         # 建立 Agent
         self.agent_executor = self._create_agent()
     
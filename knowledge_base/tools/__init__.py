@@ -9,7 +9,7 @@ from .stock_tools import (
     TradingSignalTool,
     StockPredictionTool
 )
-from .twse_data import TWSEDataFetcher
+from .twse_data import TWSEDataFetcher, get_shared_fetcher
 from .stock_chart import StockChartGenerator
 
 __all__ = [
@@ -22,5 +22,6 @@ __all__ = [
     'TradingSignalTool',
     'StockPredictionTool',
     'TWSEDataFetcher',
+    'get_shared_fetcher',
     'StockChartGenerator',
 ]
@@ -0,0 +1,137 @@
+"""歷史行情批次回補 - 將多檔股票的多年日 K 線下載至本地資料庫
+
+每個月份 (上市) / 交易日 (上櫃) 下載完成即寫入本地資料庫並記錄於 fetch_log，
+已儲存的期間不會重複下載；中斷後重新執行只會下載尚未完成的期間。
+請求經由共用的數據獲取器送出，因此受每個主機的速率限制約束。
+
+使用方式:
+    python -m knowledge_base.tools.backfill 2330 2317 6488 --start 2021-01-01
+    python -m knowledge_base.tools.backfill --file watchlist.txt --years 5
+"""
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from typing import Optional, List, Dict, Any, Callable
+
+from .history_store import to_date
+from .twse_data import TWSEDataFetcher, get_shared_fetcher
+
+
+def backfill(stock_ids: List[str], start: Any, end: Optional[Any] = None,
+             fetcher: Optional[TWSEDataFetcher] = None, workers: int = 2,
+             progress: Optional[Callable[[str], None]] = print) -> List[Dict[str, Any]]:
+    """
+    回補多檔股票 start ~ end 的日 K 線至本地資料庫
+
+    每檔股票的缺少期間由數據獲取器並行下載；workers 檔股票同時進行，
+    讓上市與上櫃的請求可同時使用各自主機的請求額度
+
+    Args:
+        stock_ids: 股票代碼清單
+        start: 起始日期 (date、datetime 或 'YYYY-MM-DD')
+        end: 結束日期，預設為今天
+        fetcher: 數據獲取器，預設使用共用的獲取器
+        workers: 同時回補的股票數
+        progress: 進度輸出函數，None 表示不輸出
+
+    Returns:
+        每檔股票的結果: stock_id, market, fetched (下載期間數), skipped (已儲存而略過的期間數),
+        pending (下載失敗、下次執行會重試的期間數), bars, first, last, elapsed
+    """
+    fetcher = fetcher or get_shared_fetcher()
+    start_day = to_date(start)
+    end_day = to_date(end) if end is not None else datetime.now().date()
+    stock_ids = list(dict.fromkeys(stock_ids))
+    lock = threading.Lock()
+    done = [0]
+
+    def run(stock_id: str) -> Dict[str, Any]:
+        started = time.monotonic()
+        market, missing, total = fetcher.pending_periods(stock_id, start_day, end_day)
+        df = fetcher.get_stock_history(stock_id, start=start_day, end=end_day)
+        _, still_missing, _ = fetcher.pending_periods(stock_id, start_day, end_day)
+
+        result = {
+            'stock_id': stock_id,
+            'market': market,
+            'fetched': len(missing) - len(still_missing),
+            'skipped': total - len(missing),
+            'pending': len(still_missing),
+            'bars': len(df),
+            'first': df.index[0].date() if len(df) else None,
+            'last': df.index[-1].date() if len(df) else None,
+            'elapsed': time.monotonic() - started,
+        }
+        with lock:
+            done[0] += 1
+            if progress is not None:
+                progress(_format_result(result, done[0], len(stock_ids)))
+        return result
+
+    if len(stock_ids) <= 1 or workers <= 1:
+        return [run(stock_id) for stock_id in stock_ids]
+    with ThreadPoolExecutor(max_workers=min(workers, len(stock_ids))) as executor:
+        return list(executor.map(run, stock_ids))
+
+
+def _format_result(result: Dict[str, Any], index: int, total: int) -> str:
+    """格式化單檔股票的回補結果"""
+    line = (f"[{index}/{total}] {result['stock_id']} {result['market']}: "
+            f"下載 {result['fetched']} 個期間，略過 {result['skipped']} 個 (已儲存)，"
+            f"共 {result['bars']} 筆")
+    if result['bars']:
+        line += f" ({result['first']} ~ {result['last']})"
+    if result['pending']:
+        line += f"，{result['pending']} 個期間下載失敗 (重新執行會重試)"
+    return line + f"，{result['elapsed']:.1f}s"
+
+
+def _read_symbols(path: str) -> List[str]:
+    """讀取股票代碼檔案 (以空白、逗號或換行分隔，# 之後為註解)"""
+    symbols = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0]
+            symbols.extend(s for s in line.replace(',', ' ').split() if s)
+    return symbols
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description="回補股票歷史日 K 線至本地資料庫")
+    parser.add_argument('symbols', nargs='*', help="股票代碼，如 2330 6488")
+    parser.add_argument('--file', help="股票代碼檔案 (以空白、逗號或換行分隔)")
+    parser.add_argument('--start', help="起始日期 YYYY-MM-DD")
+    parser.add_argument('--end', help="結束日期 YYYY-MM-DD，預設為今天")
+    parser.add_argument('--years', type=float, default=5, help="未指定 --start 時回補的年數 (預設 5)")
+    parser.add_argument('--workers', type=int, default=2, help="同時回補的股票數 (預設 2)")
+    args = parser.parse_args(argv)
+
+    symbols = list(args.symbols)
+    if args.file:
+        symbols.extend(_read_symbols(args.file))
+    if not symbols:
+        parser.error("請提供股票代碼或 --file")
+
+    if args.start:
+        start = date.fromisoformat(args.start)
+    else:
+        today = datetime.now().date()
+        start = date.fromordinal(today.toordinal() - int(args.years * 365.25))
+
+    started = time.monotonic()
+    results = backfill(symbols, start, end=args.end, workers=args.workers)
+    pending = sum(r['pending'] for r in results)
+    print(f"完成 {len(results)} 檔股票，共 {sum(r['bars'] for r in results)} 筆，"
+          f"耗時 {time.monotonic() - started:.1f}s")
+    if pending:
+        print(f"⚠️ {pending} 個期間下載失敗，請重新執行以繼續回補")
+    return 1 if pending else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""本地交易所模擬伺服器 - 以錄製的 fixture 回應，並可注入延遲與錯誤
+
+以 replay 模組錄製的 fixture (或以 FixtureStore.put_json 產生的資料) 回應請求，
+讓抓取流程的吞吐量、快取與並行行為可在不連網的情況下重現與測量。
+
+請求路徑為 /{交易所主機}{原路徑}，數據獲取器設定 upstream (環境變數 STOCK_EXCHANGE_URL) 後
+會自動改寫請求，速率限制仍依原主機計算。
+
+使用方式:
+    python -m knowledge_base.tools.fixture_server --port 8765 --latency 0.2 --error-rate 0.05
+    STOCK_EXCHANGE_URL=http://127.0.0.1:8765 python main.py
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict
+
+from .replay import FixtureStore
+
+
+class FixtureServer:
+    """以 FixtureStore 回應的本地 HTTP 伺服器 (每個請求一個執行緒)"""
+
+    def __init__(self, store: Optional[FixtureStore] = None, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, stall_rate: float = 0.0, stall_seconds: float = 10.0,
+                 seed: Optional[int] = None):
+        """
+        初始化模擬伺服器
+
+        Args:
+            store: fixture 來源，預設使用 STOCK_FIXTURE_DIRECTORY
+            host: 監聽位址
+            port: 監聽埠，0 表示自動選擇
+            latency: 每個請求的固定延遲秒數
+            jitter: 額外的隨機延遲上限秒數 (0 ~ jitter 均勻分布)
+            error_rate: 回應 error_status 的機率 (0~1)
+            error_status: 注入錯誤時的狀態碼 (如 429、503)
+            stall_rate: 停滯 stall_seconds 秒才回應的機率 (模擬偶發的慢請求)
+            stall_seconds: 停滯秒數
+            seed: 隨機種子 (重現相同的延遲與錯誤序列)
+        """
+        self.store = store if store is not None else FixtureStore()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests: List[str] = []
+        self.counts: Dict[str, int] = {'ok': 0, 'errors': 0, 'stalls': 0, 'missing': 0}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """伺服器的基準 URL (作為數據獲取器的 upstream)"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FixtureServer":
+        """在背景執行緒啟動伺服器"""
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fixture-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """停止伺服器"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FixtureServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _draw(self):
+        """決定本次請求的延遲與是否注入錯誤/停滯"""
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            error = self._random.random() < self.error_rate
+            stall = not error and self._random.random() < self.stall_rate
+        return delay, error, stall
+
+    def _record(self, url: str, outcome: str) -> None:
+        with self._lock:
+            self.requests.append(url)
+            self.counts[outcome] += 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 標頭與內容合併送出並關閉 Nagle，避免延遲 ACK 額外增加約 40ms
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                # /{主機}{路徑}?{查詢} -> 原始 URL
+                url = 'https:/' + self.path
+                delay, error, stall = server._draw()
+                if stall:
+                    delay += server.stall_seconds
+                if delay > 0:
+                    time.sleep(delay)
+
+                if error:
+                    server._record(url, 'errors')
+                    return self._respond(server.error_status, b'', {})
+                entry = server.store.get(url)
+                if entry is None:
+                    server._record(url, 'missing')
+                    return self._respond(404, b'', {})
+                server._record(url, 'stalls' if stall else 'ok')
+                return self._respond(entry['status'], entry['content'], entry['headers'])
+
+            def _respond(self, status, content, headers):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description="以錄製的交易所回應提供本地模擬伺服器")
+    parser.add_argument('--dir', help="fixture 目錄，預設為 STOCK_FIXTURE_DIRECTORY")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="每個請求的固定延遲秒數")
+    parser.add_argument('--jitter', type=float, default=0.0, help="額外隨機延遲上限秒數")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="回應錯誤的機率 (0~1)")
+    parser.add_argument('--error-status', type=int, default=503, help="注入錯誤的狀態碼")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="停滯回應的機率 (0~1)")
+    parser.add_argument('--stall-seconds', type=float, default=10.0, help="停滯秒數")
+    parser.add_argument('--seed', type=int, help="隨機種子")
+    args = parser.parse_args(argv)
+
+    store = FixtureStore(args.dir)
+    server = FixtureServer(store, host=args.host, port=args.port, latency=args.latency,
+                           jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+                           stall_rate=args.stall_rate, stall_seconds=args.stall_seconds, seed=args.seed)
+    print(f"🧪 模擬伺服器 {server.url} ({len(store.keys())} 個 fixture，目錄 {store.directory})")
+    print(f"   設定 STOCK_EXCHANGE_URL={server.url} 讓數據獲取器改用此伺服器 (Ctrl+C 結束)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+    print(f"請求統計: {server.counts}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""歷史行情匯出 - 將本地日 K 線 (可含技術指標) 匯出為 Parquet 或 Arrow
+
+資料逐檔由本地資料庫讀取，累積約 batch_rows 列即輸出一個 RecordBatch (Parquet 的一個 row group)，
+全市場多年資料的匯出不需全部載入記憶體。pandas / Polars 可直接讀取 Parquet 或 Arrow 資料，
+不需再解析工具的文字輸出。
+
+需要選用套件 pyarrow (pip install pyarrow)。
+
+使用方式:
+    python -m knowledge_base.tools.history_export market.parquet --start 2021-01-01 --indicators
+    python -m knowledge_base.tools.history_export exports/ 2330 6488 --per-symbol
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+from typing import Optional, List, Dict, Any, Iterator, Callable
+
+import numpy as np
+import pandas as pd
+
+from .history_store import HistoryStore, to_date
+from .indicator_engine import IndicatorEngine
+
+
+# 每個 RecordBatch (row group) 的列數: 約 100 檔股票 × 5 年日 K
+DEFAULT_BATCH_ROWS = 125_000
+
+# 匯出的識別欄位 (其餘欄位皆為 float64)
+KEY_COLUMNS = ['stock_id', 'market', 'date']
+
+# 計算技術指標時，起始日期之前額外讀取的 K 線數 (MA60 加上 EMA 暖身期，同 TWSEDataFetcher.INDICATOR_BARS)
+INDICATOR_WARMUP_BARS = 60 + IndicatorEngine.WARMUP_BARS
+# 換算為日曆天數 (每週 5 個交易日，另加兩週的休市日)
+INDICATOR_WARMUP_DAYS = INDICATOR_WARMUP_BARS * 7 // 5 + 14
+
+
+def _require_pyarrow():
+    """匯入 pyarrow (選用套件)"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet/Arrow 匯出需要 pyarrow，請執行: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def iter_frames(store: HistoryStore, stock_ids: Optional[List[str]] = None, start: Optional[Any] = None,
+                end: Optional[Any] = None, indicators: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                batch_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    逐批產生長格式 (stock_id, market, date, 價量欄位...) 的 DataFrame
+
+    Args:
+        store: 本地歷史資料庫
+        stock_ids: 股票代碼，預設為所有已儲存的股票
+        start: 起始日期 (含)
+        end: 結束日期 (含)
+        indicators: 技術指標計算函數 (如 TWSEDataFetcher.calculate_technical_indicators)，
+            指定起始日期時會多讀取暖身期的資料再截掉
+        batch_rows: 每批的列數 (約略值，同一檔股票不會拆開)
+
+    Yields:
+        約 batch_rows 列的 DataFrame，數值欄位皆為 float64
+    """
+    batch_rows = batch_rows or DEFAULT_BATCH_ROWS
+    start_day = to_date(start) if start is not None else None
+    end_day = to_date(end) if end is not None else None
+    load_start = start_day
+    if indicators is not None and start_day is not None:
+        load_start = start_day - timedelta(days=INDICATOR_WARMUP_DAYS)
+
+    pending: List[pd.DataFrame] = []
+    rows = 0
+    for stock_id, market, bars in store.iter_bars(stock_ids, start=load_start, end=end_day):
+        if indicators is not None:
+            bars = indicators(bars)
+            if start_day is not None:
+                bars = bars.loc[pd.Timestamp(start_day):]
+        if bars.empty:
+            continue
+
+        frame = bars.reset_index()
+        frame.insert(0, 'stock_id', stock_id)
+        frame.insert(1, 'market', market)
+        pending.append(frame)
+        rows += len(frame)
+        if rows >= batch_rows:
+            yield _combine(pending)
+            pending, rows = [], 0
+
+    if pending:
+        yield _combine(pending)
+
+
+def _combine(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """合併同一批的 DataFrame，數值欄位統一為 float64 (指標欄位可能為 None)"""
+    df = pd.concat(frames, ignore_index=True)
+    for col in df.columns:
+        if col not in KEY_COLUMNS and df[col].dtype != np.float64:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float64)
+    return df
+
+
+def arrow_schema(indicators: bool = False):
+    """
+    匯出的 Arrow schema
+
+    識別欄位之後為價量欄位 (HistoryStore.COLUMNS)，indicators 為 True 時再加上技術指標欄位
+    (IndicatorEngine.COLUMNS)，數值欄位皆為 float64。K 線不足 20 根的股票沒有技術指標，
+    這些欄位為 null，所有批次的欄位因此一致
+    """
+    pa, _ = _require_pyarrow()
+    columns = HistoryStore.COLUMNS + (IndicatorEngine.COLUMNS if indicators else [])
+    return pa.schema([('stock_id', pa.string()), ('market', pa.string()), ('date', pa.timestamp('ns'))]
+                     + [(col, pa.float64()) for col in columns])
+
+
+def iter_record_batches(store: HistoryStore, stock_ids: Optional[List[str]] = None, start: Optional[Any] = None,
+                        end: Optional[Any] = None,
+                        indicators: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                        batch_rows: Optional[int] = None):
+    """
+    逐批產生 pyarrow.RecordBatch (參數同 iter_frames)
+
+    所有批次使用 arrow_schema(indicators is not None)
+    """
+    pa, _ = _require_pyarrow()
+    schema = arrow_schema(indicators is not None)
+    for frame in iter_frames(store, stock_ids, start, end, indicators, batch_rows):
+        frame = frame.reindex(columns=schema.names)
+        # 經由 Table 轉換: pandas 的字串欄位可能以多個 Arrow chunk 儲存，合併後每批恰為一個 RecordBatch
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False).combine_chunks()
+        yield from table.to_batches()
+
+
+def record_batch_reader(store: HistoryStore, stock_ids: Optional[List[str]] = None, start: Optional[Any] = None,
+                        end: Optional[Any] = None,
+                        indicators: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                        batch_rows: Optional[int] = None):
+    """
+    以 pyarrow.RecordBatchReader 串流輸出 (參數同 iter_frames)
+
+    可直接交給 pyarrow / Polars 使用，例如 reader.read_all() 或 polars.from_arrow(reader.read_all())
+    """
+    pa, _ = _require_pyarrow()
+    batches = iter_record_batches(store, stock_ids, start, end, indicators, batch_rows)
+    return pa.RecordBatchReader.from_batches(arrow_schema(indicators is not None), batches)
+
+
+def export_parquet(store: HistoryStore, path: str, stock_ids: Optional[List[str]] = None,
+                   start: Optional[Any] = None, end: Optional[Any] = None,
+                   indicators: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                   batch_rows: Optional[int] = None, compression: str = 'zstd') -> Dict[str, Any]:
+    """
+    匯出為 Parquet 檔案 (每批一個 row group；先寫入暫存檔，完成後才替換目標檔案)
+
+    Args:
+        store: 本地歷史資料庫
+        path: 輸出檔案路徑
+        stock_ids, start, end, indicators, batch_rows: 同 iter_frames
+        compression: Parquet 壓縮方式
+
+    Returns:
+        path, rows (列數), symbols (股票數), row_groups, bytes (檔案大小)
+    """
+    _, pq = _require_pyarrow()
+    reader = record_batch_reader(store, stock_ids, start, end, indicators, batch_rows)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    rows = row_groups = 0
+    symbols = set()
+    with pq.ParquetWriter(tmp_path, reader.schema, compression=compression) as writer:
+        for batch in reader:
+            writer.write_batch(batch, row_group_size=max(batch.num_rows, 1))
+            rows += batch.num_rows
+            row_groups += 1
+            symbols.update(batch.column(0).unique().to_pylist())
+    os.replace(tmp_path, path)
+    return {'path': path, 'rows': rows, 'symbols': len(symbols), 'row_groups': row_groups,
+            'bytes': os.path.getsize(path)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description="匯出本地歷史日 K 線為 Parquet")
+    parser.add_argument('output', help="輸出檔案 (或 --per-symbol 時的輸出目錄)")
+    parser.add_argument('symbols', nargs='*', help="股票代碼，預設為所有已儲存的股票")
+    parser.add_argument('--start', help="起始日期 YYYY-MM-DD")
+    parser.add_argument('--end', help="結束日期 YYYY-MM-DD")
+    parser.add_argument('--market', choices=['TWSE', 'TPEX'], help="只匯出某市場")
+    parser.add_argument('--indicators', action='store_true', help="一併匯出技術指標")
+    parser.add_argument('--per-symbol', action='store_true', help="每檔股票輸出一個檔案")
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS, help="每個 row group 的列數")
+    args = parser.parse_args(argv)
+
+    try:
+        _require_pyarrow()
+    except ImportError as e:
+        print(f"❌ {e}")
+        return 1
+
+    store = HistoryStore()
+    stock_ids = args.symbols or store.stock_ids(args.market)
+    indicators = None
+    if args.indicators:
+        from .twse_data import get_shared_fetcher
+        indicators = get_shared_fetcher().calculate_technical_indicators
+
+    started = time.monotonic()
+    if args.per_symbol:
+        results = [export_parquet(store, os.path.join(args.output, f"{stock_id}.parquet"), [stock_id],
+                                  args.start, args.end, indicators, args.batch_rows)
+                   for stock_id in stock_ids]
+        for r in results:
+            if not r['rows']:
+                os.remove(r['path'])
+        results = [r for r in results if r['rows']]
+    else:
+        results = [export_parquet(store, args.output, stock_ids, args.start, args.end, indicators,
+                                  args.batch_rows)]
+
+    rows = sum(r['rows'] for r in results)
+    size = sum(r['bytes'] for r in results)
+    print(f"✅ 已匯出 {len(stock_ids)} 檔股票，共 {rows:,} 筆 ({size / 1e6:.1f} MB，{len(results)} 個檔案)，"
+          f"耗時 {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
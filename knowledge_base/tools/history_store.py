@@ -0,0 +1,377 @@
+"""本地歷史行情儲存模組 - 使用 SQLite 儲存日 K 線資料
+
+已收盤的月份/交易日資料不會再變動，因此只需下載一次。
+之後的查詢只需補抓最後一次儲存之後缺少的資料，其餘直接由本地讀取。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, date
+from typing import Optional, List, Iterator, Tuple, Callable, Dict, Any
+
+import numpy as np
+import pandas as pd
+
+
+# 本地股票資料目錄
+DEFAULT_STOCK_DATA_DIRECTORY = "./knowledge_base/data/stock"
+
+
+def get_stock_data_directory() -> str:
+    """取得本地股票資料目錄 (可用環境變數 STOCK_DATA_DIRECTORY 設定)"""
+    return os.getenv("STOCK_DATA_DIRECTORY", DEFAULT_STOCK_DATA_DIRECTORY)
+
+
+def roc_to_datetime(values) -> pd.DatetimeIndex:
+    """
+    民國年日期字串轉 datetime64: 115/02/06 -> 2026-02-06
+
+    每個不重複的日期只轉換一次 (多檔股票的資料共用相同交易日)，
+    再由 NumPy 一次解析為 datetime64
+
+    Args:
+        values: 民國年日期字串序列
+
+    Returns:
+        名稱為 'date' 的 DatetimeIndex，無法解析的日期為 NaT
+    """
+    codes, uniques = pd.factorize(pd.Index(values, dtype=object))
+    iso = []
+    for value in uniques:
+        try:
+            year, month, day = str(value).strip().split('/')
+            iso.append(f"{int(year) + 1911:04d}-{int(month):02d}-{int(day):02d}")
+        except ValueError:
+            iso.append('NaT')
+    try:
+        parsed = np.array(iso, dtype='datetime64[ns]')
+    except ValueError:
+        # 格式正確但日期不存在 (如 2 月 30 日)
+        parsed = pd.to_datetime(pd.Index(iso), errors='coerce').to_numpy()
+    dates = parsed[codes] if len(parsed) else np.array([], dtype='datetime64[ns]')
+    # 缺值 (codes == -1) 為 NaT
+    dates[codes < 0] = np.datetime64('NaT')
+    return pd.DatetimeIndex(dates, name='date')
+
+
+def to_date(value) -> date:
+    """轉換為 date (支援 date、datetime、pandas Timestamp 與 'YYYY-MM-DD' 字串)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def to_datetime_index(values) -> pd.DatetimeIndex:
+    """日期序列轉 DatetimeIndex: 已是 datetime64 者直接使用，字串視為民國年日期"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.DatetimeIndex(values, name='date')
+    return roc_to_datetime(values)
+
+
+class HistoryStore:
+    """本地歷史 K 線資料庫
+
+    - daily_bars: 以 (stock_id, trade_date) 為主鍵的日 K 線資料
+    - fetch_log: 記錄每個市場/股票已下載過的期間 (月份或交易日)，
+      以及下載時該期間是否已完整 (已收盤的期間不需再次下載)
+    - indicator_state: 每檔股票串流技術指標引擎的狀態 (JSON)，新增 K 線時接續更新
+    """
+
+    # 回傳 DataFrame 的欄位 (與 TWSE STOCK_DAY 清洗後的欄位一致，日期為索引)
+    COLUMNS = ['volume', 'value', 'open', 'high', 'low', 'close', 'change', 'transaction']
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化歷史資料庫
+
+        Args:
+            db_path: SQLite 檔案路徑，預設為 {STOCK_DATA_DIRECTORY}/history.db
+        """
+        if db_path is None:
+            db_path = os.path.join(get_stock_data_directory(), 'history.db')
+
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        """建立資料表"""
+        with self._lock:
+            if self.db_path != ':memory:':
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS daily_bars (
+                    stock_id TEXT NOT NULL,
+                    trade_date TEXT NOT NULL,
+                    market TEXT NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    change REAL,
+                    volume REAL,
+                    value REAL,
+                    transactions REAL,
+                    PRIMARY KEY (stock_id, trade_date)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS fetch_log (
+                    market TEXT NOT NULL,
+                    stock_id TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    complete INTEGER NOT NULL,
+                    PRIMARY KEY (market, stock_id, period)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    stock_id TEXT PRIMARY KEY,
+                    last_date TEXT,
+                    last_close REAL,
+                    updated_at TEXT NOT NULL,
+                    state TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self._conn.commit()
+
+    def upsert_bars(self, stock_id: str, market: str, df: pd.DataFrame) -> int:
+        """
+        寫入 (或覆蓋) 日 K 線資料
+
+        Args:
+            stock_id: 股票代碼
+            market: 'TWSE' 或 'TPEX'
+            df: 已清洗的 DataFrame，date 欄位為 datetime64 (或民國年字串)
+
+        Returns:
+            寫入筆數
+        """
+        if df.empty:
+            return 0
+
+        dates = to_datetime_index(df['date'])
+        valid = ~dates.isna()
+        if not valid.all():
+            df, dates = df[valid], dates[valid]
+
+        def col(name):
+            if name in df.columns:
+                return [None if pd.isna(v) else float(v) for v in df[name]]
+            return [None] * len(df)
+
+        trade_dates = dates.strftime('%Y-%m-%d').tolist()
+        rows = list(zip(
+            [stock_id] * len(df), trade_dates, [market] * len(df),
+            col('open'), col('high'), col('low'), col('close'), col('change'),
+            col('volume'), col('value'), col('transaction'),
+        ))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO daily_bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def load_bars(self, stock_id: str, start: Optional[date] = None,
+                  end: Optional[date] = None) -> pd.DataFrame:
+        """
+        讀取日 K 線資料
+
+        Args:
+            stock_id: 股票代碼
+            start: 起始日期 (含)
+            end: 結束日期 (含)
+
+        Returns:
+            以交易日 (DatetimeIndex，名稱為 'date') 為索引、依日期排序的 DataFrame，欄位同 COLUMNS
+        """
+        query = ("SELECT trade_date, volume, value, open, high, low, close, change, transactions "
+                 "FROM daily_bars WHERE stock_id = ?")
+        params: List[str] = [stock_id]
+        if start is not None:
+            query += " AND trade_date >= ?"
+            params.append(start.isoformat())
+        if end is not None:
+            query += " AND trade_date <= ?"
+            params.append(end.isoformat())
+        query += " ORDER BY trade_date"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        if not rows:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(rows, columns=['date'] + self.COLUMNS)
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('date'), format='%Y-%m-%d'), name='date')
+        return df
+
+    def stock_ids(self, market: Optional[str] = None) -> List[str]:
+        """取得本地已儲存資料的股票代碼 (可限定市場)"""
+        query = "SELECT DISTINCT stock_id FROM daily_bars"
+        params: List[str] = []
+        if market is not None:
+            query += " WHERE market = ?"
+            params.append(market)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY stock_id", params).fetchall()
+        return [row[0] for row in rows]
+
+    def iter_bars(self, stock_ids: Optional[List[str]] = None, start: Optional[date] = None,
+                  end: Optional[date] = None) -> Iterator[Tuple[str, str, pd.DataFrame]]:
+        """
+        逐檔讀取日 K 線 (一次只載入一檔股票，適合全市場匯出)
+
+        Args:
+            stock_ids: 股票代碼，預設為所有已儲存的股票
+            start: 起始日期 (含)
+            end: 結束日期 (含)
+
+        Yields:
+            (股票代碼, 市場, DataFrame)；DataFrame 格式同 load_bars，沒有資料的股票略過
+        """
+        for stock_id in (stock_ids if stock_ids is not None else self.stock_ids()):
+            df = self.load_bars(stock_id, start=start, end=end)
+            if df.empty:
+                continue
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT market FROM daily_bars WHERE stock_id = ? LIMIT 1", (stock_id,)
+                ).fetchone()
+            yield stock_id, row[0], df
+
+    def to_arrow(self, stock_ids: Optional[List[str]] = None, start: Optional[date] = None,
+                 end: Optional[date] = None, indicators: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                 batch_rows: Optional[int] = None):
+        """
+        以 Arrow RecordBatchReader 串流輸出日 K 線 (需要 pyarrow)
+
+        參數同 history_export.iter_record_batches；pyarrow / Polars 可直接讀取而不需轉換
+        """
+        from .history_export import record_batch_reader
+        return record_batch_reader(self, stock_ids=stock_ids, start=start, end=end,
+                                   indicators=indicators, batch_rows=batch_rows)
+
+    def export_parquet(self, path: str, stock_ids: Optional[List[str]] = None, start: Optional[date] = None,
+                       end: Optional[date] = None,
+                       indicators: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                       batch_rows: Optional[int] = None, compression: str = 'zstd') -> Dict[str, Any]:
+        """
+        匯出日 K 線 (可含技術指標) 為 Parquet 檔案 (需要 pyarrow)
+
+        參數同 history_export.export_parquet；每批資料寫入一個 row group，不需將全部資料載入記憶體
+        """
+        from .history_export import export_parquet
+        return export_parquet(self, path, stock_ids=stock_ids, start=start, end=end,
+                              indicators=indicators, batch_rows=batch_rows, compression=compression)
+
+    def last_date(self, stock_id: str) -> Optional[date]:
+        """取得某股票最後一筆儲存資料的日期"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(trade_date) FROM daily_bars WHERE stock_id = ?", (stock_id,)
+            ).fetchone()
+        if row and row[0]:
+            return date.fromisoformat(row[0])
+        return None
+
+    def has_bar(self, stock_id: str, day: date) -> bool:
+        """檢查某股票某日是否已有資料"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM daily_bars WHERE stock_id = ? AND trade_date = ?", (stock_id, day.isoformat())
+            ).fetchone()
+        return row is not None
+
+    def period_status(self, market: str, stock_id: str, period: str) -> Optional[bool]:
+        """
+        取得某期間的下載狀態
+
+        Returns:
+            None: 尚未下載；False: 已下載但當時期間尚未結束；True: 已完整下載
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT complete FROM fetch_log WHERE market = ? AND stock_id = ? AND period = ?",
+                (market, stock_id, period)
+            ).fetchone()
+        return None if row is None else bool(row[0])
+
+    def is_period_complete(self, market: str, stock_id: str, period: str) -> bool:
+        """檢查某期間是否已完整下載 (已收盤的期間)"""
+        return bool(self.period_status(market, stock_id, period))
+
+    def mark_period_fetched(self, market: str, stock_id: str, period: str, complete: bool) -> None:
+        """
+        記錄某期間已下載
+
+        Args:
+            market: 'TWSE' 或 'TPEX'
+            stock_id: 股票代碼
+            period: 期間，月份 (YYYY-MM) 或交易日 (YYYY-MM-DD)
+            complete: 下載時該期間是否已結束 (之後不會再有新資料)
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fetch_log VALUES (?, ?, ?, ?, ?)",
+                (market, stock_id, period, datetime.now().isoformat(timespec='seconds'), int(complete))
+            )
+            self._conn.commit()
+
+    def load_indicator_state(self, stock_id: str) -> Optional[Dict[str, Any]]:
+        """
+        讀取串流技術指標狀態
+
+        狀態記錄的最後一根 K 線已被覆寫 (例如盤中資料改為收盤資料) 時視為失效
+
+        Returns:
+            IndicatorEngine.to_dict 的結果，沒有 (或已失效) 時回傳 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT s.last_date, s.last_close, s.state, b.close FROM indicator_state s "
+                "LEFT JOIN daily_bars b ON b.stock_id = s.stock_id AND b.trade_date = s.last_date "
+                "WHERE s.stock_id = ?", (stock_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        last_date, last_close, state, close = row
+        if last_date is not None and close != last_close:
+            return None
+        return json.loads(state)
+
+    def save_indicator_state(self, stock_id: str, state: Dict[str, Any],
+                             last_close: Optional[float] = None) -> None:
+        """
+        儲存串流技術指標狀態
+
+        Args:
+            stock_id: 股票代碼
+            state: IndicatorEngine.to_dict 的結果
+            last_close: 狀態最後一根 K 線的收盤價 (讀取時用於檢查資料是否被覆寫)
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO indicator_state VALUES (?, ?, ?, ?, ?)",
+                (stock_id, state.get('last_date'), last_close,
+                 datetime.now().isoformat(timespec='seconds'), json.dumps(state))
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        """關閉資料庫連線"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,348 @@
+"""HTTP 回應快取模組 - 依交易所端點決定快取期限
+
+- 過去月份 (STOCK_DAY、FMTQIK) 與過去交易日 (dailyQuotes、otc_idx_daily) 的資料不會再變動，永久快取
+- 當日/當月資料在交易時段使用短期快取，收盤後使用長期快取 (直到下一個交易時段)
+- 快取過期且伺服器提供 ETag / Last-Modified 時，以條件式請求確認是否需重新下載
+- 交易所以 HTTP 200 回傳的錯誤或限流內容 (stat 不是 OK、沒有 tables、HTML 頁面) 不會被快取
+- 記憶體層為 LRU (位元組上限由環境變數 STOCK_HTTP_CACHE_MB 設定，預設 32 MB)；
+  SQLite 中過期已久的非永久項目於開啟與寫入時清除
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, date
+from typing import Optional, Dict, Any, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .history_store import get_stock_data_directory
+from .single_flight import CacheStats
+
+
+# 永久快取
+FOREVER = float('inf')
+
+
+def get_http_cache_bytes() -> int:
+    """取得記憶體快取的位元組上限 (環境變數 STOCK_HTTP_CACHE_MB，預設 32)"""
+    return int(float(os.getenv("STOCK_HTTP_CACHE_MB", "32")) * (1 << 20))
+
+
+class EndpointCachePolicy:
+    """交易所端點快取策略
+
+    交易時段 (含收盤後資料公布前) 的當日資料使用 live_ttl，
+    其餘時間的當日資料快取到下一個交易時段開始
+    """
+
+    # 交易時段開始 (盤前) 與收盤資料公布完成時間
+    SESSION_START = (8, 30)
+    DATA_READY = (15, 0)
+
+    def __init__(self, live_ttl: float = 60):
+        """
+        Args:
+            live_ttl: 交易時段內當日資料的快取秒數
+        """
+        self.live_ttl = live_ttl
+
+    def ttl(self, url: str, now: Optional[datetime] = None) -> Optional[float]:
+        """
+        計算某 URL 回應的快取秒數
+
+        Args:
+            url: 完整請求 URL (含查詢參數)
+            now: 目前時間
+
+        Returns:
+            快取秒數，FOREVER 表示永久快取，None 表示不快取
+        """
+        now = now or datetime.now()
+        parts = urlsplit(url)
+        path = parts.path
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+
+        if path.endswith('/STOCK_DAY') or path.endswith('/FMTQIK'):
+            # date=YYYYMMDD，以月份為單位；FMTQIK 未指定日期時為當月
+            date_str = query.get('date')
+            if date_str and len(date_str) >= 6:
+                month = (int(date_str[:4]), int(date_str[4:6]))
+                if month < (now.year, now.month):
+                    return FOREVER
+            return self._live_ttl(now)
+
+        if path.endswith('/dailyQuotes') or path.endswith('/idx_result.php'):
+            # 民國年日期 115/02/06
+            day = self._parse_roc_date(query.get('date') or query.get('d'))
+            if day is not None and day < now.date():
+                return FOREVER
+            return self._live_ttl(now)
+
+        if path.endswith('/tpex_mainboard_quotes') or path.endswith('/STOCK_DAY_ALL'):
+            return self._live_ttl(now)
+
+        return None
+
+    def validate(self, url: str, response: requests.Response) -> bool:
+        """
+        檢查回應內容是否為有效資料 (可寫入快取)
+
+        交易所的錯誤與限流回應同樣是 HTTP 200，需依端點檢查內容:
+        STOCK_DAY / FMTQIK 需 stat 為 OK，dailyQuotes 需有 tables，
+        otc_idx_daily 需有 aaData，OpenAPI 全市場行情需為非空的列表
+
+        Args:
+            url: 完整請求 URL
+            response: 狀態碼 200 的回應
+
+        Returns:
+            True 表示可快取
+        """
+        try:
+            data = response.json()
+        except ValueError:
+            return False
+
+        path = urlsplit(url).path
+        if path.endswith('/STOCK_DAY') or path.endswith('/FMTQIK'):
+            return isinstance(data, dict) and data.get('stat') == 'OK'
+        if path.endswith('/dailyQuotes'):
+            return isinstance(data, dict) and bool(data.get('tables'))
+        if path.endswith('/idx_result.php'):
+            return isinstance(data, dict) and bool(data.get('aaData'))
+        if path.endswith('/tpex_mainboard_quotes') or path.endswith('/STOCK_DAY_ALL'):
+            return isinstance(data, list) and len(data) > 0
+        return True
+
+    def _live_ttl(self, now: datetime) -> float:
+        """當日資料的快取秒數"""
+        start = now.replace(hour=self.SESSION_START[0], minute=self.SESSION_START[1], second=0, microsecond=0)
+        ready = now.replace(hour=self.DATA_READY[0], minute=self.DATA_READY[1], second=0, microsecond=0)
+
+        if now.weekday() < 5 and start <= now < ready:
+            return self.live_ttl
+
+        # 收盤後 (或非交易日): 快取到下一個交易時段開始
+        next_start = start if now < start else start + timedelta(days=1)
+        while next_start.weekday() >= 5:
+            next_start += timedelta(days=1)
+        return max((next_start - now).total_seconds(), self.live_ttl)
+
+    @staticmethod
+    def _parse_roc_date(value: Optional[str]) -> Optional[date]:
+        """解析民國年日期 115/02/06"""
+        if not value:
+            return None
+        try:
+            year, month, day = value.split('/')
+            return date(int(year) + 1911, int(month), int(day))
+        except ValueError:
+            return None
+
+
+class ResponseCache:
+    """HTTP 回應快取 (記憶體 LRU + SQLite)
+
+    過期項目仍保留 stale_retention 秒，供條件式請求與端點無法連線時的備援使用
+    """
+
+    # 清除過期項目的最短間隔 (秒)
+    PRUNE_INTERVAL = 3600
+
+    def __init__(self, db_path: Optional[str] = None, max_bytes: Optional[int] = None,
+                 stale_retention: float = 7 * 24 * 3600):
+        """
+        Args:
+            db_path: SQLite 檔案路徑，預設為 {STOCK_DATA_DIRECTORY}/http_cache.db
+            max_bytes: 記憶體快取的位元組上限，預設為 STOCK_HTTP_CACHE_MB
+            stale_retention: 非永久項目過期後保留的秒數
+        """
+        if db_path is None:
+            db_path = os.path.join(get_stock_data_directory(), 'http_cache.db')
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self._max_bytes = max_bytes
+        self.stale_retention = stale_retention
+        self.nbytes = 0
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        # url -> (項目, 位元組數)
+        self._memory: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    url TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    encoding TEXT,
+                    content BLOB NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            self._prune()
+            self._conn.commit()
+
+    @property
+    def max_bytes(self) -> int:
+        """記憶體快取的位元組上限 (未指定時於使用時讀取 STOCK_HTTP_CACHE_MB)"""
+        return self._max_bytes if self._max_bytes is not None else get_http_cache_bytes()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """取得快取項目 (可能已過期)，expires_at 為 None 表示永久有效"""
+        with self._lock:
+            cached = self._memory.get(url)
+            if cached is not None:
+                self._memory.move_to_end(url)
+                return cached[0]
+            row = self._conn.execute(
+                "SELECT status, headers, encoding, content, expires_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = {
+                'status': row[0], 'headers': json.loads(row[1]), 'encoding': row[2],
+                'content': row[3], 'expires_at': row[4],
+            }
+            self._remember(url, entry)
+            return entry
+
+    def put(self, url: str, response: requests.Response, ttl: float) -> None:
+        """寫入快取"""
+        headers = {k: v for k, v in response.headers.items()
+                   if k.lower() in ('content-type', 'etag', 'last-modified')}
+        entry = {
+            'status': response.status_code, 'headers': headers, 'encoding': response.encoding,
+            'content': response.content,
+            'expires_at': None if ttl == FOREVER else time.time() + ttl,
+        }
+        with self._lock:
+            self._remember(url, entry)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (url, entry['status'], json.dumps(headers), entry['encoding'], entry['content'], entry['expires_at'])
+            )
+            if time.time() - self._last_prune >= self.PRUNE_INTERVAL:
+                self._prune()
+            self._conn.commit()
+
+    def refresh(self, url: str, ttl: float) -> None:
+        """延長快取期限 (條件式請求回應 304 時)"""
+        expires_at = None if ttl == FOREVER else time.time() + ttl
+        with self._lock:
+            cached = self._memory.get(url)
+            if cached is not None:
+                cached[0]['expires_at'] = expires_at
+            self._conn.execute("UPDATE responses SET expires_at = ? WHERE url = ?", (expires_at, url))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def _remember(self, url: str, entry: Dict[str, Any]) -> None:
+        """將項目放入記憶體 LRU，超過位元組上限時淘汰最久未使用的項目 (需持有 _lock)"""
+        size = len(entry['content']) + len(url)
+        old = self._memory.pop(url, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        max_bytes = self.max_bytes
+        if size > max_bytes:
+            return
+        self._memory[url] = (entry, size)
+        self.nbytes += size
+        while self.nbytes > max_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self.nbytes -= evicted
+
+    def _prune(self) -> None:
+        """刪除過期超過 stale_retention 的非永久項目 (需持有 _lock，由呼叫端 commit)"""
+        now = time.time()
+        self._conn.execute(
+            "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (now - self.stale_retention,)
+        )
+        self._last_prune = now
+
+
+class CachedSession(requests.Session):
+    """具備交易所端點快取策略的 requests.Session
+
+    只快取 GET、狀態碼 200 且內容通過端點檢查 (EndpointCachePolicy.validate) 的回應；
+    其他請求照常送出
+    """
+
+    def __init__(self, cache: Optional[ResponseCache] = None,
+                 policy: Optional[EndpointCachePolicy] = None):
+        super().__init__()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.policy = policy if policy is not None else EndpointCachePolicy()
+        self.cache_stats = CacheStats()
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        if method.upper() != 'GET':
+            return super().request(method, url, params=params, headers=headers, **kwargs)
+
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        ttl = self.policy.ttl(full_url)
+        if ttl is None:
+            return super().request(method, url, params=params, headers=headers, **kwargs)
+
+        entry = self.cache.get(full_url)
+        if entry is not None and (entry['expires_at'] is None or entry['expires_at'] > time.time()):
+            self.cache_stats.record_hit()
+            return self._build_response(full_url, entry)
+
+        # 過期項目: 使用條件式請求
+        request_headers = dict(headers or {})
+        if entry is not None:
+            cached_headers = CaseInsensitiveDict(entry['headers'])
+            if cached_headers.get('ETag'):
+                request_headers['If-None-Match'] = cached_headers['ETag']
+            if cached_headers.get('Last-Modified'):
+                request_headers['If-Modified-Since'] = cached_headers['Last-Modified']
+
+        self.cache_stats.record_miss()
+        response = super().request(method, url, params=params, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.refresh(full_url, ttl)
+            return self._build_response(full_url, entry)
+
+        if response.status_code == 200 and self.policy.validate(full_url, response):
+            self.cache.put(full_url, response, ttl)
+        return response
+
+    def get_stale(self, url: str, params: Optional[Dict[str, Any]] = None) -> Optional[requests.Response]:
+        """
+        取得快取的回應 (不論是否過期)，用於端點無法連線時的備援
+
+        Returns:
+            response.stale 為 True 的 Response，沒有快取時回傳 None
+        """
+        full_url = requests.Request('GET', url, params=params).prepare().url
+        entry = self.cache.get(full_url)
+        if entry is None:
+            return None
+        self.cache_stats.record_hit()
+        response = self._build_response(full_url, entry)
+        response.stale = True
+        return response
+
+    @staticmethod
+    def _build_response(url: str, entry: Dict[str, Any]) -> requests.Response:
+        """由快取項目建立 Response"""
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = entry['encoding']
+        response._content = entry['content']
+        response.url = url
+        response.from_cache = True
+        return response
@@ -0,0 +1,158 @@
+"""技術指標計算結果快取 - 以 (股票代碼, 最後一根 K 線, 指標參數) 為鍵的 LRU 快取
+
+同一輪對話中，技術分析圖表、交易訊號、走勢預測與 analyze_stock 會對同一檔股票的
+同一段 K 線重複計算技術指標；之後追問同一檔股票時也是如此。
+計算結果 (DataFrame 或陣列) 依鍵保存在記憶體，超過位元組上限時淘汰最久未使用的項目。
+
+位元組上限由環境變數 STOCK_INDICATOR_CACHE_MB 設定 (預設 64 MB)。
+"""
+
+import os
+import sys
+import threading
+import types
+from collections import OrderedDict, deque
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .single_flight import CacheStats
+
+
+def get_indicator_cache_bytes() -> int:
+    """取得快取的位元組上限 (環境變數 STOCK_INDICATOR_CACHE_MB，預設 64)"""
+    return int(float(os.getenv("STOCK_INDICATOR_CACHE_MB", "64")) * (1 << 20))
+
+
+def estimate_size(value: Any) -> int:
+    """
+    估計快取值佔用的位元組數
+
+    支援 DataFrame、NumPy 陣列及其 tuple/list/deque/dict 組合；其他物件 (如串流指標的
+    IndicatorEngine) 另加上屬性的大小，因此滾動視窗等緩衝區也計入。同一物件只計算一次
+    """
+    return _estimate_size(value, set())
+
+
+def _estimate_size(value: Any, seen: set) -> int:
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list, deque)):
+        return sys.getsizeof(value) + sum(_estimate_size(v, seen) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(v, seen) for v in value.values())
+    if hasattr(value, '__dict__') and not isinstance(value, (type, types.ModuleType, types.FunctionType,
+                                                             types.MethodType)):
+        return sys.getsizeof(value) + _estimate_size(vars(value), seen)
+    return sys.getsizeof(value)
+
+
+class IndicatorCache:
+    """技術指標結果的 LRU 快取 (執行緒安全，以位元組上限淘汰)"""
+
+    def __init__(self, max_bytes: Optional[int] = None, stats: Optional[CacheStats] = None):
+        """
+        初始化快取
+
+        Args:
+            max_bytes: 位元組上限，預設為 STOCK_INDICATOR_CACHE_MB
+            stats: 命中統計，預設建立新的統計
+        """
+        self._max_bytes = max_bytes
+        self.stats = stats or CacheStats()
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        # key -> (值, 位元組數)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+
+    @property
+    def max_bytes(self) -> int:
+        """位元組上限 (未指定時於使用時讀取 STOCK_INDICATOR_CACHE_MB)"""
+        return self._max_bytes if self._max_bytes is not None else get_indicator_cache_bytes()
+
+    @staticmethod
+    def key(stock_id: str, last_day: Any, last_close: float, params: Hashable = ()) -> Tuple[Any, ...]:
+        """
+        產生快取鍵
+
+        Args:
+            stock_id: 股票代碼
+            last_day: 最後一根 K 線的日期
+            last_close: 最後一根 K 線的收盤價 (盤中資料更新時鍵隨之改變)
+            params: 指標參數與資料範圍 (K 線數等會影響結果的設定)
+        """
+        return (stock_id, pd.Timestamp(last_day), float(last_close), params)
+
+    @classmethod
+    def frame_key(cls, stock_id: str, df: pd.DataFrame, params: Hashable = ()) -> Tuple[Any, ...]:
+        """由 K 線資料 (以日期為索引，不可為空) 產生快取鍵"""
+        return cls.key(stock_id, df.index[-1], df['close'].iloc[-1], params)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """取得快取值 (並記錄命中/未命中)，沒有時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            self.stats.record_miss()
+            return None
+        self.stats.record_hit()
+        return entry[0]
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """取得快取值，不影響 LRU 順序與統計"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        """
+        存入快取值，超過位元組上限時淘汰最久未使用的項目
+
+        Args:
+            key: 快取鍵
+            value: 計算結果
+            size: 位元組數，預設以 estimate_size 估計 (超過上限的值不快取)
+        """
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            max_bytes = self.max_bytes
+            if size > max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """取得快取值，沒有時計算並存入"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """清除所有項目"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
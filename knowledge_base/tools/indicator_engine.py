@@ -0,0 +1,363 @@
+"""串流技術指標引擎 - 每根新 K 線以 O(1) 更新 MA、RSI、MACD、KD 與布林通道
+
+每個指標保存自己的計算狀態 (滾動加總、EMA 值、單調佇列的最高/最低價)，
+新增一根 K 線只需更新狀態，不需重新計算整段歷史。狀態可序列化為 JSON，
+與本地歷史資料庫一併儲存 (HistoryStore.save_indicator_state)，程序重新啟動後接續更新。
+
+計算方式與 TWSEDataFetcher.calculate_technical_indicators (pandas rolling / ewm) 相同，
+包含 NaN、整段價格不變 (滾動平均取精確值) 等情況，結果在浮點誤差範圍內一致。
+價格不變的視窗標準差為精確的 0 (pandas 會留下約 1e-6 的開根號誤差)，布林通道因此可能差距約 1e-6。
+"""
+
+import math
+from collections import deque
+from datetime import date
+from typing import Optional, Dict, Any
+
+import numpy as np
+import pandas as pd
+
+
+def _divide(a: float, b: float) -> float:
+    """與 NumPy 相同的除法 (除以 0 時為 ±inf 或 NaN)"""
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+class RollingMean:
+    """滾動平均 (同 Series.rolling(period).mean()，視窗內有 NaN 時為 NaN)"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window: deque = deque()
+        self.total = 0.0
+        self.nobs = 0
+        self.negatives = 0
+        # 連續相同值的個數 (視窗內數值全部相同時回傳精確值，同 pandas)
+        self.last = math.nan
+        self.same = 0
+
+    def update(self, value: float) -> float:
+        if len(self.window) == self.period:
+            old = self.window.popleft()
+            if not math.isnan(old):
+                self.nobs -= 1
+                self.total -= old
+                self.negatives -= old < 0
+        self.window.append(value)
+        if not math.isnan(value):
+            self.nobs += 1
+            self.total += value
+            self.negatives += value < 0
+            self.same = self.same + 1 if value == self.last else 1
+            self.last = value
+        if self.nobs == 0:
+            self.total = 0.0
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if self.nobs < self.period:
+            return math.nan
+        if self.same >= self.nobs:
+            return self.last
+        result = self.total / self.nobs
+        return 0.0 if self.negatives == 0 and result < 0 else result
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = dict(vars(self))
+        state['window'] = list(self.window)
+        return state
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "RollingMean":
+        obj = cls.__new__(cls)
+        obj.__dict__.update(state)
+        obj.window = deque(state['window'])
+        return obj
+
+
+class RollingStd(RollingMean):
+    """滾動標準差 (同 Series.rolling(period).std()，Welford 法逐筆加入與移除)"""
+
+    def __init__(self, period: int, ddof: int = 1):
+        super().__init__(period)
+        self.ddof = ddof
+        self.mean = 0.0
+        self.ssqdm = 0.0
+
+    def update(self, value: float) -> float:
+        if len(self.window) == self.period:
+            old = self.window.popleft()
+            if not math.isnan(old):
+                self.nobs -= 1
+                if self.nobs:
+                    prev_mean = self.mean
+                    self.mean -= (old - prev_mean) / self.nobs
+                    self.ssqdm -= (old - prev_mean) * (old - self.mean)
+                else:
+                    self.mean = self.ssqdm = 0.0
+        self.window.append(value)
+        if not math.isnan(value):
+            self.nobs += 1
+            prev_mean = self.mean
+            self.mean += (value - prev_mean) / self.nobs
+            self.ssqdm += (value - prev_mean) * (value - self.mean)
+            self.same = self.same + 1 if value == self.last else 1
+            self.last = value
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if self.nobs < self.period or self.nobs <= self.ddof:
+            return math.nan
+        if self.nobs == 1 or self.same >= self.nobs:
+            return 0.0
+        return math.sqrt(max(self.ssqdm / (self.nobs - self.ddof), 0.0))
+
+
+class RollingExtreme:
+    """滾動最高或最低值 (同 rolling(period).max()/min()，以單調佇列維護)"""
+
+    def __init__(self, period: int, kind: str = 'max'):
+        self.period = period
+        self.kind = kind
+        self.count = 0
+        # (位置, 數值)，數值單調遞減 (max) 或遞增 (min)
+        self.candidates: deque = deque()
+        # 視窗內 NaN 的位置
+        self.missing: deque = deque()
+
+    def update(self, value: float) -> float:
+        position = self.count
+        self.count += 1
+        if math.isnan(value):
+            self.missing.append(position)
+        else:
+            dominated = (lambda v: v <= value) if self.kind == 'max' else (lambda v: v >= value)
+            while self.candidates and dominated(self.candidates[-1][1]):
+                self.candidates.pop()
+            self.candidates.append((position, value))
+
+        expired = position - self.period
+        while self.candidates and self.candidates[0][0] <= expired:
+            self.candidates.popleft()
+        while self.missing and self.missing[0] <= expired:
+            self.missing.popleft()
+        return self.value
+
+    @property
+    def value(self) -> float:
+        if self.count < self.period or self.missing or not self.candidates:
+            return math.nan
+        return self.candidates[0][1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'period': self.period, 'kind': self.kind, 'count': self.count,
+                'candidates': [list(c) for c in self.candidates], 'missing': list(self.missing)}
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "RollingExtreme":
+        obj = cls(state['period'], state['kind'])
+        obj.count = state['count']
+        obj.candidates = deque(tuple(c) for c in state['candidates'])
+        obj.missing = deque(state['missing'])
+        return obj
+
+
+class ExponentialMean:
+    """指數移動平均 (同 Series.ewm(alpha=alpha, adjust=False).mean())"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.weighted = math.nan
+        # 前值的權重 (遇到 NaN 時持續衰減，同 pandas 的 ignore_na=False)
+        self.old_weight = 1.0
+
+    def update(self, value: float) -> float:
+        observed = not math.isnan(value)
+        if not math.isnan(self.weighted):
+            self.old_weight *= 1 - self.alpha
+            if observed:
+                if self.weighted != value:
+                    self.weighted = ((self.old_weight * self.weighted + self.alpha * value)
+                                     / (self.old_weight + self.alpha))
+                self.old_weight = 1.0
+        elif observed:
+            self.weighted = value
+        return self.weighted
+
+    @property
+    def value(self) -> float:
+        return self.weighted
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "ExponentialMean":
+        obj = cls(state['alpha'])
+        obj.__dict__.update(state)
+        return obj
+
+
+class IndicatorEngine:
+    """單一股票的串流技術指標 (欄位與參數同 calculate_technical_indicators)"""
+
+    COLUMNS = ['MA5', 'MA10', 'MA20', 'MA60', 'RSI', 'MACD', 'MACD_Signal', 'MACD_Hist',
+               'K', 'D', 'BB_Upper', 'BB_Middle', 'BB_Lower']
+
+    # EMA 類指標的暖身 K 線數: 最慢的 EMA 為 MACD 慢線 (26) 再經訊號線 (9)
+    WARMUP_BARS = 26 + 9
+
+    # 序列化時各狀態的類別
+    _STATE_TYPES = {
+        'ma5': RollingMean, 'ma10': RollingMean, 'ma20': RollingMean, 'ma60': RollingMean,
+        'gain': RollingMean, 'loss': RollingMean,
+        'ema_fast': ExponentialMean, 'ema_slow': ExponentialMean, 'macd_signal': ExponentialMean,
+        'low_min': RollingExtreme, 'high_max': RollingExtreme, 'k': ExponentialMean, 'd': ExponentialMean,
+        'bb_std': RollingStd,
+    }
+
+    def __init__(self, rsi_period: int = 14, macd: tuple = (12, 26, 9), kd_period: int = 9,
+                 bb_period: int = 20, bb_std_dev: int = 2):
+        fast, slow, signal = macd
+        self.ma5, self.ma10, self.ma20, self.ma60 = (RollingMean(n) for n in (5, 10, 20, 60))
+        self.gain = RollingMean(rsi_period)
+        self.loss = RollingMean(rsi_period)
+        self.ema_fast = ExponentialMean(2 / (fast + 1))
+        self.ema_slow = ExponentialMean(2 / (slow + 1))
+        self.macd_signal = ExponentialMean(2 / (signal + 1))
+        self.low_min = RollingExtreme(kd_period, 'min')
+        self.high_max = RollingExtreme(kd_period, 'max')
+        self.k = ExponentialMean(1 / 3)
+        self.d = ExponentialMean(1 / 3)
+        self.bb_std = RollingStd(bb_period)
+        self.bb_period = bb_period
+        self.bb_std_dev = bb_std_dev
+        self.prev_close = math.nan
+        self.count = 0
+        self.last_date: Optional[date] = None
+        self.latest: Dict[str, float] = {col: math.nan for col in self.COLUMNS}
+
+    def update(self, high: float, low: float, close: float, day: Optional[Any] = None) -> Dict[str, float]:
+        """
+        加入一根 K 線並回傳該 K 線的技術指標
+
+        Args:
+            high, low, close: 最高、最低、收盤價 (缺值為 NaN)
+            day: 交易日 (記錄為 last_date，供接續更新時判斷起點)
+
+        Returns:
+            COLUMNS 各欄位的值
+        """
+        high, low, close = float(high), float(low), float(close)
+
+        # RSI: 漲跌幅的滾動平均 (第一根或缺值時漲跌皆為 0)
+        delta = close - self.prev_close
+        gain = self.gain.update(delta if delta > 0 else 0.0)
+        loss = self.loss.update(-delta if delta < 0 else 0.0)
+        rs = _divide(gain, loss)
+        rsi = 100 - 100 / (1 + rs) if not math.isnan(rs) else math.nan
+
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        macd_signal = self.macd_signal.update(macd)
+
+        low_min = self.low_min.update(low)
+        high_max = self.high_max.update(high)
+        rsv = _divide(close - low_min, high_max - low_min) * 100
+        k = self.k.update(rsv)
+        d = self.d.update(k)
+
+        ma20 = self.ma20.update(close)
+        std = self.bb_std.update(close)
+
+        self.prev_close = close
+        self.count += 1
+        if day is not None:
+            self.last_date = pd.Timestamp(day).date()
+        self.latest = {
+            'MA5': self.ma5.update(close),
+            'MA10': self.ma10.update(close),
+            'MA20': ma20,
+            'MA60': self.ma60.update(close),
+            'RSI': rsi,
+            'MACD': macd,
+            'MACD_Signal': macd_signal,
+            'MACD_Hist': macd - macd_signal,
+            'K': k,
+            'D': d,
+            'BB_Upper': ma20 + std * self.bb_std_dev,
+            'BB_Middle': ma20,
+            'BB_Lower': ma20 - std * self.bb_std_dev,
+        }
+        return self.latest
+
+    def update_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        依序加入多根 K 線
+
+        Args:
+            df: 以日期為索引、含 high、low、close 欄位的 DataFrame
+
+        Returns:
+            與 df 相同索引、欄位為 COLUMNS 的 DataFrame
+        """
+        rows = np.empty((len(df), len(self.COLUMNS)))
+        for i, (day, high, low, close) in enumerate(zip(df.index, df['high'].to_numpy(dtype=np.float64),
+                                                        df['low'].to_numpy(dtype=np.float64),
+                                                        df['close'].to_numpy(dtype=np.float64))):
+            values = self.update(high, low, close, day)
+            rows[i] = [values[col] for col in self.COLUMNS]
+        return pd.DataFrame(rows, index=df.index, columns=self.COLUMNS)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        加入 df 的 K 線，並回傳加上技術指標欄位的 df (格式同 calculate_technical_indicators)
+
+        少於 20 根 K 線時回傳原 DataFrame，MA60 在累計不足 60 根時為 None
+        """
+        indicators = self.update_frame(df)
+        if df.empty or self.count < 20:
+            return df
+        df = df.copy()
+        for col in self.COLUMNS:
+            df[col] = indicators[col]
+        if self.count < 60:
+            df['MA60'] = None
+        return df
+
+    def to_dict(self) -> Dict[str, Any]:
+        """可 JSON 序列化的狀態"""
+        state: Dict[str, Any] = {name: getattr(self, name).to_dict() for name in self._STATE_TYPES}
+        state.update({
+            'bb_period': self.bb_period,
+            'bb_std_dev': self.bb_std_dev,
+            'prev_close': self.prev_close,
+            'count': self.count,
+            'last_date': self.last_date.isoformat() if self.last_date else None,
+            'latest': self.latest,
+        })
+        return state
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "IndicatorEngine":
+        """由 to_dict 的結果還原"""
+        obj = cls.__new__(cls)
+        for name, state_type in cls._STATE_TYPES.items():
+            setattr(obj, name, state_type.from_dict(state[name]))
+        obj.bb_period = state['bb_period']
+        obj.bb_std_dev = state['bb_std_dev']
+        obj.prev_close = state['prev_close']
+        obj.count = state['count']
+        obj.last_date = date.fromisoformat(state['last_date']) if state['last_date'] else None
+        obj.latest = dict(state['latest'])
+        return obj
+
+    def copy(self) -> "IndicatorEngine":
+        """複製目前狀態"""
+        return self.from_dict(self.to_dict())
+
@@ -0,0 +1,237 @@
+"""全市場每日行情快照快取模組
+
+TPEx dailyQuotes 每次回傳當日所有上櫃股票 (~800 檔) 的完整行情表。
+本模組將每日完整表格只下載一次，並以股票代碼建立索引，
+讓任何上櫃股票的歷史查詢都能共用同一份每日資料，且日內查詢為 O(1)。
+
+OpenAPI 即時行情則於載入時轉為欄位式的 QuoteTable (數值欄位為 NumPy 陣列)。
+"""
+
+import os
+import json
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Optional, Dict, List, Any, Iterable
+
+import numpy as np
+
+from .history_store import get_stock_data_directory
+
+
+class DailySnapshot:
+    """單日全市場行情表 (以股票代碼索引)"""
+
+    __slots__ = ('day', 'rows', 'index')
+
+    def __init__(self, day: date, rows: List[List[Any]]):
+        self.day = day
+        self.rows = rows
+        # 股票代碼 -> 列索引
+        self.index: Dict[str, int] = {str(row[0]): i for i, row in enumerate(rows) if row}
+
+    def get(self, code: str) -> Optional[List[Any]]:
+        """取得某股票當日的行情列，不存在時回傳 None"""
+        i = self.index.get(code)
+        return self.rows[i] if i is not None else None
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+class QuoteTable:
+    """欄位式全市場行情表
+
+    數值欄位於載入時轉為 float64 NumPy 陣列 (無法解析的值為 NaN)，
+    並以股票代碼建立列索引；單檔查詢為 O(1)，選股等批次運算可直接取用整個欄位
+    """
+
+    __slots__ = ('codes', 'names', 'dates', 'columns', 'index')
+
+    # 成交股數、金額、筆數等整數欄位 (row() 回傳 int)
+    INTEGER_COLUMNS = frozenset({'trade_volume', 'trade_value', 'transaction'})
+
+    def __init__(self, codes: List[str], names: List[str], dates: List[str],
+                 columns: Dict[str, np.ndarray]):
+        self.codes = codes
+        self.names = names
+        self.dates = dates
+        self.columns = columns
+        # 股票代碼 -> 列索引
+        self.index: Dict[str, int] = {code: i for i, code in enumerate(codes)}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]], code_field: str, name_field: str,
+                     date_field: str, numeric_fields: Dict[str, str]) -> "QuoteTable":
+        """
+        由 OpenAPI JSON 記錄建立行情表
+
+        Args:
+            records: OpenAPI 回傳的記錄清單
+            code_field: 股票代碼欄位
+            name_field: 股票名稱欄位
+            date_field: 日期欄位
+            numeric_fields: 輸出欄位名稱 -> 原始欄位名稱
+
+        Returns:
+            QuoteTable
+        """
+        records = [r for r in records if r.get(code_field)]
+        columns = {}
+        for name, field in numeric_fields.items():
+            values = []
+            for r in records:
+                try:
+                    values.append(float(str(r.get(field, '')).replace(',', '')))
+                except ValueError:
+                    values.append(np.nan)
+            columns[name] = np.array(values, dtype=np.float64)
+        return cls(
+            codes=[str(r[code_field]).strip() for r in records],
+            names=[str(r.get(name_field, '')).strip() for r in records],
+            dates=[str(r.get(date_field, '')) for r in records],
+            columns=columns,
+        )
+
+    @classmethod
+    def empty(cls) -> "QuoteTable":
+        return cls([], [], [], {})
+
+    def row(self, code: str) -> Optional[Dict[str, Any]]:
+        """取得某股票的行情 (數值為 Python 數字，缺值為 None)，不存在時回傳 None"""
+        i = self.index.get(code)
+        if i is None:
+            return None
+        result: Dict[str, Any] = {'code': code, 'name': self.names[i], 'date': self.dates[i]}
+        for name, values in self.columns.items():
+            value = values[i]
+            if np.isnan(value):
+                result[name] = None
+            elif name in self.INTEGER_COLUMNS:
+                result[name] = int(value)
+            else:
+                result[name] = float(value)
+        return result
+
+    def column(self, name: str) -> np.ndarray:
+        """取得整個數值欄位 (依 codes 順序)"""
+        return self.columns[name]
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class DailySnapshotCache:
+    """每日行情快照快取
+
+    - 記憶體: 最近使用的 max_days 個交易日 (LRU)
+    - 磁碟: 已收盤 (complete) 的交易日以 JSON 儲存於 {STOCK_DATA_DIRECTORY}/snapshots/{market}/
+      休市日以空表格儲存，之後不會再查詢
+    - 尚未收盤的當日資料只在記憶體保留 live_ttl 秒
+    """
+
+    def __init__(self, market: str, directory: Optional[str] = None, max_days: int = 250,
+                 live_ttl: float = 600):
+        """
+        初始化快照快取
+
+        Args:
+            market: 市場代號，如 'TPEX'
+            directory: 快照目錄，預設為 {STOCK_DATA_DIRECTORY}/snapshots/{market}
+            max_days: 記憶體中保留的交易日數
+            live_ttl: 尚未收盤的快照有效秒數
+        """
+        if directory is None:
+            directory = os.path.join(get_stock_data_directory(), 'snapshots', market.lower())
+        os.makedirs(directory, exist_ok=True)
+
+        self.market = market
+        self.directory = directory
+        self.max_days = max_days
+        self.live_ttl = live_ttl
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[date, DailySnapshot]" = OrderedDict()
+        # 尚未收盤的快照: day -> (快照, 取得時間)
+        self._live: Dict[date, Any] = {}
+
+    def _path(self, day: date) -> str:
+        return os.path.join(self.directory, f"{day.isoformat()}.json")
+
+    def get(self, day: date) -> Optional[DailySnapshot]:
+        """
+        取得某日快照 (先查記憶體，再查磁碟)
+
+        Returns:
+            DailySnapshot，未快取時回傳 None
+        """
+        with self._lock:
+            snapshot = self._memory.get(day)
+            if snapshot is not None:
+                self._memory.move_to_end(day)
+                return snapshot
+
+            live = self._live.get(day)
+            if live is not None:
+                if time.monotonic() - live[1] < self.live_ttl:
+                    return live[0]
+                del self._live[day]
+
+        path = self._path(day)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        snapshot = DailySnapshot(day, rows)
+        self._remember(snapshot)
+        return snapshot
+
+    def put(self, day: date, rows: List[List[Any]], complete: bool) -> DailySnapshot:
+        """
+        儲存某日快照
+
+        Args:
+            day: 交易日
+            rows: 當日完整行情表
+            complete: 該日是否已收盤 (已收盤才寫入磁碟)
+
+        Returns:
+            DailySnapshot
+        """
+        snapshot = DailySnapshot(day, rows)
+        if complete:
+            # 每個寫入者使用各自的暫存檔，並行寫入同一天時以最後完成者為準
+            fd, tmp_path = tempfile.mkstemp(prefix=f"{day.isoformat()}.", suffix='.tmp', dir=self.directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(rows, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, self._path(day))
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            self._remember(snapshot)
+        else:
+            with self._lock:
+                self._live[day] = (snapshot, time.monotonic())
+        return snapshot
+
+    def _remember(self, snapshot: DailySnapshot) -> None:
+        """放入記憶體 LRU"""
+        with self._lock:
+            self._memory[snapshot.day] = snapshot
+            self._memory.move_to_end(snapshot.day)
+            while len(self._memory) > self.max_days:
+                self._memory.popitem(last=False)
@@ -0,0 +1,236 @@
+"""全市場技術指標 - 一次計算「股票 × 交易日」陣列中所有股票的 MA、RSI、MACD、KD 與布林通道
+
+輸入為 PricePanel 格式的 2-D 陣列 (每列一檔股票，缺值為 NaN)。收盤價為 NaN 的交易日
+(上市前、停牌、下市後) 視為沒有 K 線: 先將每檔股票的有效 K 線靠左排列再計算，
+結果放回原本的位置，因此每檔股票的結果與只用該股票自己的 K 線
+執行 TWSEDataFetcher.calculate_technical_indicators 相同 (浮點誤差範圍內)。
+
+滾動平均與標準差以累加和相減、滾動最高/最低以平移比較計算；EMA 沿時間軸逐日遞迴，
+每一步同時更新所有股票。全市場約 1,800 檔 × 10 年日 K 只需數秒。
+
+使用方式:
+    python -m knowledge_base.tools.panel_indicators --lookback 250
+"""
+
+import argparse
+import sys
+import time
+from typing import Optional, List, Dict, Any
+
+import numpy as np
+import pandas as pd
+
+from .indicator_engine import IndicatorEngine
+
+
+# 與 calculate_technical_indicators 相同: 少於 MIN_BARS 根不計算指標，少於 60 根不計算 MA60
+MIN_BARS = 20
+MA60_BARS = 60
+
+
+def _pack(valid: np.ndarray) -> np.ndarray:
+    """每列有效位置在前 (維持原順序) 的排列索引"""
+    return np.argsort(~valid, axis=1, kind='stable')
+
+
+def _window_sums(values: np.ndarray, period: int, power: int = 1):
+    """沿最後一維的視窗內 (values - 基準值) ** power 的和與有效個數 (以累加和相減計算)"""
+    # 減去每列的基準值再累加，降低累加和相減的誤差
+    filled = values - np.nan_to_num(values[:, :1])
+    missing = np.isnan(filled)
+    filled[missing] = 0.0
+    if power != 1:
+        filled **= power
+    sums = np.cumsum(filled, axis=1)
+    counts = np.cumsum(~missing, axis=1)
+    sums[:, period:] -= sums[:, :-period].copy()
+    counts[:, period:] -= counts[:, :-period].copy()
+    return sums, counts
+
+
+def rolling_mean(values: np.ndarray, period: int) -> np.ndarray:
+    """沿最後一維的滾動平均 (視窗內有 NaN 或不足 period 時為 NaN)"""
+    sums, counts = _window_sums(values, period)
+    result = sums / period + np.nan_to_num(values[:, :1])
+    result[counts < period] = np.nan
+    return result
+
+
+def rolling_std(values: np.ndarray, period: int, ddof: int = 1) -> np.ndarray:
+    """沿最後一維的滾動標準差 (視窗內有 NaN 或不足 period 時為 NaN)"""
+    sums, counts = _window_sums(values, period)
+    squares, _ = _window_sums(values, period, power=2)
+    variance = (squares - sums * sums / period) / (period - ddof)
+    result = np.sqrt(np.maximum(variance, 0.0))
+    result[counts < period] = np.nan
+    return result
+
+
+def rolling_extreme(values: np.ndarray, period: int, kind: str = 'max') -> np.ndarray:
+    """沿最後一維的滾動最高或最低值 (以 period - 1 次平移比較；視窗內有 NaN 時為 NaN)"""
+    combine = np.maximum if kind == 'max' else np.minimum
+    result = values.copy()
+    for shift in range(1, period):
+        combine(result[:, shift:], values[:, :-shift], out=result[:, shift:])
+    result[:, :period - 1] = np.nan
+    return result
+
+
+def ewm_mean(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    沿最後一維的指數移動平均 (同 Series.ewm(alpha=alpha, adjust=False).mean()，含 NaN 的權重衰減)
+
+    逐日遞迴，每一步以向量運算同時更新所有股票
+    """
+    columns = np.ascontiguousarray(values.T)
+    observed_all = ~np.isnan(columns)
+    result = np.empty_like(columns)
+    weighted = columns[0].copy()
+    old_weight = np.ones(len(weighted))
+    started = observed_all[0].copy()
+    decayed = False
+    result[0] = weighted
+    decay = 1 - alpha
+    with np.errstate(invalid='ignore'):
+        for t in range(1, len(columns)):
+            current = columns[t]
+            observed = observed_all[t]
+            if not decayed and observed.all() and started.all():
+                # 常見情況: 所有股票皆已開始、當日皆有值且前值權重皆為 1
+                weighted = (decay * weighted + alpha * current) / (decay + alpha)
+            else:
+                old_weight = np.where(started, old_weight * decay, old_weight)
+                update = started & observed & (weighted != current)
+                blended = (old_weight * weighted + alpha * current) / (old_weight + alpha)
+                weighted = np.where(update, blended, weighted)
+                weighted = np.where(~started & observed, current, weighted)
+                old_weight = np.where(started & observed, 1.0, old_weight)
+                started |= observed
+                decayed = bool((old_weight != 1.0).any())
+            result[t] = weighted
+    return result.T
+
+
+def panel_indicators(high: Any, low: Any, close: Any) -> Dict[str, np.ndarray]:
+    """
+    計算所有股票的技術指標
+
+    Args:
+        high, low, close: 股票 × 交易日 的陣列 (收盤價為 NaN 的交易日視為沒有 K 線)
+
+    Returns:
+        IndicatorEngine.COLUMNS 各欄位的 股票 × 交易日 陣列；沒有 K 線的交易日、
+        有效 K 線少於 20 根的股票 (MA60 為少於 60 根) 為 NaN
+    """
+    close = np.atleast_2d(np.asarray(close, dtype=np.float64))
+    high = np.atleast_2d(np.asarray(high, dtype=np.float64))
+    low = np.atleast_2d(np.asarray(low, dtype=np.float64))
+    valid = ~np.isnan(close)
+    counts = valid.sum(axis=1)
+
+    # 有效 K 線靠左排列，之後的空格不影響前面的計算 (沒有空格或空格都在最後時不需重排)
+    packed_valid = np.arange(close.shape[1]) < counts[:, None]
+    order = None if (packed_valid == valid).all() else _pack(valid)
+
+    def pack(values):
+        if order is not None:
+            values = np.take_along_axis(values, order, axis=1)
+        return np.where(packed_valid, values, np.nan)
+
+    high, low, close = pack(high), pack(low), pack(close)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ma = {n: rolling_mean(close, n) for n in (5, 10, 20, 60)}
+
+        # RSI (第一根 K 線的漲跌為 0，同整段計算)
+        delta = np.full(close.shape, np.nan)
+        delta[:, 1:] = np.diff(close, axis=1)
+        gain = rolling_mean(np.where(delta > 0, delta, 0.0), 14)
+        loss = rolling_mean(np.where(delta < 0, -delta, 0.0), 14)
+        rsi = 100 - 100 / (1 + gain / loss)
+
+        macd = ewm_mean(close, 2 / 13) - ewm_mean(close, 2 / 27)
+        macd_signal = ewm_mean(macd, 2 / 10)
+
+        low_min = rolling_extreme(low, 9, 'min')
+        high_max = rolling_extreme(high, 9, 'max')
+        rsv = (close - low_min) / (high_max - low_min) * 100
+        k = ewm_mean(rsv, 1 / 3)
+        d = ewm_mean(k, 1 / 3)
+
+        std = rolling_std(close, 20)
+
+    packed = {
+        'MA5': ma[5], 'MA10': ma[10], 'MA20': ma[20], 'MA60': ma[60],
+        'RSI': rsi,
+        'MACD': macd, 'MACD_Signal': macd_signal, 'MACD_Hist': macd - macd_signal,
+        'K': k, 'D': d,
+        'BB_Upper': ma[20] + std * 2, 'BB_Middle': ma[20], 'BB_Lower': ma[20] - std * 2,
+    }
+
+    # 放回原本的位置 (以反向排列)；沒有 K 線的交易日與 K 線不足的股票為 NaN
+    inverse = np.argsort(order, axis=1) if order is not None else None
+    keep = valid & (counts >= MIN_BARS)[:, None]
+    keep_ma60 = keep & (counts >= MA60_BARS)[:, None]
+    result = {}
+    for name in IndicatorEngine.COLUMNS:
+        values = packed[name]
+        if inverse is not None:
+            values = np.take_along_axis(values, inverse, axis=1)
+        result[name] = np.where(keep_ma60 if name == 'MA60' else keep, values, np.nan)
+    return result
+
+
+def market_indicators(panel: Any, day: Optional[Any] = None, lookback: Optional[int] = None) -> pd.DataFrame:
+    """
+    以全市場價量面板計算某一交易日所有股票的技術指標
+
+    Args:
+        panel: PricePanel
+        day: 交易日，預設為面板最後一個交易日
+        lookback: 往前取的交易日數 (含暖身期)，預設使用面板全部的交易日
+
+    Returns:
+        以 stock_id 為索引的 DataFrame: close 與 IndicatorEngine.COLUMNS
+    """
+    stop = len(panel.dates) if day is None else panel._day_position(day) + 1
+    start = max(stop - lookback, 0) if lookback else 0
+    index = pd.Index(panel.symbols, name='stock_id')
+    if stop == 0:
+        return pd.DataFrame(columns=['close'] + IndicatorEngine.COLUMNS, index=index, dtype=np.float64)
+
+    close = panel.field('close')[:, start:stop]
+    indicators = panel_indicators(panel.field('high')[:, start:stop], panel.field('low')[:, start:stop], close)
+    frame = {'close': close[:, -1]}
+    frame.update({name: values[:, -1] for name, values in indicators.items()})
+    return pd.DataFrame(frame, index=index)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口"""
+    from .price_panel import PricePanel
+
+    parser = argparse.ArgumentParser(description="以全市場價量面板計算所有股票的技術指標")
+    parser.add_argument('--day', help="交易日 YYYY-MM-DD，預設為最後一個交易日")
+    parser.add_argument('--lookback', type=int, help="往前取的交易日數，預設為全部")
+    parser.add_argument('--output', help="輸出 CSV 檔案")
+    args = parser.parse_args(argv)
+
+    if not PricePanel.exists():
+        print("❌ 尚未建立全市場價量面板，請先執行: python -m knowledge_base.tools.price_panel build")
+        return 1
+
+    started = time.monotonic()
+    panel = PricePanel()
+    df = market_indicators(panel, args.day, args.lookback)
+    elapsed = time.monotonic() - started
+    if args.output:
+        df.to_csv(args.output)
+    print(f"✅ 已計算 {len(df)} 檔股票的技術指標 ({panel.shape[1]} 個交易日)，耗時 {elapsed:.1f}s")
+    if not args.output:
+        print(df.dropna(subset=['RSI']).sort_values('RSI').head(10).round(2).to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
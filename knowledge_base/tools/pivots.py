@@ -0,0 +1,134 @@
+"""支撐壓力位計算 - 以 NumPy 滑動視窗找出轉折點，並將相近的轉折點聚合為價格區間
+
+轉折點 (pivot) 為嚴格高於 (或低於) 左右各 window 根 K 線的高點 (或低點)。
+所有函數皆接受 1-D (單一股票) 或 2-D (股票 × 交易日，如 PricePanel.field) 的陣列，
+全市場、多年資料的支撐壓力位只需數次陣列運算，不需逐檔逐列的 Python 迴圈。
+"""
+
+from typing import Optional, List, Dict, Any
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# 轉折點左右各比較的 K 線數 (2 表示 5 根 K 線的局部高低點)
+DEFAULT_PIVOT_WINDOW = 2
+
+# 聚合價格區間時，相鄰轉折點價格差距的比例上限
+DEFAULT_ZONE_TOLERANCE = 0.015
+
+
+def pivot_mask(values: Any, window: int = DEFAULT_PIVOT_WINDOW, kind: str = 'high') -> np.ndarray:
+    """
+    找出局部高點或低點
+
+    Args:
+        values: 價格陣列，1-D 或 2-D (最後一維為時間)
+        window: 左右各比較的 K 線數
+        kind: 'high' (嚴格高於左右 window 根) 或 'low' (嚴格低於左右 window 根)
+
+    Returns:
+        與 values 同形狀的布林陣列；前後 window 根與 NaN 不會是轉折點
+    """
+    if window < 1:
+        raise ValueError(f"window 必須大於 0: {window}")
+    if kind not in ('high', 'low'):
+        raise ValueError(f"kind 必須為 high 或 low: {kind}")
+
+    values = np.asarray(values, dtype=np.float64)
+    mask = np.zeros(values.shape, dtype=bool)
+    n = values.shape[-1] if values.ndim else 0
+    if n < 2 * window + 1:
+        return mask
+
+    # windows[..., t, k] 為以 t + window 為中心的 2 * window + 1 根 K 線中的第 k 根 (不複製)
+    windows = sliding_window_view(values, 2 * window + 1, axis=-1)
+    center = windows[..., window]
+    # 逐欄比較 (連續記憶體，比沿視窗軸取 max/min 快)；與 NaN 比較的結果為 False
+    compare = np.greater if kind == 'high' else np.less
+    pivots = np.ones(center.shape, dtype=bool)
+    for k in range(2 * window + 1):
+        if k != window:
+            pivots &= compare(center, windows[..., k])
+    mask[..., window:n - window] = pivots
+    return mask
+
+
+def cluster_zones(prices: Any, tolerance: float = DEFAULT_ZONE_TOLERANCE) -> List[Dict[str, Any]]:
+    """
+    將相近的轉折點價格聚合為價格區間
+
+    價格排序後，與前一個價格差距不超過 tolerance 比例者歸入同一區間 (區間可連鎖延伸)。
+
+    Args:
+        prices: 轉折點價格 (NaN 會被忽略)
+        tolerance: 相鄰價格差距的比例上限
+
+    Returns:
+        依價格由低至高排列的區間: low、high、price (平均價)、touches (轉折點數)
+    """
+    prices = np.asarray(prices, dtype=np.float64).ravel()
+    prices = np.sort(prices[~np.isnan(prices)])
+    if not len(prices):
+        return []
+
+    breaks = np.flatnonzero(np.diff(prices) > np.abs(prices[:-1]) * tolerance) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(prices)]))
+    touches = ends - starts
+    means = np.add.reduceat(prices, starts) / touches
+    return [
+        {'low': float(prices[s]), 'high': float(prices[e - 1]), 'price': round(float(m), 2), 'touches': int(c)}
+        for s, e, m, c in zip(starts, ends, means, touches)
+    ]
+
+
+def nearest_levels(high: Any, low: Any, close: Any, window: int = DEFAULT_PIVOT_WINDOW) -> Dict[str, np.ndarray]:
+    """
+    各股票最接近目前價格的支撐位與壓力位
+
+    Args:
+        high, low, close: 股票 × 交易日 陣列 (或單一股票的 1-D 陣列)
+        window: 轉折點的左右 K 線數
+
+    Returns:
+        support (低於最後收盤價的最高轉折低點)、resistance (高於最後收盤價的最低轉折高點)、
+        current_price (最後收盤價)；沒有對應轉折點時為 NaN
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    current = np.asarray(close, dtype=np.float64)[..., -1:]
+
+    with np.errstate(invalid='ignore'):
+        resistance = np.where(pivot_mask(high, window, 'high') & (high > current), high, np.inf).min(axis=-1)
+        support = np.where(pivot_mask(low, window, 'low') & (low < current), low, -np.inf).max(axis=-1)
+    return {
+        'support': np.where(np.isinf(support), np.nan, support),
+        'resistance': np.where(np.isinf(resistance), np.nan, resistance),
+        'current_price': current[..., 0],
+    }
+
+
+def market_support_resistance(panel: Any, end: Optional[Any] = None, lookback: int = 250,
+                              window: int = DEFAULT_PIVOT_WINDOW) -> pd.DataFrame:
+    """
+    以全市場價量面板計算所有股票的支撐位與壓力位
+
+    Args:
+        panel: PricePanel
+        end: 計算至此交易日 (含)，預設為面板最後一個交易日
+        lookback: 往前取的交易日數
+        window: 轉折點的左右 K 線數
+
+    Returns:
+        以 stock_id 為索引的 DataFrame: support、resistance、current_price
+    """
+    stop = len(panel.dates) if end is None else panel._day_position(end) + 1
+    start = max(stop - lookback, 0)
+    if stop == 0:
+        return pd.DataFrame(columns=['support', 'resistance', 'current_price'],
+                            index=pd.Index(panel.symbols, name='stock_id'), dtype=np.float64)
+    levels = nearest_levels(panel.field('high')[:, start:stop], panel.field('low')[:, start:stop],
+                            panel.field('close')[:, start:stop], window)
+    return pd.DataFrame(levels, index=pd.Index(panel.symbols, name='stock_id'))
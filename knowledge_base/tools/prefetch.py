@@ -0,0 +1,194 @@
+"""自選股預先下載 - 收盤後更新本地資料並預先計算技術指標
+
+在收盤資料公布後 (預設 15:30) 下載自選股當日行情、寫入本地歷史資料庫並計算技術指標 (含串流指標狀態)，
+隔天盤前與盤中查詢這些股票 (StockPriceTool、TradingSignalTool 等) 時全部由本地資料回應。
+
+自選股由環境變數 STOCK_WATCHLIST 設定 (以逗號分隔)，執行時間由 STOCK_PREFETCH_TIME (HH:MM) 設定。
+可在 Agent 程序內以背景執行緒執行，或獨立執行:
+    python -m knowledge_base.tools.prefetch 2330 2317 6488
+    python -m knowledge_base.tools.prefetch --once
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+
+from .price_panel import PricePanel, append_price_panel
+from .twse_data import TWSEDataFetcher, get_shared_fetcher
+
+
+def get_watchlist() -> List[str]:
+    """取得自選股清單 (環境變數 STOCK_WATCHLIST，以逗號或空白分隔)"""
+    value = os.getenv("STOCK_WATCHLIST", "")
+    return [s for s in value.replace(',', ' ').split() if s]
+
+
+def get_prefetch_time() -> Tuple[int, int]:
+    """取得每日預先下載時間 (環境變數 STOCK_PREFETCH_TIME，預設 15:30)"""
+    hour, minute = os.getenv("STOCK_PREFETCH_TIME", "15:30").split(':')
+    return int(hour), int(minute)
+
+
+class WatchlistPrefetcher:
+    """自選股預先下載器 (背景執行緒)"""
+
+    def __init__(self, watchlist: Optional[List[str]] = None, fetcher: Optional[TWSEDataFetcher] = None,
+                 run_at: Optional[Tuple[int, int]] = None, verbose: bool = False):
+        """
+        初始化預先下載器
+
+        Args:
+            watchlist: 股票代碼清單，預設為 STOCK_WATCHLIST
+            fetcher: 數據獲取器，預設使用共用的獲取器
+            run_at: 每日執行時間 (時, 分)，預設為 STOCK_PREFETCH_TIME
+            verbose: 是否輸出執行結果
+        """
+        self.watchlist = list(dict.fromkeys(watchlist if watchlist is not None else get_watchlist()))
+        self.fetcher = fetcher or get_shared_fetcher()
+        self.run_at = run_at or get_prefetch_time()
+        self.verbose = verbose
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, Any]:
+        """
+        立即執行一次預先下載
+
+        Returns:
+            執行結果: stocks (成功的股票數)、failed (失敗的股票代碼)、
+            panel (附加至價量面板的交易日)、elapsed (秒)
+        """
+        started = time.monotonic()
+
+        # 代碼主檔與全市場行情 (每個市場一次請求)
+        self.fetcher.symbols.refresh()
+        self.fetcher.get_stock_info_many(self.watchlist)
+
+        def warm(stock_id: str) -> bool:
+            try:
+                df = self.fetcher.get_history_with_indicators(stock_id)
+                if df.empty:
+                    return False
+                # 串流指標狀態存入本地資料庫，程序重啟後只需計算新增的 K 線
+                self.fetcher.update_indicator_state(stock_id)
+                return True
+            except Exception:
+                return False
+
+        results = self.fetcher.map_concurrently(warm, self.watchlist)
+        failed = [stock_id for stock_id, ok in zip(self.watchlist, results) if not ok]
+
+        # 已建立全市場價量面板時一併附加當日行情
+        panel_day = append_price_panel(self.fetcher) if PricePanel.exists() else None
+
+        self.last_run = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'stocks': len(self.watchlist) - len(failed),
+            'failed': failed,
+            'panel': panel_day.isoformat() if panel_day else None,
+            'elapsed': round(time.monotonic() - started, 2),
+        }
+        if self.verbose:
+            print(f"📥 自選股預先下載完成: {self.last_run}")
+        return self.last_run
+
+    def next_run(self, now: Optional[datetime] = None) -> datetime:
+        """下一次執行時間 (平日的 run_at)"""
+        now = now or datetime.now()
+        run = now.replace(hour=self.run_at[0], minute=self.run_at[1], second=0, microsecond=0)
+        if run <= now:
+            run += timedelta(days=1)
+        while run.weekday() >= 5:
+            run += timedelta(days=1)
+        return run
+
+    def start(self, run_now: bool = True) -> "WatchlistPrefetcher":
+        """
+        啟動背景執行緒
+
+        Args:
+            run_now: 啟動時是否先執行一次 (補上程序未執行期間的資料)
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(run_now,),
+                                        name='watchlist-prefetcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止背景執行緒"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self, run_now: bool) -> None:
+        if run_now:
+            self._safe_run()
+        while not self._stop.is_set():
+            wait = (self.next_run() - datetime.now()).total_seconds()
+            if self._stop.wait(max(wait, 0)):
+                break
+            self._safe_run()
+
+    def _safe_run(self) -> None:
+        try:
+            self.run_once()
+        except Exception as e:
+            if self.verbose:
+                print(f"⚠️ 自選股預先下載失敗: {e}")
+
+
+_prefetcher: Optional[WatchlistPrefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def start_watchlist_prefetcher(verbose: bool = False) -> Optional[WatchlistPrefetcher]:
+    """
+    依環境變數 STOCK_WATCHLIST 啟動程序內共用的背景預先下載器
+
+    Returns:
+        WatchlistPrefetcher，未設定自選股時回傳 None
+    """
+    global _prefetcher
+    if not get_watchlist():
+        return None
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = WatchlistPrefetcher(verbose=verbose).start()
+    return _prefetcher
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口 (獨立執行的常駐程式)"""
+    parser = argparse.ArgumentParser(description="收盤後預先下載自選股行情並計算技術指標")
+    parser.add_argument('symbols', nargs='*', help="股票代碼，預設為 STOCK_WATCHLIST")
+    parser.add_argument('--once', action='store_true', help="只執行一次後結束")
+    args = parser.parse_args(argv)
+
+    prefetcher = WatchlistPrefetcher(watchlist=args.symbols or None, verbose=True)
+    if not prefetcher.watchlist:
+        parser.error("請提供股票代碼或設定 STOCK_WATCHLIST")
+
+    if args.once:
+        return 1 if prefetcher.run_once()['failed'] else 0
+
+    print(f"⏰ 自選股 {len(prefetcher.watchlist)} 檔，每個交易日 "
+          f"{prefetcher.run_at[0]:02d}:{prefetcher.run_at[1]:02d} 更新 (Ctrl+C 結束)")
+    prefetcher.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        prefetcher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""全市場價量面板 - 以記憶體映射 (memory-mapped) NumPy 陣列儲存的日 K 線
+
+每個欄位 (開、高、低、收、成交量) 為一個「股票 × 交易日」的 float64 陣列 (.npy)，
+搭配股票代碼與交易日索引 (meta.json)。任何程序都可以零複製開啟，
+取得全市場某一天的收盤價只需切片一欄，不需數千次 HTTP 請求與 DataFrame 建構。
+
+- 建立: 由本地歷史資料庫 (可先以 backfill 回補) 讀取各股票的日 K 線
+- 每日附加: 以全市場行情 (每個市場一次請求) 寫入最新交易日
+
+陣列預留容量，新增股票或交易日時不需每次重寫檔案；只有超過容量時才擴充。
+只允許單一程序寫入；讀取端重新開啟 (reload) 即可看到新附加的交易日。
+
+使用方式:
+    python -m knowledge_base.tools.price_panel build --start 2021-01-01
+    python -m knowledge_base.tools.price_panel append
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, date
+from typing import Optional, List, Dict, Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+from .history_store import get_stock_data_directory, to_date, roc_to_datetime
+from .symbol_master import Symbol
+
+
+class PricePanel:
+    """全市場價量面板 (股票 × 交易日)"""
+
+    FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+    # 擴充容量時的最小股票數與交易日數
+    MIN_SYMBOLS = 256
+    MIN_DAYS = 256
+
+    def __init__(self, directory: Optional[str] = None, writable: bool = False):
+        """
+        開啟 (或建立) 價量面板
+
+        Args:
+            directory: 面板目錄，預設為 {STOCK_DATA_DIRECTORY}/panel
+            writable: 是否以可寫入模式開啟 (讀取端請使用預設的唯讀模式)
+        """
+        self.directory = directory or os.path.join(get_stock_data_directory(), 'panel')
+        self.writable = writable
+        self.reload()
+
+    @classmethod
+    def exists(cls, directory: Optional[str] = None) -> bool:
+        """面板是否已建立"""
+        directory = directory or os.path.join(get_stock_data_directory(), 'panel')
+        return os.path.exists(os.path.join(directory, 'meta.json'))
+
+    def reload(self) -> None:
+        """重新載入索引與陣列 (讀取其他程序附加的資料)"""
+        try:
+            with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {'symbols': [], 'dates': []}
+
+        self.symbols: List[str] = list(meta['symbols'])
+        self.dates = pd.DatetimeIndex(meta['dates'], name='date')
+        self.symbol_index: Dict[str, int] = {s: i for i, s in enumerate(self.symbols)}
+        self._date_index: Dict[pd.Timestamp, int] = {d: j for j, d in enumerate(self.dates)}
+        self._arrays: Dict[str, np.ndarray] = {}
+        if self.symbols and len(self.dates):
+            mode = 'r+' if self.writable else 'r'
+            self._arrays = {name: np.load(self._path(f"{name}.npy"), mmap_mode=mode) for name in self.FIELDS}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @property
+    def shape(self) -> tuple:
+        """(股票數, 交易日數)"""
+        return len(self.symbols), len(self.dates)
+
+    def field(self, name: str) -> np.ndarray:
+        """
+        取得某欄位的 股票 × 交易日 陣列 (記憶體映射，不複製)
+
+        Args:
+            name: FIELDS 之一
+
+        Returns:
+            shape 為 (股票數, 交易日數) 的 float64 陣列，缺值為 NaN
+        """
+        if name not in self.FIELDS:
+            raise KeyError(f"未知的欄位: {name}")
+        if not self._arrays:
+            return np.empty((len(self.symbols), len(self.dates)))
+        return self._arrays[name][:len(self.symbols), :len(self.dates)]
+
+    def column(self, name: str, day: Any) -> np.ndarray:
+        """
+        取得全市場某一交易日的某欄位 (依 symbols 順序)
+
+        Args:
+            name: FIELDS 之一
+            day: 交易日 (date、datetime 或 'YYYY-MM-DD')
+
+        Returns:
+            長度為股票數的陣列 (不複製)
+        """
+        return self.field(name)[:, self._day_position(day)]
+
+    def cross_section(self, day: Any, fields: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """取得全市場某一交易日的價量 (以 stock_id 為索引)"""
+        j = self._day_position(day)
+        return pd.DataFrame({name: self.field(name)[:, j] for name in (fields or self.FIELDS)},
+                            index=pd.Index(self.symbols, name='stock_id'))
+
+    def history(self, stock_id: str, start: Optional[Any] = None, end: Optional[Any] = None) -> pd.DataFrame:
+        """取得單一股票的日 K 線 (以日期為索引，欄位為 FIELDS)"""
+        i = self.symbol_index[stock_id]
+        df = pd.DataFrame({name: self.field(name)[i] for name in self.FIELDS}, index=self.dates)
+        if start is not None or end is not None:
+            df = df.loc[pd.Timestamp(to_date(start)) if start is not None else None:
+                        pd.Timestamp(to_date(end)) if end is not None else None]
+        return df
+
+    def _day_position(self, day: Any) -> int:
+        position = self._date_index.get(pd.Timestamp(to_date(day)))
+        if position is None:
+            raise KeyError(f"面板中沒有此交易日: {day}")
+        return position
+
+    # ---- 寫入 ----
+
+    def add_symbols(self, stock_ids: Iterable[str]) -> None:
+        """新增股票 (附加於最後，既有股票的位置不變)"""
+        self._check_writable()
+        new = [s for s in dict.fromkeys(stock_ids) if s not in self.symbol_index]
+        if not new:
+            return
+        self._ensure_capacity(len(self.symbols) + len(new), len(self.dates))
+        for stock_id in new:
+            self.symbol_index[stock_id] = len(self.symbols)
+            self.symbols.append(stock_id)
+
+    def add_dates(self, days: Iterable[Any]) -> None:
+        """
+        新增交易日 (必須晚於面板中最後一個交易日；已存在的交易日略過)
+
+        Raises:
+            ValueError: 新增的交易日早於最後一個交易日
+        """
+        self._check_writable()
+        stamps = sorted({pd.Timestamp(to_date(d)) for d in days} - set(self._date_index))
+        if not stamps:
+            return
+        if len(self.dates) and stamps[0] < self.dates[-1]:
+            raise ValueError(f"只能附加 {self.dates[-1].date()} 之後的交易日，請重新建立面板")
+        self._ensure_capacity(len(self.symbols), len(self.dates) + len(stamps))
+        self.dates = self.dates.append(pd.DatetimeIndex(stamps, name='date'))
+        for stamp in stamps:
+            self._date_index[stamp] = len(self._date_index)
+
+    def set_symbol(self, stock_id: str, bars: pd.DataFrame) -> int:
+        """
+        寫入單一股票的日 K 線 (只寫入面板中已有的交易日)
+
+        Args:
+            stock_id: 股票代碼 (不存在時自動新增)
+            bars: 以日期為索引、含 FIELDS 欄位的 DataFrame
+
+        Returns:
+            寫入的交易日數
+        """
+        self.add_symbols([stock_id])
+        if bars.empty or not len(self.dates):
+            return 0
+        aligned = bars.reindex(self.dates)
+        i = self.symbol_index[stock_id]
+        for name in self.FIELDS:
+            if name in aligned.columns:
+                self._arrays[name][i, :len(self.dates)] = aligned[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        return int(aligned[list(self.FIELDS)].notna().any(axis=1).sum())
+
+    def set_day(self, day: Any, quotes: pd.DataFrame) -> int:
+        """
+        寫入全市場某一交易日的價量 (交易日與股票不存在時自動新增)
+
+        Args:
+            day: 交易日
+            quotes: 以 stock_id 為索引、含 FIELDS 欄位的 DataFrame
+
+        Returns:
+            寫入的股票數
+        """
+        self.add_dates([day])
+        self.add_symbols(quotes.index)
+        j = self._day_position(day)
+        rows = np.fromiter((self.symbol_index[s] for s in quotes.index), dtype=np.intp, count=len(quotes))
+        for name in self.FIELDS:
+            if name in quotes.columns:
+                self._arrays[name][rows, j] = quotes[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        return len(rows)
+
+    def flush(self) -> None:
+        """將陣列寫回磁碟並更新索引 (meta.json 最後寫入，讀取端不會看到寫到一半的資料)"""
+        self._check_writable()
+        for array in self._arrays.values():
+            array.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path('meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'symbols': self.symbols,
+                       'dates': [d.strftime('%Y-%m-%d') for d in self.dates],
+                       'updated': datetime.now().isoformat(timespec='seconds')}, f)
+        os.replace(tmp_path, self._path('meta.json'))
+
+    def _check_writable(self) -> None:
+        if not self.writable:
+            raise PermissionError("價量面板以唯讀模式開啟")
+
+    def _ensure_capacity(self, n_symbols: int, n_days: int) -> None:
+        """容量不足時以 1.5 倍擴充陣列檔案 (既有資料複製至新檔後替換)"""
+        capacity = next(iter(self._arrays.values())).shape if self._arrays else (0, 0)
+        if n_symbols <= capacity[0] and n_days <= capacity[1]:
+            return
+
+        new_capacity = (
+            capacity[0] if n_symbols <= capacity[0] else max(n_symbols, self.MIN_SYMBOLS, capacity[0] * 3 // 2),
+            capacity[1] if n_days <= capacity[1] else max(n_days, self.MIN_DAYS, capacity[1] * 3 // 2),
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        rows, cols = len(self.symbols), len(self.dates)
+        arrays = {}
+        for name in self.FIELDS:
+            path = self._path(f"{name}.npy")
+            tmp_path = path + '.tmp'
+            array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float64, shape=new_capacity)
+            array[:] = np.nan
+            if name in self._arrays:
+                array[:rows, :cols] = self._arrays[name][:rows, :cols]
+            array.flush()
+            del array
+            os.replace(tmp_path, path)
+            arrays[name] = np.load(path, mmap_mode='r+')
+        self._arrays = arrays
+
+
+def build_price_panel(fetcher: Any, start: Any, end: Optional[Any] = None,
+                      stock_ids: Optional[List[str]] = None, directory: Optional[str] = None) -> PricePanel:
+    """
+    由本地歷史資料庫建立 (覆蓋) 價量面板
+
+    Args:
+        fetcher: 數據獲取器 (使用其交易日曆、代碼主檔與歷史資料庫)
+        start: 起始日期
+        end: 結束日期，預設為最近一個資料已公布的交易日
+        stock_ids: 股票代碼，預設為代碼主檔中所有交易中的股票
+        directory: 面板目錄
+
+    Returns:
+        可寫入的 PricePanel
+    """
+    start_day = to_date(start)
+    latest = fetcher.calendar.last_sessions(1)
+    end_day = to_date(end) if end is not None else datetime.now().date()
+    if latest:
+        end_day = min(end_day, latest[-1])
+    if stock_ids is None:
+        stock_ids = sorted(s.code for s in fetcher.symbols.symbols() if s.status == Symbol.ACTIVE)
+
+    panel = PricePanel(directory, writable=True)
+    for name in ('meta.json',) + tuple(f"{f}.npy" for f in PricePanel.FIELDS):
+        if os.path.exists(panel._path(name)):
+            os.remove(panel._path(name))
+    panel.reload()
+
+    panel.add_dates(fetcher.calendar.trading_days_between(start_day, end_day))
+    panel.add_symbols(stock_ids)
+    for stock_id in stock_ids:
+        panel.set_symbol(stock_id, fetcher.history_store.load_bars(stock_id, start=start_day, end=end_day))
+    panel.flush()
+    return panel
+
+
+def append_price_panel(fetcher: Any, directory: Optional[str] = None) -> Optional[date]:
+    """
+    以全市場最新行情 (上市、上櫃各一次請求) 附加最新交易日
+
+    上市、上櫃行情的日期可能不同 (例如其中一個市場尚未更新)，各自寫入所屬的交易日；
+    面板中已有的交易日就地更新，早於面板最後一個交易日且不在面板中的日期略過
+
+    Returns:
+        寫入的最新交易日，沒有可寫入的行情時回傳 None
+    """
+    panel = PricePanel(directory, writable=True)
+    stock_ids = [s.code for s in fetcher.symbols.symbols() if s.status == Symbol.ACTIVE] or panel.symbols
+    quotes = fetcher.get_stock_info_many(stock_ids)
+    if quotes.empty:
+        return None
+
+    dates = roc_to_datetime(quotes['date'])
+    quotes = quotes.rename(columns={'trade_volume': 'volume'})
+    written = None
+    for day in sorted(dates.dropna().unique()):
+        day = pd.Timestamp(day)
+        if len(panel.dates) and day < panel.dates[-1] and day not in panel.dates:
+            continue
+        panel.set_day(day, quotes[dates == day][list(PricePanel.FIELDS)])
+        written = day
+    if written is None:
+        return None
+    panel.flush()
+    return written.date()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令列入口"""
+    from .twse_data import get_shared_fetcher
+
+    parser = argparse.ArgumentParser(description="建立或附加全市場價量面板")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="由本地歷史資料庫建立面板")
+    build.add_argument('symbols', nargs='*', help="股票代碼，預設為所有交易中的股票")
+    build.add_argument('--start', required=True, help="起始日期 YYYY-MM-DD")
+    build.add_argument('--end', help="結束日期 YYYY-MM-DD")
+    sub.add_parser('append', help="以最新全市場行情附加最新交易日")
+    parser.add_argument('--dir', help="面板目錄，預設為 {STOCK_DATA_DIRECTORY}/panel")
+    args = parser.parse_args(argv)
+
+    fetcher = get_shared_fetcher()
+    if args.command == 'build':
+        panel = build_price_panel(fetcher, args.start, end=args.end, stock_ids=args.symbols or None,
+                                  directory=args.dir)
+        print(f"✅ 已建立價量面板 {panel.shape[0]} 檔 × {panel.shape[1]} 個交易日 ({panel.directory})")
+        return 0
+
+    day = append_price_panel(fetcher, directory=args.dir)
+    if day is None:
+        print("⚠️ 沒有可附加的行情")
+        return 1
+    print(f"✅ 已附加 {day}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""交易所回應錄製與重播 - 離線測試與效能測試用
+
+- record: 照常連網，並將成功的回應 (STOCK_DAY、dailyQuotes、FMTQIK、OpenAPI 等) 存成 fixture 檔案
+- replay: 不連網，直接由 fixture 檔案回應；沒有對應 fixture 的請求回應 404
+
+模式由環境變數 STOCK_HTTP_MODE (live/record/replay) 設定，
+fixture 目錄由 STOCK_FIXTURE_DIRECTORY 設定 (預設為 {STOCK_DATA_DIRECTORY}/fixtures)。
+fixture 以「主機/路徑/查詢參數雜湊.json」儲存，同一份 fixture 也可由 fixture_server 提供。
+record/replay 模式不使用連網時的 HTTP 回應快取 (http_cache.db)，每個請求都經過錄製/重播。
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .history_store import get_stock_data_directory
+from .rate_limit import RateLimitedAdapter
+
+
+HTTP_MODES = ('live', 'record', 'replay')
+
+
+def get_http_mode() -> str:
+    """取得 HTTP 模式 (環境變數 STOCK_HTTP_MODE，預設 live)"""
+    mode = os.getenv("STOCK_HTTP_MODE", "live").lower()
+    if mode not in HTTP_MODES:
+        raise ValueError(f"STOCK_HTTP_MODE 必須為 {'/'.join(HTTP_MODES)}: {mode}")
+    return mode
+
+
+def get_fixture_directory() -> str:
+    """取得 fixture 目錄 (環境變數 STOCK_FIXTURE_DIRECTORY)"""
+    return os.getenv("STOCK_FIXTURE_DIRECTORY", os.path.join(get_stock_data_directory(), 'fixtures'))
+
+
+class FixtureStore:
+    """以檔案儲存的交易所回應 (每個 URL 一個 JSON 檔案)"""
+
+    # 保留的回應標頭
+    HEADERS = ('content-type', 'etag', 'last-modified')
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Args:
+            directory: fixture 目錄，預設為 STOCK_FIXTURE_DIRECTORY
+        """
+        self.directory = directory or get_fixture_directory()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str) -> str:
+        """fixture 的識別鍵: 主機 + 路徑 + 排序後的查詢參數 (不含 scheme)"""
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return f"{parts.netloc}{parts.path}" + (f"?{query}" if query else "")
+
+    def path(self, url: str) -> str:
+        """fixture 檔案路徑"""
+        key = self.key(url)
+        location, _, query = key.partition('?')
+        name = hashlib.sha1(query.encode('utf-8')).hexdigest()[:16] if query else 'index'
+        return os.path.join(self.directory, *location.strip('/').split('/'), f"{name}.json")
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        讀取 fixture
+
+        Returns:
+            {'url', 'status', 'headers', 'encoding', 'content' (bytes)}，沒有 fixture 時回傳 None
+        """
+        try:
+            with open(self.path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if 'content_base64' in entry:
+            entry['content'] = base64.b64decode(entry.pop('content_base64'))
+        else:
+            entry['content'] = entry.pop('text').encode('utf-8')
+        return entry
+
+    def put(self, url: str, content: bytes, status: int = 200,
+            headers: Optional[Dict[str, str]] = None, encoding: Optional[str] = 'utf-8') -> str:
+        """
+        寫入 fixture (可讀的文字內容以原文儲存，其他以 base64 儲存)
+
+        Returns:
+            fixture 檔案路徑
+        """
+        entry: Dict[str, Any] = {
+            'url': self.key(url),
+            'status': status,
+            'headers': {k: v for k, v in (headers or {}).items() if k.lower() in self.HEADERS},
+            'encoding': encoding,
+        }
+        try:
+            entry['text'] = content.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['content_base64'] = base64.b64encode(content).decode('ascii')
+
+        path = self.path(url)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        return path
+
+    def put_json(self, url: str, payload: Any) -> str:
+        """以 JSON 資料寫入 fixture (用於產生測試資料)"""
+        return self.put(url, json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                        headers={'Content-Type': 'application/json; charset=utf-8'})
+
+    def keys(self) -> List[str]:
+        """所有 fixture 的識別鍵"""
+        result = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(root, name), 'r', encoding='utf-8') as f:
+                        result.append(json.load(f)['url'])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return sorted(result)
+
+
+class RecordingAdapter(RateLimitedAdapter):
+    """照常送出請求 (含速率限制)，並將狀態碼 200 的回應寫入 FixtureStore"""
+
+    def __init__(self, store: FixtureStore, *args, **kwargs):
+        self.store = store
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            self.store.put(request.url, response.content, response.status_code,
+                           dict(response.headers), response.encoding)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """不連網，由 FixtureStore 回應；沒有對應 fixture 時回應 404"""
+
+    def __init__(self, store: FixtureStore):
+        super().__init__()
+        self.store = store
+        self.misses: List[str] = []
+
+    def send(self, request, **kwargs):
+        entry = self.store.get(request.url)
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.raw = None
+        if entry is None:
+            self.misses.append(FixtureStore.key(request.url))
+            response.status_code = 404
+            response._content = b''
+            response.reason = 'No Fixture'
+            return response
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = entry['encoding']
+        response._content = entry['content']
+        response.reason = 'OK' if entry['status'] == 200 else ''
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,332 @@
+"""請求執行器 - 每個端點的延遲統計、自適應逾時、重試、對沖請求與斷路器
+
+交易所端點偶爾會停滯數秒甚至逾時。本模組讓單一慢請求不會拖住整個工具呼叫:
+- 依每個端點 (主機 + 路徑) 最近的延遲計算逾時時間，而非固定 5~15 秒
+- 連線錯誤、逾時、429/5xx 以隨機抖動的指數退避重試，次數有上限
+- 請求超過該端點 p95 延遲仍未回應時，再送出一個相同請求 (對沖)，採用先完成者
+- 端點連續失敗時斷路，在冷卻期間直接回傳快取資料 (即使已過期) 或立即失敗；
+  呼叫端錯誤 (如參數錯誤) 不重試，也不計入斷路
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Any, Callable, Deque
+from urllib.parse import urlsplit
+
+import requests
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """端點斷路中且沒有快取資料可用"""
+
+
+class LatencyTracker:
+    """單一端點最近 window 次請求的延遲統計"""
+
+    def __init__(self, window: int = 100):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """取得延遲的百分位數 (q 介於 0~100)，沒有樣本時回傳 None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """斷路器
+
+    - closed: 正常送出請求
+    - open: 連續失敗 failure_threshold 次後斷路，reset_timeout 秒內不送出請求
+    - half_open: 冷卻結束後只允許一個試探請求，成功則恢復，失敗則再次斷路
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """是否允許送出請求"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            # 冷卻結束: 允許一個試探請求
+            self._state = self.HALF_OPEN
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self) -> None:
+        """結束請求但不計入成功或失敗 (呼叫端錯誤)，冷卻結束後可再送出試探請求"""
+        with self._lock:
+            self._probing = False
+
+
+class RequestExecutor:
+    """以端點為單位管理延遲、逾時、重試、對沖與斷路的請求執行器
+
+    可用環境變數調整: STOCK_REQUEST_RETRIES (重試次數)、STOCK_REQUEST_HEDGE (是否對沖，1/0)、
+    STOCK_CIRCUIT_THRESHOLD (斷路前的連續失敗次數)、STOCK_CIRCUIT_RESET (斷路冷卻秒數)
+    """
+
+    # 可重試的 HTTP 狀態碼
+    RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+    # 可重試的例外 (連線錯誤與逾時)
+    RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    # 呼叫端錯誤 (URL、參數或標頭無效): 與端點狀態無關，不計入斷路
+    CALLER_EXCEPTIONS = (ValueError, TypeError, requests.exceptions.URLRequired)
+
+    def __init__(self, max_retries: Optional[int] = None, backoff_base: float = 0.5,
+                 backoff_max: float = 4.0, min_timeout: float = 2.0, max_timeout: float = 15.0,
+                 timeout_multiplier: float = 3.0, min_samples: int = 20, hedge: Optional[bool] = None,
+                 failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None,
+                 hedge_workers: Optional[int] = None):
+        """
+        初始化請求執行器
+
+        Args:
+            max_retries: 最多重試次數，預設為環境變數 STOCK_REQUEST_RETRIES 或 2
+            backoff_base: 退避基準秒數 (第 n 次重試最多等待 base * 2^n 秒)
+            backoff_max: 單次退避最長秒數
+            min_timeout: 自適應逾時下限
+            max_timeout: 自適應逾時上限 (呼叫端指定的 timeout 也作為上限)
+            timeout_multiplier: 逾時為 p99 延遲的倍數
+            min_samples: 累積多少樣本後才啟用自適應逾時與對沖
+            hedge: 是否啟用對沖請求，預設為環境變數 STOCK_REQUEST_HEDGE 或啟用
+            failure_threshold: 斷路前的連續失敗次數，預設為環境變數 STOCK_CIRCUIT_THRESHOLD 或 5
+            reset_timeout: 斷路冷卻秒數，預設為環境變數 STOCK_CIRCUIT_RESET 或 30
+            hedge_workers: 送出請求 (含對沖請求) 的執行緒數，預設為 STOCK_FETCH_WORKERS 的兩倍，
+                讓每個並行下載的執行緒都能同時有一個請求與一個對沖請求
+        """
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("STOCK_REQUEST_RETRIES", "2"))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.hedge = hedge if hedge is not None else os.getenv("STOCK_REQUEST_HEDGE", "1") == "1"
+        self.failure_threshold = (failure_threshold if failure_threshold is not None
+                                  else int(os.getenv("STOCK_CIRCUIT_THRESHOLD", "5")))
+        self.reset_timeout = (reset_timeout if reset_timeout is not None
+                              else float(os.getenv("STOCK_CIRCUIT_RESET", "30")))
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        if hedge_workers is None:
+            hedge_workers = 2 * max(int(os.getenv("STOCK_FETCH_WORKERS", "4")), 1)
+        self.hedge_workers = hedge_workers
+        self._pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='hedge')
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        """端點名稱 (主機 + 路徑)"""
+        parts = urlsplit(url)
+        return f"{parts.netloc}{parts.path}"
+
+    def _tracker(self, endpoint: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._latency.get(endpoint)
+            if tracker is None:
+                tracker = self._latency[endpoint] = LatencyTracker()
+            return tracker
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        """取得 (或建立) 某端點的斷路器"""
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def timeout_for(self, endpoint: str, requested: Optional[float] = None) -> float:
+        """
+        計算某端點的逾時秒數
+
+        樣本足夠時為 p99 延遲的 timeout_multiplier 倍 (介於 min_timeout 與上限之間)，
+        否則使用上限；上限為呼叫端指定的 timeout 與 max_timeout 中較小者
+        """
+        upper = min(requested, self.max_timeout) if requested else self.max_timeout
+        tracker = self._tracker(endpoint)
+        if len(tracker) < self.min_samples:
+            return upper
+        p99 = tracker.percentile(99)
+        return max(min(p99 * self.timeout_multiplier, upper), min(self.min_timeout, upper))
+
+    def _backoff(self, attempt: int) -> float:
+        """隨機抖動的指數退避秒數 (full jitter)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, session: requests.Session, url: str, timeout: Optional[float] = None,
+            **kwargs) -> requests.Response:
+        """
+        經由 session 送出 GET 請求
+
+        Args:
+            session: requests.Session (若提供 get_stale(url, params) 則斷路或失敗時回傳快取資料)
+            url: 請求 URL
+            timeout: 呼叫端要求的逾時秒數 (作為自適應逾時的上限)
+            **kwargs: 傳給 session.get 的其他參數
+
+        Returns:
+            requests.Response；失敗而使用快取資料時 response.stale 為 True
+
+        Raises:
+            CircuitOpenError: 端點斷路中且沒有快取資料
+            requests.exceptions.RequestException: 重試後仍失敗且沒有快取資料
+        """
+        endpoint = self.endpoint(url)
+        breaker = self.breaker(endpoint)
+        tracker = self._tracker(endpoint)
+
+        if not breaker.allow():
+            stale = self._stale(session, url, kwargs.get('params'))
+            if stale is not None:
+                return stale
+            raise CircuitOpenError(f"{endpoint} 暫時無法連線 (斷路中)")
+
+        error: Optional[BaseException] = None
+        response: Optional[requests.Response] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self._backoff(attempt - 1))
+
+            request_timeout = self.timeout_for(endpoint, timeout)
+            started = time.monotonic()
+            try:
+                response = self._send(lambda: session.get(url, timeout=request_timeout, **kwargs), tracker)
+            except self.RETRY_EXCEPTIONS as e:
+                error, response = e, None
+                continue
+            except self.CALLER_EXCEPTIONS:
+                # 呼叫端錯誤: 不重試，也不計入斷路
+                breaker.release()
+                raise
+            except Exception as e:
+                # 其他錯誤不重試
+                error, response = e, None
+                break
+
+            if getattr(response, 'from_cache', False):
+                # 快取回應不代表端點狀態: 不計入延遲與斷路 (半開時不因快取回應而恢復)
+                breaker.release()
+                return response
+            tracker.record(time.monotonic() - started)
+            if response.status_code in self.RETRY_STATUS:
+                error = requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+                continue
+
+            breaker.record_success()
+            return response
+
+        breaker.record_failure()
+        stale = self._stale(session, url, kwargs.get('params'))
+        if stale is not None:
+            return stale
+        if response is not None:
+            return response
+        raise error
+
+    def _send(self, send: Callable[[], requests.Response], tracker: LatencyTracker) -> requests.Response:
+        """送出請求；超過 p95 延遲仍未回應時再送出一個相同請求，採用先成功者
+
+        對沖延遲由請求實際開始送出時起算，在執行緒池中排隊的時間不計入
+        """
+        if not self.hedge or len(tracker) < self.min_samples:
+            return send()
+
+        hedge_delay = tracker.percentile(95)
+        started = threading.Event()
+
+        def send_first() -> requests.Response:
+            started.set()
+            return send()
+
+        first = self._pool.submit(send_first)
+        started.wait()
+        done, _ = wait([first], timeout=hedge_delay)
+        if done:
+            return first.result()
+
+        second = self._pool.submit(send)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @staticmethod
+    def _stale(session: requests.Session, url: str, params: Optional[Dict[str, Any]]) -> Optional[requests.Response]:
+        """取得快取資料 (可能已過期)"""
+        get_stale = getattr(session, 'get_stale', None)
+        if get_stale is None:
+            return None
+        return get_stale(url, params=params)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各端點的延遲、逾時與斷路器狀態"""
+        with self._lock:
+            endpoints = sorted(set(self._latency) | set(self._breakers))
+        result = {}
+        for endpoint in endpoints:
+            tracker = self._tracker(endpoint)
+            p50, p95, p99 = (tracker.percentile(q) for q in (50, 95, 99))
+            result[endpoint] = {
+                'samples': len(tracker),
+                'p50': round(p50, 3) if p50 is not None else None,
+                'p95': round(p95, 3) if p95 is not None else None,
+                'p99': round(p99, 3) if p99 is not None else None,
+                'timeout': round(self.timeout_for(endpoint), 3),
+                'circuit': self.breaker(endpoint).state,
+            }
+        return result
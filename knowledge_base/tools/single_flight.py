@@ -0,0 +1,99 @@
+"""單一請求合併 (single-flight) 與快取統計模組
+
+多個執行緒 (或多個 Agent 對話) 同時請求同一個 URL 或同一檔股票時，
+只由第一個執行緒實際發出請求，其餘執行緒等待並共用同一份結果。
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class CacheStats:
+    """快取命中統計 (執行緒安全)
+
+    - hits: 直接由快取取得
+    - misses: 需要實際下載
+    - coalesced: 等待其他執行緒進行中的下載並共用結果
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def record_coalesced(self) -> None:
+        with self._lock:
+            self.coalesced += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        """取得目前的統計數字"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+    def reset(self) -> None:
+        """重設統計數字"""
+        with self._lock:
+            self.hits = self.misses = self.coalesced = 0
+
+
+class _Call:
+    """進行中的請求"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """相同 key 的並行呼叫只執行一次，其餘呼叫共用結果 (或例外)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        執行 func，若相同 key 已有進行中的呼叫則等待其結果
+
+        Args:
+            key: 請求識別 (如 URL)
+            func: 實際執行請求的函數
+
+        Returns:
+            (結果, 是否共用其他執行緒的結果)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
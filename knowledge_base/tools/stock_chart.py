@@ -110,18 +110,6 @@ class StockChartGenerator:
         self.show_chart = show_chart
         os.makedirs(output_dir, exist_ok=True)
     
-    def _parse_date(self, date_str: str) -> datetime:
-        """解析民國年日期格式"""
-        try:
-            # 格式: 115/02/06
-            parts = date_str.split('/')
-            year = int(parts[0]) + 1911  # 民國年轉西元年
-            month = int(parts[1])
-            day = int(parts[2])
-            return datetime(year, month, day)
-        except:
-            return datetime.now()
-    
     def generate_price_chart(
         self,
         df: pd.DataFrame,
@@ -150,9 +138,9 @@ class StockChartGenerator:
         if df.empty:
             return ""
         
-        # 轉換日期
+        # 日期 (歷史數據以 DatetimeIndex 為索引)
         df = df.copy()
-        df['datetime'] = df['date'].apply(self._parse_date)
+        df['datetime'] = df.index
         
         # 創建圖表
         fig, axes = plt.subplots(4, 1, figsize=(14, 12),
@@ -446,9 +434,9 @@ class StockChartGenerator:
         if df.empty or 'predictions' not in predictions:
             return ""
 
-        # 轉換日期
+        # 日期 (歷史數據以 DatetimeIndex 為索引)
         df = df.copy()
-        df['datetime'] = df['date'].apply(self._parse_date)
+        df['datetime'] = df.index
 
         # 只使用最近 30 天的數據
         df_recent = df.tail(30).copy()
@@ -10,10 +10,19 @@ from langchain_core.tools import BaseTool
 from langchain_core.callbacks.manager import CallbackManagerForToolRun
 from pydantic import BaseModel, Field, ConfigDict
 
-from .twse_data import TWSEDataFetcher
+from .twse_data import get_shared_fetcher
 from .stock_chart import StockChartGenerator
 
 
+def _format_number(value: Any, signed: bool = False) -> str:
+    """格式化數值 (千分位；浮點數保留兩位小數)，非數值原樣輸出"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 'N/A' if value is None else str(value)
+    if isinstance(value, int):
+        return f"{value:+,}" if signed else f"{value:,}"
+    return f"{value:+,.2f}" if signed else f"{value:,.2f}"
+
+
 class StockPriceInput(BaseModel):
     """股票價格查詢工具的輸入模型"""
     stock_id: str = Field(description="台灣股票代碼，支援上市(TWSE)與上櫃(TPEx)股票。例如：2330（台積電-上市）、6488（環球晶-上櫃）")
@@ -38,7 +47,7 @@ class StockPriceTool(BaseTool):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.fetcher = TWSEDataFetcher()
+        self.fetcher = get_shared_fetcher()
     
     def _run(
         self,
@@ -78,14 +87,14 @@ class StockPriceTool(BaseTool):
             result = f"""
 📊 股票資訊 - {info.get('stock_id', stock_id)} {info.get('name', '')} [{market_name}]
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-💰 收盤價：{info.get('close', 'N/A')} 元
-📈 漲跌：{info.get('change', 'N/A')}
-📉 開盤價：{info.get('open', 'N/A')} 元
-⬆️ 最高價：{info.get('high', 'N/A')} 元
-⬇️ 最低價：{info.get('low', 'N/A')} 元
-📊 成交量：{info.get('trade_volume', 'N/A')} 股
-💵 成交金額：{info.get('trade_value', 'N/A')} 元
-🔄 成交筆數：{info.get('transaction', 'N/A')} 筆
+💰 收盤價：{_format_number(info.get('close'))} 元
+📈 漲跌：{_format_number(info.get('change'), signed=True)}
+📉 開盤價：{_format_number(info.get('open'))} 元
+⬆️ 最高價：{_format_number(info.get('high'))} 元
+⬇️ 最低價：{_format_number(info.get('low'))} 元
+📊 成交量：{_format_number(info.get('trade_volume'))} 股
+💵 成交金額：{_format_number(info.get('trade_value'))} 元
+🔄 成交筆數：{_format_number(info.get('transaction'))} 筆
 🏛️ 市場：{market_name}
 """
             return result.strip()
@@ -119,7 +128,7 @@ class TechnicalAnalysisTool(BaseTool):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.fetcher = TWSEDataFetcher()
+        self.fetcher = get_shared_fetcher()
     
     def _run(
         self,
@@ -160,9 +169,9 @@ class TechnicalAnalysisTool(BaseTool):
 📈 技術分析報告 - {analysis.get('stock_id', stock_id)} {analysis.get('name', '')} [{market_name}]
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-📊 當前價格：{analysis.get('current_price', 'N/A')} 元
-📉 漲跌：{analysis.get('change', 'N/A')}
-📊 成交量：{analysis.get('volume', 'N/A')} 股
+📊 當前價格：{_format_number(analysis.get('current_price'))} 元
+📉 漲跌：{_format_number(analysis.get('change'), signed=True)}
+📊 成交量：{_format_number(analysis.get('volume'))} 股
 """
             
             # 技術指標
@@ -221,7 +230,7 @@ class MarketSummaryTool(BaseTool):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.fetcher = TWSEDataFetcher()
+        self.fetcher = get_shared_fetcher()
 
     def _run(
         self,
@@ -229,10 +238,8 @@ class MarketSummaryTool(BaseTool):
     ) -> str:
         """執行大盤查詢"""
         try:
-            # 獲取上市加權指數
-            twse_summary = self.fetcher.get_market_summary('TWSE')
-            # 獲取上櫃指數
-            tpex_summary = self.fetcher.get_market_summary('TPEX')
+            # 並行獲取上市加權指數與上櫃指數
+            twse_summary, tpex_summary = self.fetcher.get_market_summaries(['TWSE', 'TPEX'])
 
             result = ""
 
@@ -242,11 +249,11 @@ class MarketSummaryTool(BaseTool):
 🏛️ 台灣加權指數 (上市)
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 📅 日期：{twse_summary.get('date', 'N/A')}
-📈 指數：{twse_summary.get('index', 'N/A')} 點
-📊 漲跌：{twse_summary.get('change', 'N/A')} 點
-📊 成交股數：{twse_summary.get('volume', 'N/A')}
-💵 成交金額：{twse_summary.get('value', 'N/A')}
-🔄 成交筆數：{twse_summary.get('transaction', 'N/A')}
+📈 指數：{_format_number(twse_summary.get('index'))} 點
+📊 漲跌：{_format_number(twse_summary.get('change'), signed=True)} 點
+📊 成交股數：{_format_number(twse_summary.get('volume'))}
+💵 成交金額：{_format_number(twse_summary.get('value'))}
+🔄 成交筆數：{_format_number(twse_summary.get('transaction'))}
 """
 
             # 上櫃指數
@@ -255,10 +262,10 @@ class MarketSummaryTool(BaseTool):
 🏛️ 櫃買指數 (上櫃)
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 📅 日期：{tpex_summary.get('date', 'N/A')}
-📈 指數：{tpex_summary.get('index', 'N/A')} 點
-📊 漲跌：{tpex_summary.get('change', 'N/A')} 點
-📊 成交股數：{tpex_summary.get('volume', 'N/A')}
-💵 成交金額：{tpex_summary.get('value', 'N/A')}
+📈 指數：{_format_number(tpex_summary.get('index'))} 點
+📊 漲跌：{_format_number(tpex_summary.get('change'), signed=True)} 點
+📊 成交股數：{_format_number(tpex_summary.get('volume'))}
+💵 成交金額：{_format_number(tpex_summary.get('value'))}
 """
 
             if not result:
@@ -298,7 +305,7 @@ class StockChartTool(BaseTool):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.fetcher = TWSEDataFetcher()
+        self.fetcher = get_shared_fetcher()
         self.chart_generator = StockChartGenerator(show_chart=True)
 
     def _run(
@@ -346,7 +353,7 @@ class StockChartTool(BaseTool):
                 return f"無法獲取 {stock_id} 的歷史數據"
 
             # 計算技術指標
-            df = self.fetcher.calculate_technical_indicators(df)
+            df = self.fetcher.calculate_technical_indicators(df, stock_id=stock_id)
 
             # 計算支撐壓力位
             sr = self.fetcher.calculate_support_resistance(df)
@@ -420,7 +427,7 @@ class TradingSignalTool(BaseTool):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.fetcher = TWSEDataFetcher()
+        self.fetcher = get_shared_fetcher()
 
     def _run(
         self,
@@ -454,18 +461,16 @@ class TradingSignalTool(BaseTool):
             # 獲取股票資訊
             info = self.fetcher.get_stock_info(stock_id)
             stock_name = info.get('name', '')
-            current_price = info.get('close', 'N/A')
+            current_price = _format_number(info.get('close'))
 
             # 獲取歷史數據並計算指標
-            df = self.fetcher.get_stock_history(stock_id, months=3)
+            df = self.fetcher.get_history_with_indicators(stock_id)
 
             if df.empty:
                 return f"無法獲取 {stock_id} 的歷史數據"
 
-            df = self.fetcher.calculate_technical_indicators(df)
-
-            # 計算支撐壓力位
-            sr = self.fetcher.calculate_support_resistance(df)
+            # 計算支撐壓力位 (含價格區間)
+            sr = self.fetcher.calculate_support_resistance(df, zones=True)
 
             # 生成交易訊號
             signals = self.fetcher.generate_trading_signals(df)
@@ -515,6 +520,15 @@ class TradingSignalTool(BaseTool):
                 for s in support[:3]:
                     result += f"   📍 {s:.2f}\n"
 
+            # 多次觸及的價格區間 (取最接近當前價格的 3 個)
+            zones = [z for z in sr.get('zones', []) if z['touches'] >= 2]
+            if zones:
+                price = sr.get('current_price', 0)
+                result += "\n🧱 價格區間 (觸及次數):\n"
+                for z in sorted(zones, key=lambda z: abs(z['price'] - price))[:3]:
+                    zone_type = '壓力' if z['type'] == 'resistance' else '支撐'
+                    result += f"   {zone_type} {z['low']:.2f} ~ {z['high']:.2f} ({z['touches']} 次)\n"
+
             return result.strip()
 
         except Exception as e:
@@ -552,7 +566,7 @@ class StockPredictionTool(BaseTool):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.fetcher = TWSEDataFetcher()
+        self.fetcher = get_shared_fetcher()
         self.chart_generator = StockChartGenerator(show_chart=True)
 
     def _run(
@@ -596,14 +610,11 @@ class StockPredictionTool(BaseTool):
             info = self.fetcher.get_stock_info(stock_id)
             stock_name = info.get('name', '')
 
-            # 獲取歷史數據
-            df = self.fetcher.get_stock_history(stock_id, months=3)
+            # 獲取歷史數據並計算技術指標
+            df = self.fetcher.get_history_with_indicators(stock_id)
             if df.empty:
                 return f"無法獲取 {stock_id} 的歷史數據"
 
-            # 計算技術指標
-            df = self.fetcher.calculate_technical_indicators(df)
-
             # 預測走勢
             prediction = self.fetcher.predict_future_trend(df, days=days)
 
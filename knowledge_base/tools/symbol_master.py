@@ -0,0 +1,188 @@
+"""股票代碼主檔模組 - 上市/上櫃全部股票的代碼、名稱、市場、產業與交易狀態
+
+每日 (max_age) 由交易所 OpenAPI 更新一次並儲存於本地，載入後以代碼建立記憶體索引，
+判斷股票屬於上市或上櫃、查詢股票名稱時不需再連網。
+"""
+
+import os
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, List, Any, Callable
+
+from .history_store import get_stock_data_directory
+
+
+class Symbol:
+    """單一股票資料"""
+
+    __slots__ = ('code', 'name', 'market', 'industry', 'status')
+
+    # 交易狀態
+    ACTIVE = 'ACTIVE'       # 最新全市場行情中有報價
+    INACTIVE = 'INACTIVE'   # 在公司基本資料中，但沒有最新報價 (如停止交易)
+
+    def __init__(self, code: str, name: str, market: str, industry: str = '', status: str = ACTIVE):
+        self.code = code
+        self.name = name
+        self.market = market
+        self.industry = industry
+        self.status = status
+
+    def to_list(self) -> List[str]:
+        return [self.code, self.name, self.market, self.industry, self.status]
+
+    def __repr__(self) -> str:
+        return f"Symbol({self.code} {self.name} {self.market} {self.industry} {self.status})"
+
+
+def _pick(item: Dict[str, Any], *keys: str) -> str:
+    """依序取第一個存在的欄位 (OpenAPI 欄位名稱有中英文兩種)"""
+    for key in keys:
+        value = item.get(key)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+class SymbolMaster:
+    """股票代碼主檔
+
+    資料來源 (每個來源一次請求):
+    - TWSE 上市公司基本資料 (t187ap03_L): 名稱、產業別
+    - TWSE 全市場每日收盤行情 (STOCK_DAY_ALL): 含 ETF 等所有上市證券
+    - TPEx 上櫃公司基本資料 (t187ap03_O): 名稱、產業別
+    - TPEx 上櫃股票行情 (tpex_mainboard_quotes): 所有上櫃證券
+    """
+
+    TWSE_OPENAPI_URL = "https://openapi.twse.com.tw/v1"
+    TPEX_OPENAPI_URL = "https://www.tpex.org.tw/openapi/v1"
+
+    # 更新失敗後再次嘗試的間隔秒數
+    RETRY_INTERVAL = 3600
+
+    def __init__(self, fetch_json: Callable[[str], Optional[Any]], path: Optional[str] = None,
+                 max_age: float = 24 * 3600):
+        """
+        初始化代碼主檔
+
+        Args:
+            fetch_json: 下載並解析 JSON 的函數，失敗時回傳 None
+            path: 本地主檔路徑，預設為 {STOCK_DATA_DIRECTORY}/symbol_master.json
+            max_age: 主檔有效秒數，超過時於下次查詢前更新
+        """
+        if path is None:
+            path = os.path.join(get_stock_data_directory(), 'symbol_master.json')
+        self.path = path
+        self.max_age = max_age
+        self._fetch_json = fetch_json
+        self._lock = threading.Lock()
+        self._index: Dict[str, Symbol] = {}
+        self._loaded = False
+        self._updated: Optional[datetime] = None
+        self._refresh_attempted: Optional[float] = None
+
+    def lookup(self, code: str) -> Optional[Symbol]:
+        """
+        以股票代碼查詢 (O(1))
+
+        Returns:
+            Symbol，不存在時回傳 None
+        """
+        self._ensure_fresh()
+        return self._index.get(code)
+
+    def symbols(self, market: Optional[str] = None) -> List[Symbol]:
+        """取得所有 (或某市場的) 股票"""
+        self._ensure_fresh()
+        return [s for s in self._index.values() if market is None or s.market == market]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def refresh(self) -> bool:
+        """立即由交易所更新主檔 (如收盤後預先更新)，回傳是否成功"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._refresh_attempted = time.monotonic()
+            return self._refresh()
+
+    def _fresh(self) -> bool:
+        """主檔是否在有效期間內，或更新失敗後尚未到重試時間"""
+        if self._updated is not None and (datetime.now() - self._updated).total_seconds() < self.max_age:
+            return True
+        return (self._refresh_attempted is not None
+                and time.monotonic() - self._refresh_attempted < self.RETRY_INTERVAL)
+
+    def _ensure_fresh(self) -> None:
+        """確保主檔已載入且在有效期間內"""
+        if self._loaded and self._fresh():
+            return
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if not self._fresh():
+                self._refresh_attempted = time.monotonic()
+                self._refresh()
+
+    def _load(self) -> None:
+        """由本地檔案載入"""
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._index = {row[0]: Symbol(*row) for row in data['symbols']}
+            self._updated = datetime.fromisoformat(data['updated'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _refresh(self) -> bool:
+        """由交易所 OpenAPI 更新，失敗時保留原有資料"""
+        index: Dict[str, Symbol] = {}
+
+        twse_companies = self._fetch_json(f"{self.TWSE_OPENAPI_URL}/opendata/t187ap03_L") or []
+        twse_quotes = self._fetch_json(f"{self.TWSE_OPENAPI_URL}/exchangeReport/STOCK_DAY_ALL") or []
+        tpex_companies = self._fetch_json(f"{self.TPEX_OPENAPI_URL}/mopsfe_opendata_t187ap03_O") or []
+        tpex_quotes = self._fetch_json(f"{self.TPEX_OPENAPI_URL}/tpex_mainboard_quotes") or []
+
+        for market, companies, quotes in (('TWSE', twse_companies, twse_quotes),
+                                          ('TPEX', tpex_companies, tpex_quotes)):
+            for item in companies:
+                code = _pick(item, '公司代號', 'SecuritiesCompanyCode', 'CompanyCode')
+                if code:
+                    index[code] = Symbol(code, _pick(item, '公司簡稱', 'CompanyAbbreviation', 'CompanyName'),
+                                         market, _pick(item, '產業別', 'SecuritiesIndustryCode'), Symbol.INACTIVE)
+            for item in quotes:
+                code = _pick(item, 'Code', 'SecuritiesCompanyCode')
+                if not code:
+                    continue
+                symbol = index.get(code)
+                if symbol is None or symbol.market != market:
+                    index[code] = Symbol(code, _pick(item, 'Name', 'CompanyName'), market)
+                else:
+                    symbol.status = Symbol.ACTIVE
+
+        # 任一市場的行情下載失敗時不覆蓋既有主檔，避免誤判市場
+        if not twse_quotes or not tpex_quotes:
+            return False
+
+        self._index = index
+        self._updated = datetime.now()
+        self._save()
+        return True
+
+    def _save(self) -> None:
+        """寫入本地檔案"""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'updated': self._updated.isoformat(timespec='seconds'),
+                           'symbols': [s.to_list() for s in self._index.values()]},
+                          f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
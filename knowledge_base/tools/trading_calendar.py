@@ -0,0 +1,185 @@
+"""交易日曆模組 - 由 TWSE FMTQIK 每月市場成交資訊建立
+
+FMTQIK 每月回傳當月每個交易日一列，因此可直接得知國定假日、颱風假等休市日，
+不需要維護寫死的假日清單。TWSE 與 TPEx 的休市日相同，兩個市場共用同一份日曆。
+"""
+
+import threading
+import time
+from datetime import datetime, date, timedelta
+from typing import Optional, Dict, List, Tuple, Callable
+
+
+Month = Tuple[int, int]
+
+
+def months_back(now: datetime, months: int) -> List[Month]:
+    """
+    回傳從本月往前的 months 個月份 (由新到舊)，以日曆月份計算
+
+    Args:
+        now: 目前時間
+        months: 月份數
+
+    Returns:
+        [(year, month), ...]
+    """
+    result = []
+    year, month = now.year, now.month
+    for _ in range(max(months, 1)):
+        result.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return result
+
+
+class TradingCalendar:
+    """交易日曆
+
+    - 已結束的月份: 以 FMTQIK 的交易日為準，快取於記憶體 (FMTQIK 回應本身由 HTTP 快取永久保存)
+    - 本月: FMTQIK 已公布的交易日，加上最後公布日之後到今天為止的平日 (可能尚未公布)；
+      FMTQIK 只在每日收盤資料公布後更新，因此在下一次公布時間之前不需重新查詢
+    - 無法取得 FMTQIK 時退回以平日判斷
+    """
+
+    # 收盤資料公布完成時間 (之後當日行情才完整)
+    DATA_READY_HOUR = 15
+
+    def __init__(self, fetch_month: Callable[[int, int], Optional[List[date]]], live_ttl: float = 600,
+                 retry_interval: float = 60):
+        """
+        Args:
+            fetch_month: 取得某月交易日清單的函數 (year, month) -> [date]，失敗時回傳 None
+            live_ttl: 本月交易日清單在記憶體中的最短有效秒數
+            retry_interval: 取得失敗後，在此秒數內以平日推估而不重新查詢
+        """
+        self._fetch_month = fetch_month
+        self.live_ttl = live_ttl
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._months: Dict[Month, List[date]] = {}
+        # 本月: (已公布的交易日, 取得時間 (monotonic), 取得時間 (datetime))
+        self._live: Dict[Month, Tuple[List[date], float, datetime]] = {}
+        # 取得失敗的月份: 失敗時間 (monotonic)
+        self._failed: Dict[Month, float] = {}
+
+    def trading_days(self, year: int, month: int, now: Optional[datetime] = None) -> List[date]:
+        """
+        取得某月可能有成交資料的交易日 (不含未來日期)
+
+        Args:
+            year: 西元年
+            month: 月份
+            now: 目前時間
+
+        Returns:
+            依日期排序的交易日清單
+        """
+        now = now or datetime.now()
+        today = now.date()
+        if (year, month) > (today.year, today.month):
+            return []
+
+        month_closed = (year, month) < (today.year, today.month)
+        with self._lock:
+            cached = self._months.get((year, month))
+            live = self._live.get((year, month))
+            failed = self._failed.get((year, month))
+        if cached is not None:
+            return cached
+
+        if not month_closed and live is not None and self._live_valid(live, now):
+            published = live[0]
+        elif failed is not None and time.monotonic() - failed < self.retry_interval:
+            published = None
+        else:
+            published = self._fetch_month(year, month)
+            with self._lock:
+                if published is None:
+                    self._failed[(year, month)] = time.monotonic()
+                else:
+                    self._failed.pop((year, month), None)
+                    if not month_closed:
+                        self._live[(year, month)] = (published, time.monotonic(), now)
+
+        if published is None:
+            # 無法取得交易日資料: 以平日推估 (retry_interval 後重新查詢)
+            return [d for d in self._month_dates(year, month) if d <= today and d.weekday() < 5]
+
+        days = sorted(published)
+        if month_closed:
+            with self._lock:
+                self._months[(year, month)] = days
+            return days
+
+        # 本月: 最後公布日之後到今天為止的平日也可能有資料
+        days = [d for d in days if d <= today]
+        last = days[-1] if days else date(year, month, 1) - timedelta(days=1)
+        pending = [d for d in self._month_dates(year, month) if last < d <= today and d.weekday() < 5]
+        return days + pending
+
+    def _live_valid(self, live: Tuple[List[date], float, datetime], now: datetime) -> bool:
+        """本月交易日清單是否仍有效: 取得後未超過 live_ttl，或取得後尚未到下一次收盤資料公布時間"""
+        if time.monotonic() - live[1] < self.live_ttl:
+            return True
+        last_ready = now.replace(hour=self.DATA_READY_HOUR, minute=0, second=0, microsecond=0)
+        if now < last_ready:
+            last_ready -= timedelta(days=1)
+        return live[2] >= last_ready
+
+    def is_trading_day(self, day: date, now: Optional[datetime] = None) -> bool:
+        """是否為 (可能有成交資料的) 交易日"""
+        return day in self.trading_days(day.year, day.month, now)
+
+    def last_sessions(self, n: int, now: Optional[datetime] = None) -> List[date]:
+        """
+        取得最近 n 個資料已公布的交易日 (由舊到新)
+
+        今日在收盤資料公布 (DATA_READY_HOUR) 之前不列入
+
+        Args:
+            n: 交易日數
+            now: 目前時間
+
+        Returns:
+            交易日清單，長度最多為 n
+        """
+        now = now or datetime.now()
+        today = now.date()
+        sessions: List[date] = []
+        year, month = today.year, today.month
+        empty_months = 0
+
+        # 連續一年沒有交易日視為超出資料範圍
+        while len(sessions) < n and empty_months < 12:
+            days = [d for d in self.trading_days(year, month, now)
+                    if d < today or now.hour >= self.DATA_READY_HOUR]
+            empty_months = 0 if days else empty_months + 1
+            sessions = days + sessions
+            month -= 1
+            if month == 0:
+                year, month = year - 1, 12
+
+        return sessions[-n:] if n > 0 else []
+
+    def trading_days_between(self, start: date, end: date, now: Optional[datetime] = None) -> List[date]:
+        """取得 start ~ end (含) 之間的交易日"""
+        days = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            days.extend(d for d in self.trading_days(year, month, now) if start <= d <= end)
+            month += 1
+            if month == 13:
+                year, month = year + 1, 1
+        return days
+
+    @staticmethod
+    def _month_dates(year: int, month: int) -> List[date]:
+        """某月的所有日期"""
+        day = date(year, month, 1)
+        dates = []
+        while day.month == month:
+            dates.append(day)
+            day += timedelta(days=1)
+        return dates
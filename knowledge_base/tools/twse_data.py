@@ -1,11 +1,26 @@
 """TWSE/TPEx 台灣證券交易所與櫃買中心數據獲取模組"""
 
+import os
+import threading
 import requests
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Any, Tuple
-import time
-import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
+from typing import Optional, Dict, List, Any, Tuple, Callable
+
+from .history_store import HistoryStore, to_date, to_datetime_index
+from .indicator_cache import IndicatorCache
+from .indicator_engine import IndicatorEngine
+from .pivots import DEFAULT_PIVOT_WINDOW, DEFAULT_ZONE_TOLERANCE, pivot_mask, cluster_zones
+from .market_snapshot import DailySnapshot, DailySnapshotCache, QuoteTable
+from .rate_limit import HostRateLimiter, RateLimitedAdapter
+from .http_cache import CachedSession, ResponseCache
+from .trading_calendar import TradingCalendar, months_back
+from .single_flight import SingleFlight, CacheStats
+from .symbol_master import SymbolMaster
+from .request_executor import RequestExecutor
+from .replay import FixtureStore, RecordingAdapter, ReplayAdapter, get_http_mode
 
 
 class TWSEDataFetcher:
@@ -21,42 +36,258 @@ class TWSEDataFetcher:
     TWSE_BASE_URL = "https://www.twse.com.tw"
     TPEX_BASE_URL = "https://www.tpex.org.tw"
     TPEX_OPENAPI_URL = "https://www.tpex.org.tw/openapi/v1"
+    TWSE_OPENAPI_URL = "https://openapi.twse.com.tw/v1"
+
+    # get_stock_info_many 回傳的欄位 (與 get_stock_info 的鍵相同)
+    QUOTE_COLUMNS = ['name', 'market', 'market_name', 'date', 'trade_volume', 'trade_value',
+                     'open', 'high', 'low', 'close', 'change', 'transaction']
+    QUOTE_NUMERIC_COLUMNS = ['trade_volume', 'trade_value', 'open', 'high', 'low', 'close', 'change', 'transaction']
+
+    # 日 K 線的數值欄位 (漲跌另外處理)
+    NUMERIC_COLUMNS = ['volume', 'value', 'open', 'high', 'low', 'close', 'transaction']
+
+    # TPEx OpenAPI tpex_mainboard_quotes 的數值欄位: 欄位名稱 -> 原始欄位
+    TPEX_QUOTE_FIELDS = {
+        'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'change': 'Change',
+        'average': 'Average', 'trade_volume': 'TradingShares', 'trade_value': 'TransactionAmount',
+        'transaction': 'TransactionNumber', 'bid': 'LatestBidPrice', 'ask': 'LatesAskPrice',
+        'next_reference': 'NextReferencePrice', 'next_limit_up': 'NextLimitUp',
+        'next_limit_down': 'NextLimitDown',
+    }
+
+    # 大盤指數日資料的欄位
+    INDEX_COLUMNS = ['index', 'change', 'volume', 'value', 'transaction']
+    INDEX_NAMES = {'TWSE': '台灣加權指數', 'TPEX': '櫃買指數'}
+
+    # 技術指標所需的日 K 線數: MA60 加上 MACD (26/9 EMA) 的暖身期
+    INDICATOR_BARS = 60 + IndicatorEngine.WARMUP_BARS
+    # get_history_with_indicators 於回傳的 K 線之前另外讀取的 EMA 暖身 K 線數
+    INDICATOR_WARMUP = IndicatorEngine.WARMUP_BARS
+
+    # calculate_technical_indicators 的指標參數 (技術指標快取鍵的一部分)
+    INDICATOR_PARAMS = (('MA', 5, 10, 20, 60), ('RSI', 14), ('MACD', 12, 26, 9), ('KD', 9), ('BB', 20, 2))
 
     # 快取股票市場類型 (避免重複查詢)
     _market_cache: Dict[str, str] = {}
-    # 快取 TPEx 股票資料
-    _tpex_quotes_cache: Dict[str, Any] = {}
+    # 快取 TPEx 股票資料 (欄位式行情表)
+    _tpex_quotes_cache: QuoteTable = QuoteTable.empty()
     _tpex_quotes_cache_time: Optional[datetime] = None
+    # 快取大盤指數日資料: market -> DataFrame (依日期索引)，及已完整下載的 (market, 'YYYY-MM')
+    _index_cache: Dict[str, pd.DataFrame] = {}
+    _index_months: set = set()
+
+    # 快取鎖、進行中請求合併與命中統計 (所有實例共用)
+    _cache_lock = threading.Lock()
+    _single_flight = SingleFlight()
+    _cache_stats: Dict[str, CacheStats] = {
+        'http': CacheStats(),
+        'tpex_quotes': CacheStats(),
+        'market': CacheStats(),
+        'indicators': CacheStats(),
+        'index': CacheStats(),
+    }
+    # 快取技術指標: (stock_id, 最後一根 K 線, 最後收盤價, 參數) -> 計算結果 (LRU，位元組上限)
+    _indicator_cache = IndicatorCache(stats=_cache_stats['indicators'])
+
+    def __init__(self, history_store: Optional[HistoryStore] = None,
+                 tpex_snapshots: Optional[DailySnapshotCache] = None,
+                 rate_limiter: Optional[HostRateLimiter] = None,
+                 max_workers: Optional[int] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 symbol_master: Optional[SymbolMaster] = None,
+                 request_executor: Optional[RequestExecutor] = None,
+                 http_mode: Optional[str] = None,
+                 fixture_store: Optional[FixtureStore] = None,
+                 upstream: Optional[str] = None):
+        """
+        初始化數據獲取器
 
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
+        Args:
+            history_store: 本地歷史資料庫，預設使用 STOCK_DATA_DIRECTORY 下的 history.db
+            tpex_snapshots: TPEx 每日全市場行情快照快取
+            rate_limiter: 每個主機的請求速率限制器
+            max_workers: 並行下載的執行緒數，預設為環境變數 STOCK_FETCH_WORKERS 或 4
+            response_cache: HTTP 回應快取，預設使用 STOCK_DATA_DIRECTORY 下的 http_cache.db；
+                record/replay 模式不使用 (改用程序內的暫時快取)，請求才會經過錄製/重播，
+                重播的回應也不會寫入連網時的快取
+            symbol_master: 股票代碼主檔，預設使用 STOCK_DATA_DIRECTORY 下的 symbol_master.json
+            request_executor: 請求執行器 (自適應逾時、重試、對沖請求與斷路器)
+            http_mode: live (連網)、record (連網並錄製回應) 或 replay (由錄製的回應回應，不連網)，
+                預設為環境變數 STOCK_HTTP_MODE 或 live
+            fixture_store: 錄製/重播使用的 fixture，預設使用 STOCK_FIXTURE_DIRECTORY
+            upstream: 替代的交易所伺服器 (如 fixture_server)，預設為環境變數 STOCK_EXCHANGE_URL
+        """
+        self.rate_limiter = rate_limiter if rate_limiter is not None else HostRateLimiter()
+        self.max_workers = max_workers if max_workers is not None else int(os.getenv("STOCK_FETCH_WORKERS", "4"))
+        self.history_store = history_store if history_store is not None else HistoryStore()
+        self.tpex_snapshots = tpex_snapshots if tpex_snapshots is not None else DailySnapshotCache('TPEX')
+        self.http_mode = http_mode or get_http_mode()
+        if self.http_mode != 'live':
+            self.response_cache = ResponseCache(':memory:')
+        else:
+            self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.executor = (request_executor if request_executor is not None
+                         else RequestExecutor(hedge_workers=2 * max(self.max_workers, 1)))
+        self.fixture_store = fixture_store
+        if self.fixture_store is None and self.http_mode != 'live':
+            self.fixture_store = FixtureStore()
+        self.upstream = upstream if upstream is not None else os.getenv("STOCK_EXCHANGE_URL") or None
+        # 對沖請求在執行器的執行緒池送出，連線池須容納所有同時進行的請求，
+        # 否則取得速率限制 token 後仍會阻塞等待連線
+        self.pool_maxsize = max(getattr(self.executor, 'hedge_workers', 0), self.max_workers, 1)
+        self.session = self._create_session()
+        self.calendar = TradingCalendar(self._fetch_trading_days)
+        self.symbols = symbol_master if symbol_master is not None else SymbolMaster(self._fetch_json)
+
+    def _create_session(self) -> requests.Session:
+        """
+        建立 HTTP Session
+
+        - 依交易所端點快取回應 (過去月份/交易日永久快取)
+        - 實際送出請求時依主機套用速率限制
+        - 使用連線池並保持連線 (keep-alive)，每個主機的連線數與請求執行器送出請求的執行緒數
+          (含對沖請求) 相同，超過時等待既有連線釋放，而非另開新連線
+        - record 模式另將回應錄製為 fixture；replay 模式由 fixture 回應，不連網
+        """
+        session = CachedSession(cache=self.response_cache)
+        pool = dict(
+            pool_connections=4,                     # TWSE / TWSE OpenAPI / TPEx 等主機
+            pool_maxsize=self.pool_maxsize,         # 每個主機的連線上限
+            pool_block=True,
+        )
+        if self.http_mode == 'replay':
+            adapter = ReplayAdapter(self.fixture_store)
+        elif self.http_mode == 'record':
+            adapter = RecordingAdapter(self.fixture_store, self.rate_limiter, upstream=self.upstream, **pool)
+        else:
+            adapter = RateLimitedAdapter(self.rate_limiter, upstream=self.upstream, **pool)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
             'Accept': 'application/json, text/plain, */*',
             'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8',
+            'Connection': 'keep-alive',
         })
+        return session
+
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        """
+        發送 GET 請求 (經由回應快取，實際連網時依主機套用速率限制)
+
+        相同 URL 與參數的並行請求只會實際發出一次，其餘執行緒共用同一個回應。
+        請求由 RequestExecutor 執行: 依端點延遲調整逾時、失敗時重試，
+        端點不穩定時斷路並回傳快取資料 (response.stale 為 True)
+
+        統計 'http': 由回應快取取得為 hits，實際連網為 misses，共用其他執行緒的回應為 coalesced
+        """
+        params = kwargs.get('params')
+        key = (url, tuple(sorted(params.items())) if params else None)
+
+        response, shared = self._single_flight.do(key, lambda: self.executor.get(self.session, url, **kwargs))
+        if shared:
+            self._cache_stats['http'].record_coalesced()
+        elif getattr(response, 'from_cache', False):
+            self._cache_stats['http'].record_hit()
+        else:
+            self._cache_stats['http'].record_miss()
+        return response
+
+    def _fetch_json(self, url: str) -> Optional[Any]:
+        """下載 JSON 資料，失敗時回傳 None"""
+        try:
+            response = self._get(url, timeout=15)
+            if response.status_code == 200:
+                return response.json()
+        except Exception:
+            pass
+        return None
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        取得快取統計
+
+        Returns:
+            各快取的 hits / misses / coalesced 次數
+        """
+        stats = {name: stats.snapshot() for name, stats in self._cache_stats.items()}
+        if hasattr(self.session, 'cache_stats'):
+            stats['http_cache'] = self.session.cache_stats.snapshot()
+        return stats
+
+    def get_endpoint_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        取得各交易所端點的健康狀態
+
+        Returns:
+            端點 -> 延遲百分位數 (p50/p95/p99)、目前逾時秒數與斷路器狀態
+        """
+        return self.executor.snapshot()
+
+    def map_concurrently(self, func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """
+        以執行緒池並行執行請求，結果依 items 順序回傳
+
+        最多 max_workers 個執行緒，請求頻率由 rate_limiter 控制，因此總耗時趨近於交易所的速率上限。
+        預取等批次作業也經由此方法並行，與數據獲取器共用相同的並行上限
+
+        Args:
+            func: 對每個項目執行的函式
+            items: 項目列表
+
+        Returns:
+            func 的結果列表 (順序同 items)
+        """
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def _tpex_quotes_fresh(self) -> bool:
+        """TPEx 報價快取是否仍有效 (快取 10 分鐘)"""
+        cache_time = TWSEDataFetcher._tpex_quotes_cache_time
+        return bool(cache_time and (datetime.now() - cache_time).total_seconds() < 600
+                    and TWSEDataFetcher._tpex_quotes_cache)
 
     def _load_tpex_quotes(self) -> None:
-        """載入 TPEx 上櫃股票即時報價資料（使用 OpenAPI）"""
-        # 快取 10 分鐘
-        now = datetime.now()
-        if (self._tpex_quotes_cache_time and
-            (now - self._tpex_quotes_cache_time).seconds < 600 and
-            self._tpex_quotes_cache):
+        """載入 TPEx 上櫃股票即時報價資料（使用 OpenAPI）
+
+        多個執行緒同時載入時只會下載一次，其餘執行緒等待並共用結果
+        """
+        stats = self._cache_stats['tpex_quotes']
+        if self._tpex_quotes_fresh():
+            stats.record_hit()
             return
 
+        downloaded, shared = self._single_flight.do('tpex_mainboard_quotes', self._download_tpex_quotes)
+        if shared:
+            stats.record_coalesced()
+        elif downloaded:
+            stats.record_miss()
+        else:
+            stats.record_hit()
+
+    def _download_tpex_quotes(self) -> bool:
+        """下載 TPEx 上櫃股票報價並更新快取，回傳是否實際下載"""
+        # 可能在等待期間已被其他執行緒更新
+        if self._tpex_quotes_fresh():
+            return False
+
         try:
             url = f"{self.TPEX_OPENAPI_URL}/tpex_mainboard_quotes"
-            response = self.session.get(url, timeout=15)
+            response = self._get(url, timeout=15)
             if response.status_code == 200:
-                data = response.json()
-                self._tpex_quotes_cache = {
-                    item.get('SecuritiesCompanyCode'): item
-                    for item in data
-                }
-                self._tpex_quotes_cache_time = now
+                # 載入時即轉為欄位式數值，之後查詢不需再處理字串
+                quotes = QuoteTable.from_records(
+                    response.json(), code_field='SecuritiesCompanyCode', name_field='CompanyName',
+                    date_field='Date', numeric_fields=self.TPEX_QUOTE_FIELDS,
+                )
+                with self._cache_lock:
+                    TWSEDataFetcher._tpex_quotes_cache = quotes
+                    TWSEDataFetcher._tpex_quotes_cache_time = datetime.now()
         except Exception:
             pass
+        return True
 
     def _detect_market(self, stock_id: str) -> str:
         """
@@ -68,14 +299,38 @@ class TWSEDataFetcher:
         Returns:
             'TWSE' 或 'TPEX'
         """
+        stats = self._cache_stats['market']
+
         # 檢查快取
-        if stock_id in self._market_cache:
-            return self._market_cache[stock_id]
+        with self._cache_lock:
+            market = self._market_cache.get(stock_id)
+        if market is not None:
+            stats.record_hit()
+            return market
+
+        # 查詢代碼主檔 (不需連網)
+        symbol = self.symbols.lookup(stock_id)
+        if symbol is not None:
+            with self._cache_lock:
+                self._market_cache[stock_id] = symbol.market
+            stats.record_hit()
+            return symbol.market
+
+        # 主檔中沒有的代碼 (如剛上市)，才以網路查詢；同一檔股票的並行偵測只執行一次
+        market, shared = self._single_flight.do(('market', stock_id), lambda: self._lookup_market(stock_id))
+        if shared:
+            stats.record_coalesced()
+        else:
+            stats.record_miss()
+        return market
 
+    def _lookup_market(self, stock_id: str) -> str:
+        """實際查詢股票所屬市場並寫入快取"""
         # 載入 TPEx 報價資料並檢查
         self._load_tpex_quotes()
         if stock_id in self._tpex_quotes_cache:
-            self._market_cache[stock_id] = 'TPEX'
+            with self._cache_lock:
+                self._market_cache[stock_id] = 'TPEX'
             return 'TPEX'
 
         # 嘗試 TWSE API 確認
@@ -83,11 +338,12 @@ class TWSEDataFetcher:
             today = datetime.now()
             date_str = today.strftime("%Y%m%d")
             url = f"{self.TWSE_BASE_URL}/exchangeReport/STOCK_DAY?response=json&date={date_str}&stockNo={stock_id}"
-            response = self.session.get(url, timeout=5)
+            response = self._get(url, timeout=5)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('stat') == 'OK' and 'data' in data and len(data['data']) > 0:
-                    self._market_cache[stock_id] = 'TWSE'
+                    with self._cache_lock:
+                        self._market_cache[stock_id] = 'TWSE'
                     return 'TWSE'
         except Exception:
             pass
@@ -103,15 +359,145 @@ class TWSEDataFetcher:
             stock_id: 股票代碼，例如 "2330"（上市）或 "6488"（上櫃）
 
         Returns:
-            股票基本資訊字典
+            股票基本資訊字典；不論資料來源，價量欄位 (QUOTE_NUMERIC_COLUMNS) 皆為數值
+            (成交股數、金額、筆數為 int，價格與漲跌為 float)，缺值為 None
         """
         market = self._detect_market(stock_id)
 
+        # 最近一個交易日的資料已在本地 (如收盤後預先下載) 時不需連網
+        info = self._get_stored_stock_info(stock_id, market)
+        if info is not None:
+            return info
+
         if market == 'TPEX':
             return self._get_tpex_stock_info(stock_id)
         else:
             return self._get_twse_stock_info(stock_id)
 
+    def _get_stored_stock_info(self, stock_id: str, market: str) -> Optional[Dict[str, Any]]:
+        """由本地資料庫取得最近一個交易日的股票資訊，本地資料不是最新時回傳 None"""
+        symbol = self.symbols.lookup(stock_id)
+        if symbol is None or self.history_store.last_date(stock_id) is None:
+            return None
+
+        sessions = self.calendar.last_sessions(1)
+        if not sessions:
+            return None
+        day = sessions[-1]
+        bars = self.history_store.load_bars(stock_id, start=day, end=day)
+        if bars.empty:
+            return None
+
+        bar = bars.iloc[-1]
+
+        def value(col, integer=False):
+            return self._parse_quote_value(bar[col], integer)
+
+        return {
+            'stock_id': stock_id,
+            'name': symbol.name,
+            'market': market,
+            'market_name': '上櫃' if market == 'TPEX' else '上市',
+            'date': f"{day.year - 1911}/{day.month:02d}/{day.day:02d}",
+            'trade_volume': value('volume', integer=True),
+            'trade_value': value('value', integer=True),
+            'open': value('open'),
+            'high': value('high'),
+            'low': value('low'),
+            'close': value('close'),
+            'change': value('change'),
+            'transaction': value('transaction', integer=True),
+        }
+
+    def get_stock_info_many(self, stock_ids: List[str]) -> pd.DataFrame:
+        """
+        批次獲取多檔股票的最新行情（每個市場只需一次全市場請求）
+
+        上市使用 TWSE OpenAPI STOCK_DAY_ALL，上櫃使用 TPEx OpenAPI tpex_mainboard_quotes，
+        適合自選股、多檔比較等查詢
+
+        Args:
+            stock_ids: 股票代碼清單
+
+        Returns:
+            以 stock_id 為索引的 DataFrame，欄位同 QUOTE_COLUMNS，價量欄位為數值；
+            查無行情的股票不列入
+        """
+        stock_ids = list(dict.fromkeys(str(s).strip() for s in stock_ids if s))
+        markets = {stock_id: self._detect_market(stock_id) for stock_id in stock_ids}
+
+        twse_quotes = self._load_twse_quotes() if 'TWSE' in markets.values() else {}
+        if 'TPEX' in markets.values():
+            self._load_tpex_quotes()
+
+        index, rows = [], []
+        for stock_id in stock_ids:
+            if markets[stock_id] == 'TPEX':
+                item = self._tpex_quotes_cache.row(stock_id)
+                if item is None:
+                    continue
+                row = [item['name'], 'TPEX', '上櫃', self._format_roc_date(item['date'])]
+                row.extend(item.get(col) for col in self.QUOTE_NUMERIC_COLUMNS)
+            else:
+                item = twse_quotes.get(stock_id)
+                if item is None:
+                    continue
+                row = [item.get('Name', ''), 'TWSE', '上市', self._format_roc_date(item.get('Date', '')),
+                       item.get('TradeVolume'), item.get('TradeValue'), item.get('OpeningPrice'),
+                       item.get('HighestPrice'), item.get('LowestPrice'), item.get('ClosingPrice'),
+                       item.get('Change'), item.get('Transaction')]
+            if not row[0]:
+                symbol = self.symbols.lookup(stock_id)
+                row[0] = symbol.name if symbol is not None else ''
+            index.append(stock_id)
+            rows.append(row)
+
+        df = pd.DataFrame(rows, columns=self.QUOTE_COLUMNS, index=pd.Index(index, name='stock_id'))
+        for col in self.QUOTE_NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(
+                df[col].astype(str).str.replace(',', '', regex=False).str.strip(), errors='coerce'
+            )
+        return df
+
+    def _load_twse_quotes(self) -> Dict[str, Dict[str, Any]]:
+        """載入 TWSE 上市全市場每日收盤行情（使用 OpenAPI，經由 HTTP 快取）"""
+        data = self._fetch_json(f"{self.TWSE_OPENAPI_URL}/exchangeReport/STOCK_DAY_ALL") or []
+        return {item.get('Code'): item for item in data}
+
+    @staticmethod
+    def _format_roc_date(date_raw: str) -> str:
+        """轉換 OpenAPI 日期格式 (1150206 -> 115/02/06)"""
+        date_raw = str(date_raw or '')
+        if len(date_raw) >= 7 and '/' not in date_raw:
+            return f"{date_raw[:3]}/{date_raw[3:5]}/{date_raw[5:7]}"
+        return date_raw
+
+    @staticmethod
+    def _parse_quote_value(value: Any, integer: bool = False) -> Optional[Any]:
+        """
+        將行情欄位轉為數值 (交易所字串如 '12,345,678'、'+1.50'、'X0.00' 或數值)
+
+        Args:
+            value: 原始值
+            integer: 是否為成交股數、金額、筆數等整數欄位
+
+        Returns:
+            int 或 float；'--' (無成交)、空值或無法解析時回傳 None
+        """
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, str):
+            value = value.replace(',', '').strip().lstrip('X')
+            if value in ('', '--'):
+                return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        if np.isnan(number):
+            return None
+        return int(number) if integer else number
+
     def _get_twse_stock_info(self, stock_id: str) -> Dict[str, Any]:
         """獲取上市股票資訊 (TWSE)"""
         try:
@@ -119,34 +505,33 @@ class TWSEDataFetcher:
             date_str = today.strftime("%Y%m%d")
             url = f"{self.TWSE_BASE_URL}/exchangeReport/STOCK_DAY?response=json&date={date_str}&stockNo={stock_id}"
 
-            response = self.session.get(url, timeout=10)
+            response = self._get(url, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('stat') == 'OK' and 'data' in data and len(data['data']) > 0:
                     latest = data['data'][-1]
-                    # 從 title 提取股票名稱: "115年02月 2330 台積電           各日成交資訊"
+                    # 優先使用代碼主檔的名稱，否則從 title 提取:
+                    # "115年02月 2330 台積電           各日成交資訊"
+                    symbol = self.symbols.lookup(stock_id)
+                    name = symbol.name if symbol is not None else ''
                     title = data.get('title', '')
-                    name = ''
-                    if title:
+                    if not name and title:
                         parts = title.split()
                         if len(parts) >= 3:
                             name = parts[2]  # 取得股票名稱
 
-                    return {
+                    info = {
                         'stock_id': stock_id,
                         'name': name,
                         'market': 'TWSE',
                         'market_name': '上市',
                         'date': latest[0],
-                        'trade_volume': latest[1],
-                        'trade_value': latest[2],
-                        'open': latest[3],
-                        'high': latest[4],
-                        'low': latest[5],
-                        'close': latest[6],
-                        'change': latest[7],
-                        'transaction': latest[8]
                     }
+                    # 欄位順序: 日期, 成交股數, 成交金額, 開盤, 最高, 最低, 收盤, 漲跌, 成交筆數
+                    for i, col in enumerate(('trade_volume', 'trade_value', 'open', 'high', 'low',
+                                             'close', 'change', 'transaction'), start=1):
+                        info[col] = self._parse_quote_value(latest[i], integer=col in QuoteTable.INTEGER_COLUMNS)
+                    return info
             return {'error': '無法獲取股票資訊'}
         except Exception as e:
             return {'error': str(e)}
@@ -157,213 +542,384 @@ class TWSEDataFetcher:
             # 確保載入 TPEx 報價資料
             self._load_tpex_quotes()
 
-            if stock_id in self._tpex_quotes_cache:
-                item = self._tpex_quotes_cache[stock_id]
-                # OpenAPI 欄位:
-                # Date, SecuritiesCompanyCode, CompanyName, Close, Change, Open, High, Low,
-                # TradingShares, TransactionAmount, TransactionNumber, etc.
-
-                # 轉換日期格式 (1150206 -> 115/02/06)
-                date_raw = item.get('Date', '')
-                if len(date_raw) >= 7:
-                    date_str = f"{date_raw[:3]}/{date_raw[3:5]}/{date_raw[5:7]}"
-                else:
-                    date_str = date_raw
-
-                return {
+            item = self._tpex_quotes_cache.row(stock_id)
+            if item is not None:
+                info = {
                     'stock_id': stock_id,
-                    'name': item.get('CompanyName', ''),
+                    'name': item['name'],
                     'market': 'TPEX',
                     'market_name': '上櫃',
-                    'date': date_str,
-                    'trade_volume': item.get('TradingShares', 'N/A'),
-                    'trade_value': item.get('TransactionAmount', 'N/A'),
-                    'open': item.get('Open', 'N/A'),
-                    'high': item.get('High', 'N/A'),
-                    'low': item.get('Low', 'N/A'),
-                    'close': item.get('Close', 'N/A'),
-                    'change': item.get('Change', 'N/A'),
-                    'transaction': item.get('TransactionNumber', 'N/A')
+                    # 轉換日期格式 (1150206 -> 115/02/06)
+                    'date': self._format_roc_date(item['date']),
                 }
+                # 與上市及本地資料相同: 數值欄位為 int/float，缺值為 None
+                for col in self.QUOTE_NUMERIC_COLUMNS:
+                    info[col] = self._parse_quote_value(item.get(col), integer=col in QuoteTable.INTEGER_COLUMNS)
+                return info
             return {'error': '無法獲取股票資訊'}
         except Exception as e:
             return {'error': str(e)}
 
     def _get_tpex_stock_name(self, stock_id: str) -> str:
-        """獲取上櫃股票名稱 - 使用 OpenAPI 快取"""
+        """獲取上櫃股票名稱 - 優先使用代碼主檔，否則使用 OpenAPI 快取"""
+        symbol = self.symbols.lookup(stock_id)
+        if symbol is not None and symbol.name:
+            return symbol.name
         self._load_tpex_quotes()
-        if stock_id in self._tpex_quotes_cache:
-            return self._tpex_quotes_cache[stock_id].get('CompanyName', '')
-        return ''
+        item = self._tpex_quotes_cache.row(stock_id)
+        return item['name'] if item is not None else ''
     
-    def get_stock_history(self, stock_id: str, months: int = 3) -> pd.DataFrame:
+    def get_stock_history(self, stock_id: str, months: int = 3, bars: Optional[int] = None,
+                          start: Optional[Any] = None, end: Optional[Any] = None) -> pd.DataFrame:
         """
         獲取股票歷史數據（自動判斷上市/上櫃）
 
+        優先順序: start/end 日期區間 > bars > months
+
         Args:
             stock_id: 股票代碼
-            months: 獲取幾個月的數據
+            months: 獲取幾個月的數據 (未指定 bars 與 start 時使用)
+            bars: 獲取最近幾根日 K 線；依交易日曆只下載涵蓋這些交易日所需的月份/交易日
+            start: 起始日期 (含)，可為 date、datetime 或 'YYYY-MM-DD'；可跨多年
+            end: 結束日期 (含)，預設為今天
 
         Returns:
-            DataFrame 包含歷史價格數據
+            DataFrame 包含歷史價格數據，以交易日 (DatetimeIndex) 為索引
         """
-        market = self._detect_market(stock_id)
+        now = datetime.now()
 
-        if market == 'TPEX':
-            return self._get_tpex_stock_history(stock_id, months)
+        if start is not None:
+            start_day = to_date(start)
+            end_day = to_date(end) if end is not None else now.date()
+            if start_day > end_day:
+                return pd.DataFrame()
+            return self._get_history_range(stock_id, start_day, end_day, now)
+
+        if bars is not None:
+            sessions = self.calendar.last_sessions(bars, now=now)
+            if not sessions:
+                return pd.DataFrame()
+            df = self._get_history_range(stock_id, sessions[0], sessions[-1], now)
+            return df.tail(bars)
+
+        year, month = months_back(now, months)[-1]
+        return self._get_history_range(stock_id, date(year, month, 1), now.date(), now)
+
+    def get_history_with_indicators(self, stock_id: str, bars: Optional[int] = None) -> pd.DataFrame:
+        """
+        獲取最近 bars 根日 K 線並計算技術指標
+
+        指標由 bars + INDICATOR_WARMUP 根 K 線 (上市未滿時為全部歷史) 計算後取最後 bars 根，
+        結果等同 calculate_technical_indicators(最近 bars + INDICATOR_WARMUP 根).tail(bars)，
+        不因程序先前是否計算過而不同。
+        計算結果依 (股票代碼, 最後一根 K 線, 計算起點, 參數) 快取，同一輪對話的多個工具或之後追問同一檔股票
+        (或收盤後已預先計算) 不需重新計算；只新增一根 K 線且計算起點不變 (歷史不足 bars + INDICATOR_WARMUP 根)
+        時以串流指標引擎接續計算該根，否則由新的起點重新計算 (約 130 根，EMA 需由同一起點起算才會一致)
+
+        Args:
+            stock_id: 股票代碼
+            bars: K 線數，預設為 INDICATOR_BARS
+
+        Returns:
+            包含技術指標的 DataFrame
+        """
+        bars = bars or self.INDICATOR_BARS
+        history = self.get_stock_history(stock_id, bars=bars + self.INDICATOR_WARMUP)
+        if history.empty:
+            return history
+        df = history.tail(bars)
+
+        # 計算起點 (EMA 的初始值) 是快取鍵的一部分
+        seed = history.index[0]
+
+        def key(last: int, length: int) -> Tuple[Any, ...]:
+            return IndicatorCache.key(stock_id, df.index[last], df['close'].iloc[last],
+                                      ('history', bars, length, seed, self.INDICATOR_WARMUP, self.INDICATOR_PARAMS))
+
+        cached = self._indicator_cache.get(key(-1, len(df)))
+        if cached is not None:
+            return cached[0].copy()
+
+        # 只多了最後一根 K 線且計算起點相同: 接續前一次結果的引擎狀態
+        previous = None
+        if len(df) >= 2:
+            previous = (self._indicator_cache.peek(key(-2, len(df)))
+                        or self._indicator_cache.peek(key(-2, len(df) - 1)))
+        if previous is not None and previous[1].count >= 60:
+            engine = previous[1].copy()
+            last = df.iloc[-1]
+            row = df.iloc[[-1]].copy()
+            for col, value in engine.update(last['high'], last['low'], last['close'], df.index[-1]).items():
+                row[col] = value
+            frame = previous[0]
+            result = pd.concat([frame.iloc[len(frame) - len(df) + 1:], row])
         else:
-            return self._get_twse_stock_history(stock_id, months)
+            engine = IndicatorEngine()
+            result = engine.apply(history).tail(bars)
+        self._indicator_cache.put(key(-1, len(df)), (result, engine))
+        return result.copy()
 
-    def _get_twse_stock_history(self, stock_id: str, months: int = 3) -> pd.DataFrame:
-        """獲取上市股票歷史數據 (TWSE)"""
-        all_data = []
+    def update_indicator_state(self, stock_id: str) -> Dict[str, Any]:
+        """
+        以本地歷史資料庫中的 K 線更新串流技術指標狀態，並回傳最新一組指標
+
+        狀態儲存於歷史資料庫，只需計算上次更新之後新增的 K 線
+        (第一次或資料被覆寫時由最早的 K 線重新計算)
 
-        for i in range(months):
-            date = datetime.now() - timedelta(days=30 * i)
-            date_str = date.strftime("%Y%m%d")
+        Args:
+            stock_id: 股票代碼
 
-            try:
-                url = f"{self.TWSE_BASE_URL}/exchangeReport/STOCK_DAY?response=json&date={date_str}&stockNo={stock_id}"
-                response = self.session.get(url, timeout=10)
+        Returns:
+            date (最後交易日)、bars (累計 K 線數) 與各技術指標的值
+        """
+        state = self.history_store.load_indicator_state(stock_id)
+        engine = IndicatorEngine.from_dict(state) if state else IndicatorEngine()
+        start = engine.last_date + timedelta(days=1) if engine.last_date else None
+        new_bars = self.history_store.load_bars(stock_id, start=start)
+        if not new_bars.empty:
+            engine.update_frame(new_bars)
+            last_close = new_bars['close'].iloc[-1]
+            self.history_store.save_indicator_state(stock_id, engine.to_dict(),
+                                                    None if pd.isna(last_close) else float(last_close))
+        return {'date': engine.last_date, 'bars': engine.count, **engine.latest}
+
+    def _get_history_range(self, stock_id: str, start: date, end: date,
+                           now: Optional[datetime] = None) -> pd.DataFrame:
+        """獲取 start ~ end (含) 的歷史數據（自動判斷上市/上櫃）"""
+        now = now or datetime.now()
+        market = self._detect_market(stock_id)
 
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'data' in data:
-                        all_data.extend(data['data'])
+        if market == 'TPEX':
+            return self._get_tpex_stock_history(stock_id, start, end, now)
+        else:
+            return self._get_twse_stock_history(stock_id, start, end, now)
 
-                time.sleep(0.5)  # 避免請求過快
+    def _needs_fetch(self, market: str, stock_id: str, period: str, last_session: date) -> bool:
+        """
+        判斷某期間是否需要下載
 
-            except Exception:
-                continue
+        已完整下載的期間不需下載；尚未結束的期間若已下載過且本地已有該期間最後一個交易日的資料，也不需下載
+        """
+        status = self.history_store.period_status(market, stock_id, period)
+        if status is None:
+            return True
+        if status:
+            return False
+        return not self.history_store.has_bar(stock_id, last_session)
+
+    def _ready_sessions(self, start: date, end: date, now: datetime) -> List[date]:
+        """start ~ end 之間資料已公布的交易日"""
+        latest = self.calendar.last_sessions(1, now=now)
+        if not latest:
+            return []
+        return self.calendar.trading_days_between(start, min(end, latest[-1]), now=now)
+
+    def pending_periods(self, stock_id: str, start: date, end: date,
+                        now: Optional[datetime] = None) -> Tuple[str, List[str], int]:
+        """
+        取得 start ~ end 之間本地尚未儲存、需要下載的期間
 
-        if not all_data:
-            return pd.DataFrame()
+        Args:
+            stock_id: 股票代碼
+            start: 起始日期 (含)
+            end: 結束日期 (含)
+            now: 目前時間
 
-        # API 返回 10 個欄位：日期, 成交股數, 成交金額, 開盤價, 最高價, 最低價, 收盤價, 漲跌價差, 成交筆數, 註記
-        columns = ['date', 'volume', 'value', 'open', 'high', 'low', 'close', 'change', 'transaction', 'note']
+        Returns:
+            (市場, 需下載的期間清單, 期間總數)；上市以月份 (YYYY-MM)、上櫃以交易日 (YYYY-MM-DD) 為期間
+        """
+        now = now or datetime.now()
+        market = self._detect_market(stock_id)
+        sessions = self._ready_sessions(start, end, now)
 
-        # 轉換為 DataFrame
-        df = pd.DataFrame(all_data, columns=columns)
+        if market == 'TPEX':
+            periods = {day.isoformat(): day for day in sessions}
+        else:
+            # 依交易日曆將交易日分組為月份，以該月最後一個交易日判斷本地資料是否最新
+            periods = {}
+            for day in sessions:
+                periods[day.strftime("%Y-%m")] = day
 
-        # 移除註記欄位
-        df = df.drop(columns=['note'], errors='ignore')
+        missing = [period for period, last_session in periods.items()
+                   if self._needs_fetch(market, stock_id, period, last_session)]
+        return market, missing, len(periods)
 
-        # 數據清洗
-        df = self._clean_data(df)
+    def _get_twse_stock_history(self, stock_id: str, start: date, end: date, now: datetime) -> pd.DataFrame:
+        """獲取上市股票歷史數據 (TWSE) - 已收盤月份由本地資料庫讀取，缺少的月份並行下載"""
+        _, missing, _ = self.pending_periods(stock_id, start, end, now)
+        self.map_concurrently(lambda period: self._fetch_twse_month(stock_id, period, now), missing)
 
-        return df.drop_duplicates(subset=['date']).sort_values('date').reset_index(drop=True)
+        return self.history_store.load_bars(stock_id, start=start, end=end)
 
-    def _get_tpex_stock_history(self, stock_id: str, months: int = 3) -> pd.DataFrame:
-        """獲取上櫃股票歷史數據 (TPEx) - 使用 dailyQuotes API 逐日查詢"""
-        all_data = []
+    def _fetch_twse_month(self, stock_id: str, period: str, now: datetime) -> None:
+        """下載上市股票單月數據 (STOCK_DAY) 並寫入本地資料庫"""
+        try:
+            date_str = period.replace('-', '') + '01'
+            url = f"{self.TWSE_BASE_URL}/exchangeReport/STOCK_DAY?response=json&date={date_str}&stockNo={stock_id}"
+            response = self._get(url, timeout=10)
 
-        # 計算需要查詢的天數（約 months * 22 個交易日）
-        days_to_query = months * 30
+            if response.status_code == 200:
+                data = response.json()
+                if 'data' in data:
+                    # API 返回 10 個欄位：日期, 成交股數, 成交金額, 開盤價, 最高價, 最低價, 收盤價, 漲跌價差, 成交筆數, 註記
+                    columns = ['date', 'volume', 'value', 'open', 'high', 'low', 'close', 'change', 'transaction', 'note']
+                    df = pd.DataFrame(data['data'], columns=columns).drop(columns=['note'], errors='ignore')
+                    self.history_store.upsert_bars(stock_id, 'TWSE', self._clean_data(df))
+                # 查無資料 (如尚未上市) 的月份同樣記錄，避免重複查詢
+                self.history_store.mark_period_fetched(
+                    'TWSE', stock_id, period, complete=now.strftime("%Y-%m") > period
+                )
+        except Exception:
+            pass
 
-        # 從今天開始往回查詢
-        current_date = datetime.now()
+    def _get_tpex_stock_history(self, stock_id: str, start: date, end: date, now: datetime) -> pd.DataFrame:
+        """獲取上櫃股票歷史數據 (TPEx) - 使用 dailyQuotes 每日全市場快照，已下載的交易日由本地資料庫讀取"""
+        # 只查詢交易日曆上的交易日 (略過週末、國定假日與颱風假)
+        _, missing, _ = self.pending_periods(stock_id, start, end, now)
+        dates = [datetime.strptime(period, "%Y-%m-%d") for period in missing]
 
-        for i in range(days_to_query):
-            date = current_date - timedelta(days=i)
+        # 並行下載 (或由快取取得) 各日全市場快照
+        snapshots = self.map_concurrently(self._get_tpex_daily_snapshot, dates)
 
-            # 跳過週末
-            if date.weekday() >= 5:
+        for date, snapshot in zip(dates, snapshots):
+            if snapshot is None:
                 continue
 
-            # TPEx 使用民國年格式: 115/02/06
-            roc_year = date.year - 1911
-            date_str = f"{roc_year}/{date.month:02d}/{date.day:02d}"
+            # 以股票代碼索引直接取得目標股票
+            row = snapshot.get(stock_id)
+            if row is not None:
+                # 欄位順序: 代號, 名稱, 收盤, 漲跌, 開盤, 最高, 最低, 均價, 成交股數, 成交金額, 成交筆數, ...
+                df = pd.DataFrame([{
+                    'date': pd.Timestamp(date.date()),
+                    'open': row[4],      # 開盤
+                    'high': row[5],      # 最高
+                    'low': row[6],       # 最低
+                    'close': row[2],     # 收盤
+                    'change': row[3],    # 漲跌
+                    'volume': row[8],    # 成交股數
+                    'value': row[9],     # 成交金額
+                    'transaction': row[10] if len(row) > 10 else 'N/A'  # 成交筆數
+                }])
+                self.history_store.upsert_bars(stock_id, 'TPEX', self._clean_data(df))
+
+            # 無論當日是否有成交，都記錄已查詢 (休市日也不必再查)
+            self.history_store.mark_period_fetched(
+                'TPEX', stock_id, date.strftime("%Y-%m-%d"), complete=date.date() < now.date()
+            )
+
+        return self.history_store.load_bars(stock_id, start=start, end=end)
+
+    def _get_tpex_daily_snapshot(self, date: datetime) -> Optional[DailySnapshot]:
+        """
+        獲取 TPEx 單日全市場行情快照 (dailyQuotes)
 
-            try:
-                url = f"{self.TPEX_BASE_URL}/www/zh-tw/afterTrading/dailyQuotes"
-                params = {
-                    'date': date_str,
-                    'response': 'json'
-                }
-                response = self.session.get(url, params=params, timeout=10)
+        每日完整表格只下載一次，所有上櫃股票共用
 
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('tables') and len(data['tables']) > 0:
-                        table = data['tables'][0]
-                        rows = table.get('data', [])
-
-                        # 在所有股票中找出目標股票
-                        for row in rows:
-                            if row[0] == stock_id:
-                                # 欄位順序: 代號, 名稱, 收盤, 漲跌, 開盤, 最高, 最低, 均價, 成交股數, 成交金額, 成交筆數, ...
-                                all_data.append({
-                                    'date': date_str,
-                                    'open': row[4],      # 開盤
-                                    'high': row[5],      # 最高
-                                    'low': row[6],       # 最低
-                                    'close': row[2],     # 收盤
-                                    'change': row[3],    # 漲跌
-                                    'volume': row[8],    # 成交股數
-                                    'value': row[9],     # 成交金額
-                                    'transaction': row[10] if len(row) > 10 else 'N/A'  # 成交筆數
-                                })
-                                break
-
-                time.sleep(0.2)  # 避免請求過快
-
-            except Exception:
-                continue
+        Args:
+            date: 交易日
 
-        if not all_data:
-            return pd.DataFrame()
+        Returns:
+            DailySnapshot，請求失敗時回傳 None。沒有資料列的回應只在交易日曆確認為休市日時
+            保存為空快照，交易日的空白或錯誤回應 (限流等) 不保存，下次重新下載
+        """
+        day = date.date()
+        snapshot = self.tpex_snapshots.get(day)
+        if snapshot is not None:
+            return snapshot
+
+        # TPEx 使用民國年格式: 115/02/06
+        date_str = f"{date.year - 1911}/{date.month:02d}/{date.day:02d}"
+
+        try:
+            url = f"{self.TPEX_BASE_URL}/www/zh-tw/afterTrading/dailyQuotes"
+            params = {
+                'date': date_str,
+                'response': 'json'
+            }
+            response = self._get(url, params=params, timeout=10)
+            if response.status_code != 200:
+                return None
+
+            data = response.json()
+            rows = []
+            if isinstance(data, dict) and data.get('tables'):
+                rows = data['tables'][0].get('data') or []
+            if not rows and self.calendar.is_trading_day(day):
+                return None
+
+            return self.tpex_snapshots.put(day, rows, complete=day < datetime.now().date())
+        except Exception:
+            return None
 
-        # 轉換為 DataFrame
-        df = pd.DataFrame(all_data)
+    def _fetch_trading_days(self, year: int, month: int) -> Optional[List[date]]:
+        """
+        由 FMTQIK (每月市場成交資訊) 取得某月的交易日
 
-        # 數據清洗
-        df = self._clean_data(df)
+        Returns:
+            交易日清單；請求失敗或回應不是有效資料 (stat 不是 OK，如限流或錯誤頁面) 時回傳 None，
+            避免交易日曆將該月份記為沒有交易日
+        """
+        try:
+            url = f"{self.TWSE_BASE_URL}/exchangeReport/FMTQIK?response=json&date={year:04d}{month:02d}01"
+            response = self._get(url, timeout=10)
+            if response.status_code != 200:
+                return None
+            data = response.json()
+            if not isinstance(data, dict) or data.get('stat') != 'OK' or not isinstance(data.get('data'), list):
+                return None
+            days = []
+            for row in data['data']:
+                roc_year, m, d = str(row[0]).strip().split('/')
+                days.append(datetime(int(roc_year) + 1911, int(m), int(d)).date())
+            # FMTQIK 同時包含加權指數，一併存入大盤指數快取
+            self._store_index_rows('TWSE', year, month, data['data'])
+            return days
+        except Exception:
+            return None
 
-        return df.drop_duplicates(subset=['date']).sort_values('date').reset_index(drop=True)
-    
     def _clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        """清洗數據"""
+        """清洗數據
+
+        民國年日期字串一次轉為 datetime64；數值欄位 (含漲跌) 逐欄以字串運算移除千分位逗號，
+        再以 pd.to_numeric 轉為 float64。價量欄位的 '--' (無成交)、'X' 開頭 (除權息、不比價)
+        與其他無法解析的值為 NaN；漲跌的正負號直接由 to_numeric 解析，無法解析的值為 0
+        """
         df = df.copy()
-        
-        # 移除逗號並轉換數值
-        numeric_cols = ['volume', 'value', 'open', 'high', 'low', 'close', 'transaction']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.replace(',', '').str.replace('--', '0')
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # 處理漲跌
-        if 'change' in df.columns:
-            df['change'] = df['change'].astype(str).str.replace(',', '')
-            df['change'] = df['change'].apply(self._parse_change)
-        
+        if not df.empty and 'date' in df.columns:
+            df['date'] = to_datetime_index(df['date'])
+
+        for col in self.NUMERIC_COLUMNS + ['change']:
+            if col not in df.columns:
+                continue
+            text = df[col].astype(str).str.replace(',', '', regex=False).str.strip()
+            values = pd.to_numeric(text, errors='coerce').astype(np.float64)
+            df[col] = values.fillna(0.0) if col == 'change' else values
+
         return df
-    
-    def _parse_change(self, value: str) -> float:
-        """解析漲跌值"""
-        try:
-            value = str(value).strip()
-            if value.startswith('+'):
-                return float(value[1:])
-            elif value.startswith('-'):
-                return -float(value[1:])
-            elif value.startswith('X'):
-                return 0.0
-            else:
-                return float(value) if value else 0.0
-        except:
-            return 0.0
 
-    def calculate_technical_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
+    def calculate_technical_indicators(self, df: pd.DataFrame, stock_id: Optional[str] = None) -> pd.DataFrame:
         """
         計算技術指標
 
         Args:
             df: 包含 OHLCV 數據的 DataFrame
+            stock_id: 股票代碼；指定時計算結果依 (股票代碼, 最後一根 K 線, 資料範圍, 參數) 快取
 
         Returns:
             添加了技術指標的 DataFrame
         """
+        if stock_id is None or df.empty or len(df) < 20:
+            return self._compute_technical_indicators(df)
+
+        key = IndicatorCache.frame_key(stock_id, df, ('frame', df.index[0], len(df), self.INDICATOR_PARAMS))
+        cached = self._indicator_cache.get(key)
+        if cached is None:
+            cached = self._compute_technical_indicators(df)
+            self._indicator_cache.put(key, cached)
+        return cached.copy()
+
+    def _compute_technical_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
+        """計算技術指標 (不經快取)"""
         if df.empty or len(df) < 20:
             return df
 
@@ -430,7 +986,9 @@ class TWSEDataFetcher:
 
     def get_market_summary(self, market: str = 'TWSE') -> Dict[str, Any]:
         """
-        獲取大盤指數資訊
+        獲取大盤指數資訊 (最近一個交易日)
+
+        由大盤指數日資料快取取得，同一交易日內重複查詢不需連網
 
         Args:
             market: 'TWSE' (上市加權指數) 或 'TPEX' (上櫃指數)
@@ -438,64 +996,162 @@ class TWSEDataFetcher:
         Returns:
             大盤指數資訊
         """
-        if market.upper() == 'TPEX':
-            return self._get_tpex_market_summary()
-        else:
-            return self._get_twse_market_summary()
-
-    def _get_twse_market_summary(self) -> Dict[str, Any]:
-        """獲取上市加權指數 (TWSE)"""
+        market = 'TPEX' if market.upper() == 'TPEX' else 'TWSE'
         try:
-            url = f"{self.TWSE_BASE_URL}/exchangeReport/FMTQIK?response=json"
-            response = self.session.get(url, timeout=10)
-
-            if response.status_code == 200:
-                data = response.json()
-                # API 欄位順序：日期, 成交股數, 成交金額, 成交筆數, 發行量加權股價指數, 漲跌點數
-                if data.get('stat') == 'OK' and 'data' in data and len(data['data']) > 0:
-                    latest = data['data'][-1]
-                    return {
-                        'market': 'TWSE',
-                        'market_name': '台灣加權指數',
-                        'date': latest[0],           # 日期
-                        'volume': latest[1],         # 成交股數
-                        'value': latest[2],          # 成交金額
-                        'transaction': latest[3],    # 成交筆數
-                        'index': latest[4],          # 發行量加權股價指數
-                        'change': latest[5]          # 漲跌點數
-                    }
-            return {'error': '無法獲取大盤資訊'}
+            sessions = self.calendar.last_sessions(1)
+            if not sessions:
+                return {'error': f'無法獲取{self.INDEX_NAMES[market]}資訊'}
+            day = sessions[-1]
+            history = self.get_index_history(market, start=day.replace(day=1), end=day)
+            if history.empty:
+                # 本月資料尚未公布: 改用上個月
+                previous = day.replace(day=1) - timedelta(days=1)
+                history = self.get_index_history(market, start=previous.replace(day=1), end=day)
+            if history.empty:
+                return {'error': f'無法獲取{self.INDEX_NAMES[market]}資訊'}
+
+            latest = history.iloc[-1]
+            last_day = history.index[-1]
+            summary = {
+                'market': market,
+                'market_name': self.INDEX_NAMES[market],
+                'date': f"{last_day.year - 1911}/{last_day.month:02d}/{last_day.day:02d}",
+            }
+            for col in self.INDEX_COLUMNS:
+                value = latest[col]
+                if pd.isna(value):
+                    summary[col] = 'N/A'
+                elif col in ('volume', 'value', 'transaction'):
+                    summary[col] = int(value)
+                else:
+                    summary[col] = float(value)
+            return summary
         except Exception as e:
             return {'error': str(e)}
 
-    def _get_tpex_market_summary(self) -> Dict[str, Any]:
-        """獲取上櫃指數 (TPEx)"""
+    def get_market_summaries(self, markets: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        並行獲取多個市場的大盤指數資訊
+
+        Args:
+            markets: 市場清單，預設為 ['TWSE', 'TPEX']
+
+        Returns:
+            依 markets 順序的大盤指數資訊
+        """
+        return self.map_concurrently(self.get_market_summary, markets or ['TWSE', 'TPEX'])
+
+    def get_index_history(self, market: str = 'TWSE', start: Optional[Any] = None,
+                          end: Optional[Any] = None) -> pd.DataFrame:
+        """
+        獲取大盤指數日資料
+
+        每個月份只需一次請求 (上市為 FMTQIK，上櫃為 otc_idx_daily)，結果快取於記憶體:
+        已結束的月份不再下載，本月在有新的交易日資料公布前也不會重新下載
+
+        Args:
+            market: 'TWSE' (上市加權指數) 或 'TPEX' (上櫃指數)
+            start: 起始日期，預設為本月 1 日
+            end: 結束日期，預設為今天
+
+        Returns:
+            依日期索引的 DataFrame，欄位為 INDEX_COLUMNS
+        """
+        market = 'TPEX' if market.upper() == 'TPEX' else 'TWSE'
+        now = datetime.now()
+        end_day = to_date(end) if end is not None else now.date()
+        start_day = to_date(start) if start is not None else end_day.replace(day=1)
+        if start_day > end_day:
+            return pd.DataFrame(columns=self.INDEX_COLUMNS, index=pd.DatetimeIndex([], name='date'))
+
+        months = []
+        year, month = start_day.year, start_day.month
+        while (year, month) <= (end_day.year, end_day.month):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        missing = [m for m in months if self._index_month_pending(market, m[0], m[1], now)]
+        stats = self._cache_stats['index']
+        for _ in range(len(months) - len(missing)):
+            stats.record_hit()
+        for _ in missing:
+            stats.record_miss()
+        self.map_concurrently(lambda m: self._fetch_index_month(market, m[0], m[1], now), missing)
+
+        with self._cache_lock:
+            df = self._index_cache.get(market)
+        if df is None:
+            return pd.DataFrame(columns=self.INDEX_COLUMNS, index=pd.DatetimeIndex([], name='date'))
+        return df.loc[pd.Timestamp(start_day):pd.Timestamp(end_day)].copy()
+
+    def _index_month_pending(self, market: str, year: int, month: int, now: datetime) -> bool:
+        """某月的大盤指數是否需要下載: 未完整下載，且快取中沒有該月最後一個已公布交易日的資料"""
+        with self._cache_lock:
+            if (market, f"{year:04d}-{month:02d}") in self._index_months:
+                return False
+            df = self._index_cache.get(market)
+        first = date(year, month, 1)
+        last = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)) - timedelta(days=1)
+        sessions = self._ready_sessions(first, last, now)
+        if not sessions:
+            return False
+        return df is None or pd.Timestamp(sessions[-1]) not in df.index
+
+    def _fetch_index_month(self, market: str, year: int, month: int, now: datetime) -> None:
+        """下載某月的大盤指數日資料並存入快取"""
         try:
-            today = datetime.now()
-            roc_year = today.year - 1911
-            date_str = f"{roc_year}/{today.month:02d}/{today.day:02d}"
+            if market == 'TPEX':
+                first = date(year, month, 1)
+                last = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)) - timedelta(days=1)
+                sessions = self._ready_sessions(first, last, now)
+                day = sessions[-1] if sessions else min(last, now.date())
+                url = (f"{self.TPEX_BASE_URL}/web/stock/aftertrading/otc_idx_daily/idx_result.php"
+                       f"?l=zh-tw&d={day.year - 1911}/{day.month:02d}/{day.day:02d}")
+                response = self._get(url, timeout=10)
+                if response.status_code == 200:
+                    self._store_index_rows('TPEX', year, month, response.json().get('aaData') or [], now)
+            else:
+                url = f"{self.TWSE_BASE_URL}/exchangeReport/FMTQIK?response=json&date={year:04d}{month:02d}01"
+                response = self._get(url, timeout=10)
+                if response.status_code == 200:
+                    data = response.json()
+                    if data.get('stat') == 'OK':
+                        self._store_index_rows('TWSE', year, month, data.get('data') or [], now)
+        except Exception:
+            pass
 
-            url = f"{self.TPEX_BASE_URL}/web/stock/aftertrading/otc_idx_daily/idx_result.php?l=zh-tw&d={date_str}"
-            response = self.session.get(url, timeout=10)
+    def _store_index_rows(self, market: str, year: int, month: int, rows: List[List[Any]],
+                          now: Optional[datetime] = None) -> None:
+        """
+        將交易所回應的大盤指數資料列存入快取
 
-            if response.status_code == 200:
-                data = response.json()
-                # 尋找櫃買指數
-                if data.get('aaData') and len(data['aaData']) > 0:
-                    latest = data['aaData'][-1]
-                    return {
-                        'market': 'TPEX',
-                        'market_name': '櫃買指數',
-                        'date': latest[0] if len(latest) > 0 else 'N/A',
-                        'index': latest[1] if len(latest) > 1 else 'N/A',
-                        'change': latest[2] if len(latest) > 2 else 'N/A',
-                        'volume': latest[3] if len(latest) > 3 else 'N/A',
-                        'value': latest[4] if len(latest) > 4 else 'N/A',
-                        'transaction': latest[5] if len(latest) > 5 else 'N/A'
-                    }
-            return {'error': '無法獲取櫃買指數資訊'}
-        except Exception as e:
-            return {'error': str(e)}
+        上市 (FMTQIK) 欄位順序: 日期, 成交股數, 成交金額, 成交筆數, 發行量加權股價指數, 漲跌點數
+        上櫃 (otc_idx_daily) 欄位順序: 日期, 指數, 漲跌, 成交股數, 成交金額, 成交筆數
+        """
+        if market == 'TPEX':
+            positions = {'index': 1, 'change': 2, 'volume': 3, 'value': 4, 'transaction': 5}
+        else:
+            positions = {'volume': 1, 'value': 2, 'transaction': 3, 'index': 4, 'change': 5}
+
+        rows = [row for row in rows if isinstance(row, (list, tuple)) and row]
+        if not rows:
+            return
+        df = pd.DataFrame({
+            col: [row[pos] if len(row) > pos else None for row in rows] for col, pos in positions.items()
+        }, index=to_datetime_index([str(row[0]).strip() for row in rows]))
+        df = df[~df.index.isna()]
+        for col in self.INDEX_COLUMNS:
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', '', regex=False), errors='coerce')
+        df = df[self.INDEX_COLUMNS]
+
+        now = now or datetime.now()
+        with self._cache_lock:
+            cached = self._index_cache.get(market)
+            if cached is not None:
+                df = pd.concat([cached[~cached.index.isin(df.index)], df])
+            self._index_cache[market] = df.sort_index()
+            if (year, month) < (now.year, now.month) and not df.empty:
+                self._index_months.add((market, f"{year:04d}-{month:02d}"))
 
     def analyze_stock(self, stock_id: str) -> Dict[str, Any]:
         """
@@ -513,13 +1169,10 @@ class TWSEDataFetcher:
             return info
 
         # 獲取歷史數據並計算技術指標
-        history = self.get_stock_history(stock_id, months=3)
+        history = self.get_history_with_indicators(stock_id)
         if history.empty:
             return {'error': '無法獲取歷史數據', 'info': info}
 
-        # 計算技術指標
-        history = self.calculate_technical_indicators(history)
-
         # 取得最新數據
         latest = history.iloc[-1] if len(history) > 0 else None
 
@@ -528,9 +1181,9 @@ class TWSEDataFetcher:
             'name': info.get('name', ''),
             'market': info.get('market', 'TWSE'),
             'market_name': info.get('market_name', '上市'),
-            'current_price': info.get('close', ''),
-            'change': info.get('change', ''),
-            'volume': info.get('trade_volume', ''),
+            'current_price': info.get('close'),
+            'change': info.get('change'),
+            'volume': info.get('trade_volume'),
         }
 
         if latest is not None:
@@ -602,53 +1255,46 @@ class TWSEDataFetcher:
 
         return signals
 
-    def calculate_support_resistance(self, df: pd.DataFrame) -> Dict[str, Any]:
+    def calculate_support_resistance(self, df: pd.DataFrame, window: int = DEFAULT_PIVOT_WINDOW,
+                                     zones: bool = False,
+                                     zone_tolerance: float = DEFAULT_ZONE_TOLERANCE) -> Dict[str, Any]:
         """
         計算支撐位和壓力位
 
         Args:
             df: 包含 OHLCV 數據的 DataFrame
+            window: 局部高低點左右各比較的 K 線數 (預設 2，即 5 根 K 線)
+            zones: 是否將相近的高低點聚合為價格區間
+            zone_tolerance: 聚合價格區間時相鄰價格差距的比例上限
 
         Returns:
-            支撐位和壓力位資訊
+            支撐位和壓力位資訊 (zones 為 True 時另含 zones: 價格區間與觸及次數)
         """
-        if df.empty or len(df) < 5:
+        if df.empty or len(df) < 2 * window + 1:
             return {'support': [], 'resistance': []}
 
-        highs = df['high'].values
-        lows = df['low'].values
-        closes = df['close'].values
-
-        # 找出局部高點和低點
-        resistance_levels = []
-        support_levels = []
+        highs = df['high'].to_numpy(dtype=np.float64)
+        lows = df['low'].to_numpy(dtype=np.float64)
+        current_price = df['close'].values[-1]
 
-        for i in range(2, len(df) - 2):
-            # 局部高點 (壓力位)
-            if highs[i] > highs[i-1] and highs[i] > highs[i-2] and \
-               highs[i] > highs[i+1] and highs[i] > highs[i+2]:
-                resistance_levels.append(highs[i])
+        # 局部高點 (壓力位) 和局部低點 (支撐位)
+        resistance_levels = highs[pivot_mask(highs, window, 'high')]
+        support_levels = lows[pivot_mask(lows, window, 'low')]
 
-            # 局部低點 (支撐位)
-            if lows[i] < lows[i-1] and lows[i] < lows[i-2] and \
-               lows[i] < lows[i+1] and lows[i] < lows[i+2]:
-                support_levels.append(lows[i])
-
-        # 取最近的支撐壓力位
-        current_price = closes[-1]
-
-        # 篩選有效的支撐位 (低於當前價格)
-        valid_support = sorted([s for s in support_levels if s < current_price], reverse=True)[:3]
-
-        # 篩選有效的壓力位 (高於當前價格)
-        valid_resistance = sorted([r for r in resistance_levels if r > current_price])[:3]
-
-        return {
-            'support': valid_support,
-            'resistance': valid_resistance,
+        # 取最近的支撐壓力位: 低於當前價格的支撐位、高於當前價格的壓力位
+        result = {
+            'support': np.sort(support_levels[support_levels < current_price])[::-1][:3].tolist(),
+            'resistance': np.sort(resistance_levels[resistance_levels > current_price])[:3].tolist(),
             'current_price': current_price
         }
 
+        if zones:
+            result['zones'] = cluster_zones(np.concatenate((support_levels, resistance_levels)), zone_tolerance)
+            for zone in result['zones']:
+                zone['type'] = 'support' if zone['price'] < current_price else 'resistance'
+
+        return result
+
     def generate_trading_signals(self, df: pd.DataFrame) -> Dict[str, Any]:
         """
         生成買賣訊號
@@ -767,6 +1413,8 @@ class TWSEDataFetcher:
         """
         找出歷史買賣點
 
+        以 NumPy 陣列一次計算所有 K 線的 MA 交叉、RSI 與 KD 交叉分數 (不逐列建立 Series)
+
         Args:
             df: 包含技術指標的 DataFrame
 
@@ -776,58 +1424,57 @@ class TWSEDataFetcher:
         if df.empty or len(df) < 20:
             return {'buy_points': [], 'sell_points': []}
 
-        buy_points = []
-        sell_points = []
-
-        for i in range(2, len(df)):
-            curr = df.iloc[i]
-            prev = df.iloc[i-1]
-
-            buy_score = 0
-            sell_score = 0
+        ma5, ma20, rsi, k, d = (self._indicator_array(df, col) for col in ('MA5', 'MA20', 'RSI', 'K', 'D'))
+        prev_ma5, prev_ma20, prev_k, prev_d = (self._shift(a) for a in (ma5, ma20, k, d))
 
+        with np.errstate(invalid='ignore'):
             # MA 交叉
-            if pd.notna(curr.get('MA5')) and pd.notna(curr.get('MA20')):
-                if pd.notna(prev.get('MA5')) and pd.notna(prev.get('MA20')):
-                    if prev['MA5'] <= prev['MA20'] and curr['MA5'] > curr['MA20']:
-                        buy_score += 2
-                    elif prev['MA5'] >= prev['MA20'] and curr['MA5'] < curr['MA20']:
-                        sell_score += 2
-
-            # RSI
-            rsi = curr.get('RSI')
-            if pd.notna(rsi):
-                if rsi < 30:
-                    buy_score += 1
-                elif rsi > 70:
-                    sell_score += 1
+            ma_valid = ~(np.isnan(ma5) | np.isnan(ma20) | np.isnan(prev_ma5) | np.isnan(prev_ma20))
+            ma_up = ma_valid & (prev_ma5 <= prev_ma20) & (ma5 > ma20)
+            ma_down = ma_valid & ~ma_up & (prev_ma5 >= prev_ma20) & (ma5 < ma20)
 
             # KD 交叉
-            k, d = curr.get('K'), curr.get('D')
-            prev_k, prev_d = prev.get('K'), prev.get('D')
-            if pd.notna(k) and pd.notna(d) and pd.notna(prev_k) and pd.notna(prev_d):
-                if k < 30 and prev_k <= prev_d and k > d:
-                    buy_score += 2
-                elif k > 70 and prev_k >= prev_d and k < d:
-                    sell_score += 2
-
-            # 記錄買賣點
-            if buy_score >= 2:
-                buy_points.append({
-                    'index': i,
-                    'date': curr.get('date', ''),
-                    'price': curr.get('close', 0),
-                    'score': buy_score
-                })
-            elif sell_score >= 2:
-                sell_points.append({
-                    'index': i,
-                    'date': curr.get('date', ''),
-                    'price': curr.get('close', 0),
-                    'score': sell_score
-                })
-
-        return {'buy_points': buy_points, 'sell_points': sell_points}
+            kd_valid = ~(np.isnan(k) | np.isnan(d) | np.isnan(prev_k) | np.isnan(prev_d))
+            kd_up = kd_valid & (k < 30) & (prev_k <= prev_d) & (k > d)
+            kd_down = kd_valid & ~kd_up & (k > 70) & (prev_k >= prev_d) & (k < d)
+
+            # RSI (NaN 的比較結果為 False)
+            buy_score = 2 * ma_up + (rsi < 30) + 2 * kd_up
+            sell_score = 2 * ma_down + (rsi > 70) + 2 * kd_down
+
+        # 與原本的逐列計算相同，由第 3 根 K 線開始
+        buy_score[:2] = 0
+        sell_score[:2] = 0
+        is_buy = buy_score >= 2
+        is_sell = ~is_buy & (sell_score >= 2)
+
+        close = df['close'].to_numpy() if 'close' in df.columns else np.zeros(len(df), dtype=int)
+
+        def points(mask, scores):
+            rows = np.flatnonzero(mask)
+            return [{'index': i, 'date': date, 'price': price, 'score': score}
+                    for i, date, price, score in zip(rows.tolist(), df.index[rows], close[rows],
+                                                     scores[rows].tolist())]
+
+        return {'buy_points': points(is_buy, buy_score), 'sell_points': points(is_sell, sell_score)}
+
+    @staticmethod
+    def _indicator_array(df: pd.DataFrame, col: str) -> np.ndarray:
+        """取得指標欄位的 float64 陣列，欄位不存在或非數值時為 NaN"""
+        if col not in df.columns:
+            return np.full(len(df), np.nan)
+        values = df[col]
+        if values.dtype != np.float64:
+            values = pd.to_numeric(values, errors='coerce')
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+
+    @staticmethod
+    def _shift(values: np.ndarray) -> np.ndarray:
+        """前一根 K 線的值 (第一根為 NaN)"""
+        shifted = np.empty_like(values)
+        shifted[0] = np.nan
+        shifted[1:] = values[:-1]
+        return shifted
 
     def predict_future_trend(self, df: pd.DataFrame, days: int = 5) -> Dict[str, Any]:
         """
@@ -1015,3 +1662,25 @@ class TWSEDataFetcher:
             'resistance_levels': resistance[:3]
         }
 
+
+# 全程序共用的數據獲取器 (共用連線池與快取)
+_shared_fetcher: Optional[TWSEDataFetcher] = None
+_shared_fetcher_lock = threading.Lock()
+
+
+def get_shared_fetcher() -> TWSEDataFetcher:
+    """
+    取得全程序共用的 TWSEDataFetcher
+
+    所有股票工具共用同一個實例，一次 Agent 回合中的多個工具呼叫
+    可重複使用已建立的 TCP/TLS 連線與同一組快取
+
+    Returns:
+        共用的 TWSEDataFetcher
+    """
+    global _shared_fetcher
+    if _shared_fetcher is None:
+        with _shared_fetcher_lock:
+            if _shared_fetcher is None:
+                _shared_fetcher = TWSEDataFetcher()
+    return _shared_fetcher
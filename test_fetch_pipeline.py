@@ -0,0 +1,699 @@
+#!/usr/bin/env python3
+"""測試數據下載流程 - 速率限制、並行下載 (離線測試，不需連網)"""
+
+import sys
+import threading
+import time
+
+
+def test_token_bucket_rate():
+    """測試 Token Bucket 限制請求速率"""
+    from knowledge_base.tools.rate_limit import TokenBucket
+
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+    # 第一個 token 立即可用，其餘 10 個需約 0.2 秒
+    assert 0.15 <= elapsed < 0.5, elapsed
+    print(f"✓ Token Bucket 速率正確 ({elapsed:.3f}s)")
+
+
+def test_host_rate_limiter_per_host():
+    """測試不同主機使用獨立的 Token Bucket"""
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+
+    limiter = HostRateLimiter(rates={'a.example': 1, 'b.example': 1})
+    assert limiter.acquire('https://a.example/x') == 0
+    assert limiter.acquire('https://b.example/y') == 0
+    assert limiter.bucket('a.example') is limiter.bucket('a.example')
+    print("✓ 各主機獨立限速")
+
+
+def test_host_rate_limiter_reads_env():
+    """測試預設速率於建立時讀取環境變數 (.env 在模組匯入後才載入)"""
+    import os
+    from unittest import mock
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+
+    with mock.patch.dict(os.environ, {'TWSE_RATE_LIMIT': '7', 'TPEX_RATE_LIMIT': '9'}):
+        limiter = HostRateLimiter()
+    assert limiter.rates['www.twse.com.tw'] == 7 and limiter.rates['openapi.twse.com.tw'] == 7
+    assert limiter.rates['www.tpex.org.tw'] == 9
+    print("✓ 速率限制讀取環境變數")
+
+
+def test_concurrent_requests_respect_rate():
+    """測試並行下載時總耗時趨近速率上限"""
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    state = {'active': 0, 'max_active': 0}
+    lock = threading.Lock()
+    limiter = HostRateLimiter(rates={'ex.example': 40})
+
+    def slow_request(i):
+        limiter.acquire(f"https://ex.example/{i}")
+        with lock:
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+        time.sleep(0.1)
+        with lock:
+            state['active'] -= 1
+        return i
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    fetcher.max_workers = 8
+
+    start = time.monotonic()
+    results = fetcher.map_concurrently(slow_request, list(range(16)))
+    elapsed = time.monotonic() - start
+    assert results == list(range(16))
+    assert state['max_active'] > 1
+    # 序列執行需 1.6 秒；並行時受 40 req/s 限制約 0.5 秒
+    assert elapsed < 1.0, elapsed
+    print(f"✓ 並行下載正常 ({elapsed:.3f}s, 最大並行數 {state['max_active']})")
+
+
+def test_shared_fetcher():
+    """測試所有股票工具共用同一個數據獲取器與連線池"""
+    import os
+    import tempfile
+    os.environ.setdefault("STOCK_DATA_DIRECTORY", tempfile.mkdtemp())
+
+    from knowledge_base.tools.twse_data import get_shared_fetcher
+    from knowledge_base.tools.stock_tools import StockPriceTool, MarketSummaryTool
+
+    fetcher = get_shared_fetcher()
+    assert fetcher is get_shared_fetcher()
+    assert StockPriceTool().fetcher is fetcher
+    assert MarketSummaryTool().fetcher is fetcher
+
+    adapter = fetcher.session.get_adapter('https://www.twse.com.tw')
+    assert adapter is fetcher.session.get_adapter('https://www.tpex.org.tw')
+    assert adapter._pool_maxsize == fetcher.executor.hedge_workers == 2 * max(fetcher.max_workers, 1)
+    assert adapter._pool_block
+    print("✓ 股票工具共用數據獲取器")
+
+
+def test_single_flight_tpex_quotes():
+    """測試多執行緒同時載入 TPEx 報價時只下載一次"""
+    import os
+    import tempfile
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.market_snapshot import DailySnapshotCache, QuoteTable
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+    from knowledge_base.tools.symbol_master import SymbolMaster
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    class QuotesResponse:
+        status_code = 200
+
+        def json(self):
+            return [{'SecuritiesCompanyCode': '6488', 'CompanyName': '環球晶'}]
+
+    class SlowQuotesSession:
+        def __init__(self):
+            self.calls = 0
+
+        def get(self, url, **kwargs):
+            self.calls += 1
+            time.sleep(0.2)
+            return QuotesResponse()
+
+    fetcher = TWSEDataFetcher(
+        history_store=HistoryStore(':memory:'),
+        tpex_snapshots=DailySnapshotCache('TPEX', directory=tempfile.mkdtemp()),
+        rate_limiter=HostRateLimiter(rates={}, default_rate=1000),
+        # 主檔中沒有的代碼才會載入 TPEx 報價
+        symbol_master=SymbolMaster(lambda url: None, path=os.path.join(tempfile.mkdtemp(), 'symbols.json')),
+    )
+    fetcher.session = SlowQuotesSession()
+    TWSEDataFetcher._tpex_quotes_cache = QuoteTable.empty()
+    TWSEDataFetcher._tpex_quotes_cache_time = None
+    TWSEDataFetcher._market_cache.pop('6488', None)
+    before = fetcher.get_cache_stats()['tpex_quotes']
+
+    threads = [threading.Thread(target=fetcher._detect_market, args=('6488',)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    after = fetcher.get_cache_stats()
+    assert fetcher.session.calls == 1
+    assert fetcher._detect_market('6488') == 'TPEX'
+    assert after['tpex_quotes']['misses'] - before['misses'] == 1
+    assert after['market']['coalesced'] >= 1 or after['tpex_quotes']['coalesced'] >= 1
+    print(f"✓ 並行請求合併為單一下載 {after}")
+
+
+class CountingAdapter:
+    """模擬交易所的傳輸層，記錄實際送出的請求"""
+
+    def __init__(self, etag=None, body=b'{"stat": "OK", "data": [["115/02/06"]]}'):
+        self.requests = []
+        self.etag = etag
+        self.body = body
+
+    def send(self, request, **kwargs):
+        import requests
+        self.requests.append(request)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        if self.etag and request.headers.get('If-None-Match') == self.etag:
+            response.status_code = 304
+            response._content = b''
+        else:
+            response.status_code = 200
+            response._content = self.body
+            if self.etag:
+                response.headers['ETag'] = self.etag
+        return response
+
+    def close(self):
+        pass
+
+
+def test_cache_policy_ttl():
+    """測試各端點的快取期限"""
+    from datetime import datetime
+    from knowledge_base.tools.http_cache import EndpointCachePolicy, FOREVER
+
+    policy = EndpointCachePolicy(live_ttl=60)
+    trading = datetime(2026, 2, 6, 10, 0)   # 週五盤中
+    evening = datetime(2026, 2, 6, 20, 0)   # 週五收盤後
+    base = "https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json&stockNo=2330&date="
+
+    assert policy.ttl(base + "20260105", trading) == FOREVER
+    assert policy.ttl(base + "20260201", trading) == 60
+    # 週五晚上快取到下週一盤前
+    assert policy.ttl(base + "20260201", evening) == (2 * 24 + 12.5) * 3600
+    quotes = "https://www.tpex.org.tw/www/zh-tw/afterTrading/dailyQuotes?date=115%2F02%2F05&response=json"
+    assert policy.ttl(quotes, trading) == FOREVER
+    assert policy.ttl("https://example.com/other", trading) is None
+    print("✓ 端點快取期限正確")
+
+
+def test_cached_session():
+    """測試過去月份只下載一次，過期項目使用條件式請求"""
+    import tempfile
+    import os
+    from knowledge_base.tools.http_cache import CachedSession, ResponseCache, EndpointCachePolicy
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = ResponseCache(os.path.join(tmpdir, 'http_cache.db'))
+        session = CachedSession(cache=cache)
+        adapter = CountingAdapter()
+        session.mount('https://', adapter)
+
+        url = "https://www.twse.com.tw/exchangeReport/STOCK_DAY"
+        params = {'response': 'json', 'date': '20200101', 'stockNo': '2330'}
+        first = session.get(url, params=params)
+        second = session.get(url, params=params)
+        assert len(adapter.requests) == 1
+        assert second.json() == first.json()
+        assert session.cache_stats.snapshot()['hits'] == 1
+
+        # 新的 session 由磁碟讀取快取
+        session2 = CachedSession(cache=ResponseCache(os.path.join(tmpdir, 'http_cache.db')))
+        session2.mount('https://', adapter)
+        assert session2.get(url, params=params).json()['stat'] == 'OK'
+        assert len(adapter.requests) == 1
+
+        # 當日資料過期後以 ETag 確認
+        class ZeroTTLPolicy(EndpointCachePolicy):
+            def ttl(self, url, now=None):
+                return 0
+
+        etag_adapter = CountingAdapter(etag='"v1"')
+        session3 = CachedSession(cache=ResponseCache(':memory:'), policy=ZeroTTLPolicy())
+        session3.mount('https://', etag_adapter)
+        session3.get(url, params=params)
+        cached = session3.get(url, params=params)
+        assert etag_adapter.requests[1].headers['If-None-Match'] == '"v1"'
+        assert cached.status_code == 200 and cached.json()['stat'] == 'OK'
+    print("✓ HTTP 回應快取正常")
+
+
+def test_cached_session_rejects_error_payloads():
+    """測試交易所以 HTTP 200 回傳的錯誤/限流內容不寫入快取"""
+    from knowledge_base.tools.http_cache import CachedSession, ResponseCache
+
+    url = "https://www.twse.com.tw/exchangeReport/STOCK_DAY"
+    params = {'response': 'json', 'date': '20200101', 'stockNo': '2330'}
+    for body in (rb'{"stat": "\u5f88\u62b1\u6b49"}', b'<html>too many requests</html>'):
+        session = CachedSession(cache=ResponseCache(':memory:'))
+        adapter = CountingAdapter(body=body)
+        session.mount('https://', adapter)
+        session.get(url, params=params)
+        session.get(url, params=params)
+        assert len(adapter.requests) == 2
+        assert len(session.cache) == 0
+
+    quotes = "https://www.tpex.org.tw/www/zh-tw/afterTrading/dailyQuotes"
+    session = CachedSession(cache=ResponseCache(':memory:'))
+    adapter = CountingAdapter(body=b'{"stat": "ok", "tables": []}')
+    session.mount('https://', adapter)
+    session.get(quotes, params={'date': '109/01/02', 'response': 'json'})
+    assert session.cache.get(adapter.requests[0].url) is None
+    print("✓ 錯誤回應不快取")
+
+
+def test_response_cache_bounded():
+    """測試記憶體快取以位元組上限淘汰，SQLite 清除過期已久的項目"""
+    import os
+    import tempfile
+    import requests
+    from knowledge_base.tools.http_cache import ResponseCache, FOREVER
+
+    def make_response(content):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = content
+        return response
+
+    cache = ResponseCache(':memory:', max_bytes=250)
+    for i in range(5):
+        cache.put(f"u{i}", make_response(b'x' * 100), FOREVER)
+    assert len(cache) == 2 and cache.nbytes <= 250
+    # 記憶體淘汰的項目仍可由 SQLite 讀回
+    assert cache.get("u0")['content'] == b'x' * 100
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'http_cache.db')
+        cache = ResponseCache(path, stale_retention=0)
+        cache.put("old", make_response(b'old'), -1)
+        cache.put("live", make_response(b'live'), 3600)
+        cache.put("past", make_response(b'past'), FOREVER)
+        reopened = ResponseCache(path, stale_retention=0)
+        assert reopened.get("old") is None
+        assert reopened.get("live") is not None and reopened.get("past") is not None
+    print("✓ HTTP 回應快取有上限")
+
+
+def test_http_stats_count_cache_hits():
+    """測試 'http' 統計: 由回應快取取得的請求記為 hits，不計入 misses"""
+    import os
+    import tempfile
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.http_cache import ResponseCache
+    from knowledge_base.tools.market_snapshot import DailySnapshotCache
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+    from knowledge_base.tools.request_executor import RequestExecutor
+    from knowledge_base.tools.symbol_master import SymbolMaster
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher(
+        history_store=HistoryStore(':memory:'),
+        tpex_snapshots=DailySnapshotCache('TPEX', directory=tempfile.mkdtemp()),
+        rate_limiter=HostRateLimiter(rates={}, default_rate=1000),
+        response_cache=ResponseCache(':memory:'),
+        request_executor=RequestExecutor(hedge=False),
+        symbol_master=SymbolMaster(lambda url: None, path=os.path.join(tempfile.mkdtemp(), 'symbols.json')),
+        http_mode='live',
+    )
+    adapter = CountingAdapter()
+    fetcher.session.mount('https://', adapter)
+    before = fetcher.get_cache_stats()['http']
+
+    url = "https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json&date=20200101&stockNo=2330"
+    for _ in range(3):
+        assert fetcher._fetch_json(url)['stat'] == 'OK'
+
+    after = fetcher.get_cache_stats()['http']
+    assert len(adapter.requests) == 1
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 2
+    print("✓ HTTP 統計區分快取命中")
+
+
+def test_symbol_master():
+    """測試代碼主檔: 市場判斷與名稱查詢不需連網，且可由本地檔案載入"""
+    import os
+    import tempfile
+    from knowledge_base.tools.symbol_master import SymbolMaster, Symbol
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    responses = {
+        'opendata/t187ap03_L': [{'公司代號': '2330', '公司簡稱': '台積電', '產業別': '24'},
+                                {'公司代號': '1101', '公司簡稱': '台泥', '產業別': '01'}],
+        'STOCK_DAY_ALL': [{'Code': '2330', 'Name': '台積電'}, {'Code': '0050', 'Name': '元大台灣50'}],
+        'mopsfe_opendata_t187ap03_O': [{'公司代號': '6488', '公司簡稱': '環球晶', '產業別': '24'}],
+        'tpex_mainboard_quotes': [{'SecuritiesCompanyCode': '6488', 'CompanyName': '環球晶'}],
+    }
+    calls = []
+
+    def fetch_json(url):
+        calls.append(url)
+        return next(v for k, v in responses.items() if url.endswith(k))
+
+    path = os.path.join(tempfile.mkdtemp(), 'symbol_master.json')
+    master = SymbolMaster(fetch_json, path=path)
+    assert master.lookup('6488').market == 'TPEX'
+    assert master.lookup('0050').market == 'TWSE'
+    assert master.lookup('1101').status == Symbol.INACTIVE
+    assert master.lookup('2330').industry == '24'
+    assert master.lookup('9999') is None
+    assert len(calls) == 4
+
+    # 當日已更新的主檔直接由檔案載入
+    reloaded = SymbolMaster(lambda url: None, path=path)
+    assert reloaded.lookup('2330').name == '台積電'
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    fetcher.symbols = reloaded
+    fetcher._get = None  # 不應連網
+    assert fetcher._detect_market('6488') == 'TPEX'
+    assert fetcher._get_tpex_stock_name('6488') == '環球晶'
+    print("✓ 代碼主檔查詢與本地載入")
+
+
+def test_stock_info_many():
+    """測試批次行情每個市場只發出一次全市場請求"""
+    import os
+    import tempfile
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.market_snapshot import DailySnapshotCache, QuoteTable
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+    from knowledge_base.tools.symbol_master import SymbolMaster
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    payloads = {
+        'STOCK_DAY_ALL': [
+            {'Date': '1150206', 'Code': '2330', 'Name': '台積電', 'TradeVolume': '30,123,456',
+             'TradeValue': '30000000000', 'OpeningPrice': '1000.00', 'HighestPrice': '1010.00',
+             'LowestPrice': '995.00', 'ClosingPrice': '1005.00', 'Change': '+5.0000', 'Transaction': '45678'},
+            {'Date': '1150206', 'Code': '2317', 'Name': '鴻海', 'TradeVolume': '1000',
+             'TradeValue': '200000', 'OpeningPrice': '200.00', 'HighestPrice': '201.00',
+             'LowestPrice': '199.00', 'ClosingPrice': '200.50', 'Change': '-0.5000', 'Transaction': '10'},
+        ],
+        'tpex_mainboard_quotes': [
+            {'Date': '1150206', 'SecuritiesCompanyCode': '6488', 'CompanyName': '環球晶',
+             'Close': '450.00', 'Change': '-3.00', 'Open': '455.00', 'High': '456.00', 'Low': '448.00',
+             'TradingShares': '1,234,000', 'TransactionAmount': '555000000', 'TransactionNumber': '2345'},
+        ],
+    }
+
+    class Response:
+        status_code = 200
+
+        def __init__(self, data):
+            self.data = data
+
+        def json(self):
+            return self.data
+
+    class Session:
+        def __init__(self):
+            self.urls = []
+
+        def get(self, url, **kwargs):
+            self.urls.append(url)
+            return Response(next(v for k, v in payloads.items() if url.endswith(k)))
+
+    fetcher = TWSEDataFetcher(
+        history_store=HistoryStore(':memory:'),
+        tpex_snapshots=DailySnapshotCache('TPEX', directory=tempfile.mkdtemp()),
+        rate_limiter=HostRateLimiter(rates={}, default_rate=1000),
+        symbol_master=SymbolMaster(lambda url: None, path=os.path.join(tempfile.mkdtemp(), 'symbols.json')),
+    )
+    fetcher.session = Session()
+    TWSEDataFetcher._tpex_quotes_cache = QuoteTable.empty()
+    TWSEDataFetcher._tpex_quotes_cache_time = None
+    TWSEDataFetcher._market_cache.update({'2330': 'TWSE', '2317': 'TWSE', '6488': 'TPEX', '9999': 'TWSE'})
+
+    df = fetcher.get_stock_info_many(['2330', '6488', '2317', '9999', '2330'])
+    assert len(fetcher.session.urls) == 2
+    assert list(df.index) == ['2330', '6488', '2317']
+    assert df.loc['2330', 'trade_volume'] == 30123456
+    assert df.loc['2317', 'change'] == -0.5
+    assert df.loc['6488', 'market_name'] == '上櫃'
+    assert df.loc['6488', 'date'] == '115/02/06'
+    assert df.loc['6488', 'close'] == 450.0
+
+    # 單檔上櫃資訊與上市相同為數值欄位
+    info = fetcher.get_stock_info('6488')
+    assert info['close'] == 450.0 and info['change'] == -3.0
+    assert info['trade_volume'] == 1234000 and isinstance(info['trade_volume'], int)
+    assert info['date'] == '115/02/06'
+    print("✓ 批次行情查詢 (2 次請求)")
+
+
+def test_quote_table():
+    """測試 TPEx 行情於載入時轉為欄位式數值"""
+    from knowledge_base.tools.market_snapshot import QuoteTable
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    table = QuoteTable.from_records(
+        [
+            {'Date': '1150206', 'SecuritiesCompanyCode': '6488', 'CompanyName': '環球晶',
+             'Close': '450.00', 'Change': '+3.00', 'TradingShares': '1,234,000'},
+            {'Date': '1150206', 'SecuritiesCompanyCode': '5765', 'CompanyName': '雲豹能源',
+             'Close': '----', 'Change': '除息', 'TradingShares': '0'},
+        ],
+        code_field='SecuritiesCompanyCode', name_field='CompanyName', date_field='Date',
+        numeric_fields=TWSEDataFetcher.TPEX_QUOTE_FIELDS,
+    )
+    assert len(table) == 2 and '6488' in table and '9999' not in table
+    assert table.column('close').dtype.kind == 'f'
+    row = table.row('6488')
+    assert row['close'] == 450.0 and row['change'] == 3.0 and row['trade_volume'] == 1234000
+    assert table.row('5765')['close'] is None
+    assert table.row('9999') is None
+    print("✓ 欄位式 TPEx 行情表")
+
+
+def test_request_executor():
+    """測試重試、自適應逾時、對沖請求與斷路器"""
+    import requests
+    from knowledge_base.tools.request_executor import RequestExecutor, CircuitOpenError, CircuitBreaker
+
+    class Response:
+        def __init__(self, status_code=200, from_cache=False):
+            self.status_code = status_code
+            self.from_cache = from_cache
+
+    class ScriptedSession:
+        """依序回傳預先安排的結果 (狀態碼、例外或延遲秒數)"""
+
+        def __init__(self, script):
+            self.script = list(script)
+            self.timeouts = []
+            self.lock = threading.Lock()
+
+        def get(self, url, timeout=None, **kwargs):
+            with self.lock:
+                self.timeouts.append(timeout)
+                step = self.script.pop(0) if self.script else 200
+            if isinstance(step, Exception):
+                raise step
+            if isinstance(step, float):
+                time.sleep(step)
+                return Response(200)
+            if step == 'cache':
+                return Response(200, from_cache=True)
+            return Response(step)
+
+        def get_stale(self, url, params=None):
+            response = Response(200)
+            response.stale = True
+            return response
+
+    url = "https://www.twse.com.tw/exchangeReport/STOCK_DAY"
+    executor = RequestExecutor(max_retries=2, backoff_base=0.01, hedge=False,
+                               failure_threshold=2, reset_timeout=0.2, min_samples=5)
+
+    # 429/503 與連線錯誤會重試
+    session = ScriptedSession([503, requests.exceptions.ConnectionError(), 200])
+    assert executor.get(session, url, timeout=10).status_code == 200
+    assert session.timeouts[0] == 10
+
+    # 自適應逾時: p99 的 3 倍，下限 min_timeout
+    for _ in range(5):
+        executor.get(ScriptedSession([200]), url, timeout=10)
+    assert executor.timeout_for(executor.endpoint(url), 10) == executor.min_timeout
+
+    # 連續失敗後斷路，直接回傳快取資料而不送出請求
+    failing = ScriptedSession([503] * 6)
+    assert getattr(executor.get(failing, url), 'stale', False)
+    assert getattr(executor.get(failing, url), 'stale', False)
+    assert executor.breaker(executor.endpoint(url)).state == CircuitBreaker.OPEN
+    sent = len(failing.timeouts)
+    assert getattr(executor.get(failing, url), 'stale', False)
+    assert len(failing.timeouts) == sent
+
+    no_cache = ScriptedSession([])
+    no_cache.get_stale = lambda url, params=None: None
+    try:
+        executor.get(no_cache, url)
+        raise AssertionError("斷路中應立即失敗")
+    except CircuitOpenError:
+        pass
+
+    # 冷卻後由快取回應的試探請求不算恢復，也不計入延遲
+    time.sleep(0.25)
+    samples = len(executor._tracker(executor.endpoint(url)))
+    assert executor.get(ScriptedSession(['cache']), url).from_cache
+    assert executor.breaker(executor.endpoint(url)).state == CircuitBreaker.HALF_OPEN
+    assert len(executor._tracker(executor.endpoint(url))) == samples
+
+    # 冷卻後的試探請求成功即恢復
+    assert executor.get(ScriptedSession([200]), url).status_code == 200
+    assert executor.breaker(executor.endpoint(url)).state == CircuitBreaker.CLOSED
+
+    # 呼叫端錯誤不重試，也不計入斷路
+    for _ in range(3):
+        bad = ScriptedSession([requests.exceptions.InvalidURL("bad url")])
+        try:
+            executor.get(bad, url)
+            raise AssertionError("呼叫端錯誤應直接拋出")
+        except requests.exceptions.InvalidURL:
+            pass
+        assert len(bad.timeouts) == 1
+    assert executor.breaker(executor.endpoint(url)).state == CircuitBreaker.CLOSED
+
+    # 對沖: 超過 p95 延遲仍未回應時送出第二個請求
+    hedged = RequestExecutor(max_retries=0, hedge=True, min_samples=5)
+    for _ in range(5):
+        hedged.get(ScriptedSession([0.01]), url)
+    slow = ScriptedSession([1.0, 0.01])
+    start = time.monotonic()
+    assert hedged.get(slow, url).status_code == 200
+    assert time.monotonic() - start < 0.5
+    assert len(slow.timeouts) == 2
+
+    # 在執行緒池中排隊的時間不計入對沖延遲
+    queued = RequestExecutor(max_retries=0, hedge=True, min_samples=5, hedge_workers=1)
+    for _ in range(5):
+        queued.get(ScriptedSession([0.02]), url)
+    queued._pool.submit(time.sleep, 0.3)
+    fast = ScriptedSession([0.001])
+    assert queued.get(fast, url).status_code == 200
+    time.sleep(0.1)
+    assert len(fast.timeouts) == 1
+    print(f"✓ 請求執行器 {executor.snapshot()}")
+
+
+def test_record_replay():
+    """測試錄製/重播與本地模擬伺服器 (延遲與錯誤注入)"""
+    import os
+    import tempfile
+    from knowledge_base.tools.fixture_server import FixtureServer
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.http_cache import ResponseCache
+    from knowledge_base.tools.market_snapshot import DailySnapshotCache
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+    from knowledge_base.tools.replay import FixtureStore
+    from knowledge_base.tools.request_executor import RequestExecutor
+    from knowledge_base.tools.symbol_master import SymbolMaster
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    tmpdir = tempfile.mkdtemp()
+    base = "https://www.twse.com.tw/exchangeReport"
+    source = FixtureStore(os.path.join(tmpdir, 'source'))
+    for month in (1, 2, 3):
+        days = [f"113/{month:02d}/{day:02d}" for day in (10, 11, 12)]
+        source.put_json(f"{base}/FMTQIK?response=json&date=2024{month:02d}01",
+                        {'stat': 'OK', 'data': [[d] for d in days]})
+        source.put_json(f"{base}/STOCK_DAY?response=json&date=2024{month:02d}01&stockNo=9999",
+                        {'stat': 'OK', 'data': [[d, "1,000", "100,000", "100.00", "101.00", "99.00",
+                                                 f"{100 + month}.00", "+1.00", "50", ""] for d in days]})
+    # 查詢參數順序不影響 fixture
+    assert source.get(f"{base}/FMTQIK?date=20240101&response=json") is not None
+
+    def make_fetcher(name, **kwargs):
+        path = os.path.join(tmpdir, name)
+        return TWSEDataFetcher(
+            history_store=HistoryStore(os.path.join(path, 'history.db')),
+            tpex_snapshots=DailySnapshotCache('TPEX', directory=path),
+            rate_limiter=HostRateLimiter(rates={}, default_rate=1000),
+            response_cache=ResponseCache(os.path.join(path, 'http_cache.db')),
+            symbol_master=SymbolMaster(lambda url: None, path=os.path.join(path, 'symbols.json')),
+            request_executor=RequestExecutor(max_retries=1, backoff_base=0, hedge=False),
+            **kwargs,
+        )
+
+    TWSEDataFetcher._market_cache['9999'] = 'TWSE'
+
+    # 錄製: 經由模擬伺服器 (含延遲) 下載並寫入 fixture
+    recorded = FixtureStore(os.path.join(tmpdir, 'recorded'))
+    with FixtureServer(source, latency=0.01, jitter=0.01, seed=1) as server:
+        fetcher = make_fetcher('record', http_mode='record', fixture_store=recorded, upstream=server.url)
+        live = fetcher.get_stock_history('9999', start='2024-01-01', end='2024-03-31')
+    # 本月的交易日曆沒有 fixture (回應 404，以平日推估)
+    assert len(live) == 9 and server.counts['ok'] == 6
+    assert recorded.keys() == source.keys()
+
+    # 重播: 不連網，結果與錄製時相同
+    fetcher = make_fetcher('replay', http_mode='replay', fixture_store=recorded)
+    replayed = fetcher.get_stock_history('9999', start='2024-01-01', end='2024-03-31')
+    assert replayed['close'].tolist() == live['close'].tolist()
+    assert not [key for key in fetcher.session.get_adapter('https://').misses if 'STOCK_DAY' in key]
+
+    # 重播不使用連網時的回應快取: 快取中的舊內容不影響重播，重播的回應也不寫入
+    import requests
+    live_cache = ResponseCache(os.path.join(tmpdir, 'live_cache.db'))
+    stale = requests.Response()
+    stale.status_code = 200
+    stale._content = b'{"stat": "OK", "data": [["113/01/10", "1", "1", "1", "1", "1", "1.00", "0", "1", ""]]}'
+    january = f"{base}/STOCK_DAY?response=json&date=20240101&stockNo=9999"
+    live_cache.put(january, stale, float('inf'))
+    fetcher = TWSEDataFetcher(
+        history_store=HistoryStore(':memory:'), tpex_snapshots=DailySnapshotCache('TPEX', directory=tmpdir),
+        rate_limiter=HostRateLimiter(rates={}, default_rate=1000), response_cache=live_cache,
+        symbol_master=SymbolMaster(lambda url: None, path=os.path.join(tmpdir, 'symbols.json')),
+        http_mode='replay', fixture_store=recorded,
+    )
+    replayed = fetcher.get_stock_history('9999', start='2024-01-01', end='2024-01-31')
+    assert replayed['close'].tolist() == live['close'].tolist()[:3]
+    assert live_cache.get(january)['content'] == stale._content
+    assert ResponseCache(os.path.join(tmpdir, 'live_cache.db')).get(f"{base}/FMTQIK?response=json&date=20240101") is None
+
+    # 錯誤注入: 每個請求都回應 503 (重試一次後放棄)
+    with FixtureServer(source, error_rate=1.0, error_status=503) as server:
+        fetcher = make_fetcher('errors', upstream=server.url)
+        assert fetcher.get_stock_history('9999', start='2024-01-01', end='2024-01-31').empty
+    assert server.counts['errors'] >= 2 and server.counts['ok'] == 0
+    print("✓ 錄製/重播與模擬伺服器")
+
+
+def main():
+    """主測試函數"""
+    print("=" * 50)
+    print("數據下載流程測試")
+    print("=" * 50)
+
+    tests = [
+        test_token_bucket_rate,
+        test_host_rate_limiter_per_host,
+        test_host_rate_limiter_reads_env,
+        test_concurrent_requests_respect_rate,
+        test_shared_fetcher,
+        test_single_flight_tpex_quotes,
+        test_cache_policy_ttl,
+        test_cached_session,
+        test_cached_session_rejects_error_payloads,
+        test_response_cache_bounded,
+        test_http_stats_count_cache_hits,
+        test_symbol_master,
+        test_stock_info_many,
+        test_quote_table,
+        test_request_executor,
+        test_record_replay,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception as e:
+            failed += 1
+            print(f"✗ {test.__name__} 失敗: {e!r}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
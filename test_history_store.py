@@ -0,0 +1,930 @@
+#!/usr/bin/env python3
+"""測試本地歷史行情資料庫 (離線測試，不需連網)"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, date, timedelta
+
+
+class FakeResponse:
+    """模擬 requests.Response"""
+
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+
+def _month_rows(url):
+    """模擬 STOCK_DAY / FMTQIK 月資料: 每月 1~28 日的平日為交易日"""
+    date_str = url.split('date=')[1][:8]
+    year, month = int(date_str[:4]), int(date_str[4:6])
+    rows = []
+    for day in range(1, 29):
+        if datetime(year, month, day).weekday() >= 5:
+            continue
+        roc = f"{year - 1911}/{month:02d}/{day:02d}"
+        rows.append([roc, "1,000", "100,000", "100.00", "105.00", "99.00",
+                     f"{100 + day}.00", "+1.00", "50", ""])
+    return rows
+
+
+class FakeTWSESession:
+    """模擬 TWSE STOCK_DAY API，記錄請求次數 (不含交易日曆的 FMTQIK 請求)"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        if 'FMTQIK' not in url:
+            self.calls.append(url)
+        return FakeResponse({'stat': 'OK', 'data': _month_rows(url)})
+
+
+class FakeTPExSession:
+    """模擬 TPEx dailyQuotes API (每日回傳全市場表格)，記錄請求次數"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        if 'FMTQIK' in url:
+            return FakeResponse({'stat': 'OK', 'data': _month_rows(url)})
+        self.calls.append(params['date'])
+        rows = [[code, f"股票{code}", "50.00", "+0.50", "49.50", "51.00", "49.00",
+                 "50.10", "10,000", "500,000", "100"] for code in ('8888', '8889', '8890')]
+        return FakeResponse({'tables': [{'data': rows}]})
+
+
+def _make_fetcher(tmpdir, session_cls=FakeTWSESession):
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.market_snapshot import DailySnapshotCache
+    from knowledge_base.tools.rate_limit import HostRateLimiter
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher(
+        history_store=HistoryStore(os.path.join(tmpdir, 'history.db')),
+        tpex_snapshots=DailySnapshotCache('TPEX', directory=os.path.join(tmpdir, 'tpex')),
+        rate_limiter=HostRateLimiter(rates={}, default_rate=1000),
+    )
+    fetcher.session = session_cls()
+    fetcher._market_cache['9999'] = 'TWSE'
+    for code in ('8888', '8889', '8890'):
+        fetcher._market_cache[code] = 'TPEX'
+    return fetcher
+
+
+def test_history_store_roundtrip():
+    """測試寫入與讀取"""
+    import pandas as pd
+    from knowledge_base.tools.history_store import HistoryStore
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = HistoryStore(os.path.join(tmpdir, 'history.db'))
+        df = pd.DataFrame({
+            'date': ['115/02/06', '115/02/05'],
+            'volume': [1000.0, 2000.0], 'value': [1e5, 2e5],
+            'open': [10.0, 11.0], 'high': [12.0, 12.5], 'low': [9.5, 10.5],
+            'close': [11.0, 12.0], 'change': [1.0, -0.5], 'transaction': [5.0, 6.0],
+        })
+        assert store.upsert_bars('9999', 'TWSE', df) == 2
+        loaded = store.load_bars('9999')
+        assert loaded.index.dtype.kind == 'M'
+        assert [d.isoformat() for d in loaded.index.date] == ['2026-02-05', '2026-02-06']
+        assert list(loaded.columns) == HistoryStore.COLUMNS
+        assert loaded['close'].tolist() == [12.0, 11.0]
+        assert store.last_date('9999').isoformat() == '2026-02-06'
+
+        assert not store.is_period_complete('TWSE', '9999', '2026-02')
+        store.mark_period_fetched('TWSE', '9999', '2026-02', complete=True)
+        assert store.is_period_complete('TWSE', '9999', '2026-02')
+        store.close()
+    print("✓ 歷史資料庫寫入/讀取正常")
+
+
+def test_incremental_twse_history():
+    """測試已收盤月份只下載一次"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir)
+
+        first = fetcher.get_stock_history('9999', months=3)
+        first_calls = len(fetcher.session.calls)
+        assert not first.empty
+        assert first_calls >= 3
+
+        second = fetcher.get_stock_history('9999', months=3)
+        # 已收盤月份不再下載；本月已下載且本地已有最新交易日的資料，同樣不需下載
+        assert len(fetcher.session.calls) == first_calls
+        assert second['close'].tolist() == first['close'].tolist()
+        fetcher.history_store.close()
+    print("✓ 已收盤月份由本地讀取")
+
+
+def test_history_by_bars():
+    """測試依 K 線數量取得歷史資料"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir)
+
+        df = fetcher.get_stock_history('9999', bars=45)
+        assert len(df) == 45
+        last_session = fetcher.calendar.last_sessions(1)[-1]
+        assert df.index[-1].date() == last_session
+        assert df.index.is_monotonic_increasing
+
+        # 只下載涵蓋這 45 個交易日所需的月份
+        first_session = fetcher.calendar.last_sessions(45)[0]
+        months = {(d.year, d.month) for d in fetcher.calendar.trading_days_between(first_session, last_session)}
+        assert len(fetcher.session.calls) == len(months)
+        fetcher.history_store.close()
+    print("✓ 依 K 線數量取得歷史資料")
+
+
+def test_tpex_snapshot_shared():
+    """測試多檔上櫃股票共用每日全市場快照"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir, FakeTPExSession)
+
+        first = fetcher.get_stock_history('8888', months=1)
+        days_fetched = len(fetcher.session.calls)
+        assert not first.empty
+        assert len(first) == days_fetched
+
+        # 其他上櫃股票直接使用已下載的每日快照
+        second = fetcher.get_stock_history('8889', months=1)
+        assert len(fetcher.session.calls) == days_fetched
+        assert len(second) == len(first)
+        fetcher.history_store.close()
+    print("✓ 上櫃股票共用每日快照")
+
+
+def test_tpex_snapshot_empty_payload():
+    """測試交易日的錯誤/限流回應不保存快照，休市日的空白回應才保存"""
+    import threading
+    from knowledge_base.tools.market_snapshot import DailySnapshotCache
+
+    class ThrottledTPExSession(FakeTPExSession):
+        def get(self, url, params=None, timeout=None, **kwargs):
+            if 'FMTQIK' in url:
+                return FakeResponse({'stat': 'OK', 'data': _month_rows(url)})
+            self.calls.append(params['date'])
+            return FakeResponse({'stat': 'error', 'message': 'too many requests'})
+
+    # 假資料的交易日為每月 1~28 日的平日: 找出上個月以前的一個交易日與一個平日休市日
+    first = date.today().replace(day=1)
+    while True:
+        first = (first - timedelta(days=1)).replace(day=1)
+        holidays = [d for d in (first.replace(day=n) for n in (29, 30)) if d.month == first.month and d.weekday() < 5]
+        if holidays:
+            break
+    trading_day = next(first + timedelta(days=n) for n in range(7) if (first + timedelta(days=n)).weekday() < 5)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir, ThrottledTPExSession)
+        assert fetcher._get_tpex_daily_snapshot(datetime.combine(trading_day, datetime.min.time())) is None
+        assert fetcher.tpex_snapshots.get(trading_day) is None
+        assert fetcher._get_tpex_daily_snapshot(datetime.combine(holidays[0], datetime.min.time())).rows == []
+        assert fetcher.tpex_snapshots.get(holidays[0]) is not None
+        fetcher.history_store.close()
+
+        # 多個執行緒同時寫入同一天的快照
+        cache = DailySnapshotCache('TPEX', directory=os.path.join(tmpdir, 'concurrent'))
+        rows = [['8888', '股票8888', '50.00']]
+        errors = []
+
+        def write():
+            try:
+                for _ in range(20):
+                    cache.put(trading_day, rows, complete=True)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors
+        assert os.listdir(cache.directory) == [f"{trading_day.isoformat()}.json"]
+        assert DailySnapshotCache('TPEX', directory=cache.directory).get(trading_day).rows == rows
+    print("✓ 錯誤回應不保存為每日快照")
+
+
+def test_trading_calendar():
+    """測試交易日曆略過休市日與月份計算"""
+    from datetime import date
+    from knowledge_base.tools.trading_calendar import TradingCalendar, months_back
+
+    assert months_back(datetime(2026, 3, 31), 3) == [(2026, 3), (2026, 2), (2026, 1)]
+    assert months_back(datetime(2026, 1, 15), 2) == [(2026, 1), (2025, 12)]
+
+    # 2026/02 春節休市: 只有部分交易日
+    published = {(2026, 2): [date(2026, 2, 2), date(2026, 2, 3), date(2026, 2, 23)]}
+    requested = []
+
+    def fetch_month(year, month):
+        requested.append((year, month))
+        return published.get((year, month), [])
+
+    calendar = TradingCalendar(fetch_month)
+    now = datetime(2026, 3, 4, 10, 0)
+    assert calendar.trading_days(2026, 2, now) == published[(2026, 2)]
+    assert calendar.is_trading_day(date(2026, 2, 3), now)
+    assert not calendar.is_trading_day(date(2026, 2, 16), now)   # 春節
+    assert requested.count((2026, 2)) == 1                        # 已結束月份只查一次
+    # 本月尚未公布的平日仍視為可能的交易日，未來日期不列入
+    assert calendar.trading_days(2026, 3, now) == [date(2026, 3, 2), date(2026, 3, 3), date(2026, 3, 4)]
+    assert calendar.trading_days(2026, 4, now) == []
+    print("✓ 交易日曆正常")
+
+
+def test_trading_calendar_error_payload():
+    """測試 FMTQIK 的錯誤/限流回應不會將已結束月份記為沒有交易日"""
+    class ThrottledFMTQIKSession(FakeTWSESession):
+        def __init__(self):
+            super().__init__()
+            self.throttled = True
+
+        def get(self, url, params=None, timeout=None, **kwargs):
+            if 'FMTQIK' in url and self.throttled:
+                return FakeResponse({'stat': '查詢過於頻繁，請稍後再試'})
+            return super().get(url, params=params, timeout=timeout, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir, ThrottledFMTQIKSession)
+        fetcher.calendar.retry_interval = 0
+        now = datetime(2024, 3, 4, 10, 0)
+        assert fetcher._fetch_trading_days(2024, 1) is None
+        # 取得失敗時以平日推估，不保存該月份
+        assert len(fetcher.calendar.trading_days(2024, 1, now)) == 23
+        assert (2024, 1) not in fetcher.calendar._months
+
+        fetcher.session.throttled = False
+        days = fetcher.calendar.trading_days(2024, 1, now)
+        assert days[-1] == date(2024, 1, 26) and len(days) == 20
+        assert fetcher.calendar._months[(2024, 1)] == days
+        fetcher.history_store.close()
+    print("✓ 交易日曆不保存錯誤回應")
+
+
+def test_history_by_date_range():
+    """測試多年日期區間查詢與可續傳的批次回補"""
+    from datetime import date
+    from knowledge_base.tools.backfill import backfill
+
+    class FlakyTWSESession(FakeTWSESession):
+        """第一次請求 2024-03 時失敗"""
+
+        def get(self, url, params=None, timeout=None, **kwargs):
+            failing = 'STOCK_DAY' in url and 'date=20240301' in url
+            if failing and not any('date=20240301' in c for c in self.calls):
+                self.calls.append(url)
+                raise ConnectionError("timeout")
+            return super().get(url, params=params, timeout=timeout, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir, FlakyTWSESession)
+
+        first = backfill(['9999'], '2023-01-01', end=date(2024, 12, 31), fetcher=fetcher, progress=None)[0]
+        assert first['fetched'] == 23 and first['pending'] == 1 and first['skipped'] == 0
+
+        # 重新執行只下載先前失敗的月份
+        calls = len(fetcher.session.calls)
+        second = backfill(['9999'], '2023-01-01', end=date(2024, 12, 31), fetcher=fetcher, progress=None)[0]
+        assert len(fetcher.session.calls) == calls + 1
+        assert second['fetched'] == 1 and second['pending'] == 0 and second['skipped'] == 23
+
+        df = fetcher.get_stock_history('9999', start='2023-01-01', end='2024-12-31')
+        assert len(fetcher.session.calls) == calls + 1
+        assert df.index[0].date() == date(2023, 1, 2) and df.index[-1].date() == date(2024, 12, 27)
+        assert second['bars'] == len(df)
+        assert fetcher.get_stock_history('9999', start='2024-02-01', end='2024-01-01').empty
+        fetcher.history_store.close()
+    print("✓ 日期區間查詢與批次回補")
+
+
+def test_clean_data():
+    """測試原始行情轉換為數值與日期 (千分位、'--'、'X'、正負號與民國年)"""
+    import pandas as pd
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    raw = pd.DataFrame({
+        'date': ['115/02/02', '115/02/03', '115/02/04', '115/02/05'],
+        'volume': ['1,234,567', '0', '2,000', '3,000'],
+        'open': ['1,005.00', '--', '10.5', '11'],
+        'close': ['1,010.00', '--', 'X10.8', 'N/A'],
+        'change': ['+5.00', 'X0.00', '-0.20', '除權息'],
+    })
+    df = fetcher._clean_data(raw)
+    assert df['volume'].tolist() == [1234567, 0, 2000, 3000]
+    assert df['open'].tolist()[::2] == [1005.0, 10.5] and df['open'].isna().tolist() == [False, True, False, False]
+    assert df['close'].isna().tolist() == [False, True, True, True]
+    assert all(df[col].dtype == 'float64' for col in ('volume', 'open', 'close', 'change'))
+    assert df['change'].tolist() == [5.0, 0.0, -0.2, 0.0]
+    assert df['date'].dt.strftime('%Y-%m-%d').tolist() == ['2026-02-02', '2026-02-03', '2026-02-04', '2026-02-05']
+    print("✓ 行情資料清洗")
+
+
+def test_buy_sell_points():
+    """測試陣列化的歷史買賣點與原本逐列實作結果相同 (含 NaN 與缺少欄位)"""
+    import numpy as np
+    import pandas as pd
+    from benchmark_stock_data import make_indicator_bars, legacy_find_buy_sell_points
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    frames = [make_indicator_bars(500, seed=seed) for seed in range(5)]
+    holes = frames[0].copy()
+    rng = np.random.default_rng(1)
+    for col in ['MA5', 'MA20', 'RSI', 'K', 'D', 'close']:
+        holes.loc[holes.index[rng.random(len(holes)) < 0.1], col] = np.nan
+    frames += [holes, frames[1].drop(columns=['K', 'D']), frames[2].drop(columns=['close', 'RSI']),
+               frames[3].iloc[:19], frames[3].iloc[:20]]
+
+    # 實際技術指標 (MA60 等欄位含 None)
+    df = make_indicator_bars(300, seed=9)[['close']]
+    df['open'] = df['high'] = df['low'] = df['close']
+    df['volume'] = 1000.0
+    frames.append(fetcher.calculate_technical_indicators(df))
+
+    found = 0
+    for df in frames:
+        expected = legacy_find_buy_sell_points(df)
+        actual = fetcher.find_buy_sell_points(df)
+        for key in ('buy_points', 'sell_points'):
+            # 以 DataFrame 比較 (收盤價為 NaN 的買賣點視為相同)
+            pd.testing.assert_frame_equal(pd.DataFrame(actual[key]), pd.DataFrame(expected[key]))
+            found += len(actual[key])
+    assert found > 0
+    print(f"✓ 歷史買賣點 (共 {found} 個)")
+
+
+def test_support_resistance():
+    """測試滑動視窗支撐壓力位: 與原本逐列實作相同、2-D 全市場計算與價格區間聚合"""
+    import numpy as np
+    import pandas as pd
+    from benchmark_stock_data import legacy_support_resistance
+    from knowledge_base.tools.pivots import pivot_mask, cluster_zones, nearest_levels, market_support_resistance
+    from knowledge_base.tools.price_panel import PricePanel
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    rng = np.random.default_rng(3)
+    close = 100 + rng.normal(0, 1, (4, 300)).cumsum(axis=1)
+    high = np.round(close + rng.uniform(0, 1, close.shape), 1)
+    low = np.round(close - rng.uniform(0, 1, close.shape), 1)
+    high[0, ::17] = np.nan
+
+    for i in range(len(close)):
+        df = pd.DataFrame({'high': high[i], 'low': low[i], 'close': close[i]})
+        expected = legacy_support_resistance(df)
+        actual = fetcher.calculate_support_resistance(df)
+        assert actual['support'] == expected['support']
+        assert actual['resistance'] == expected['resistance']
+    assert fetcher.calculate_support_resistance(df.iloc[:4]) == legacy_support_resistance(df.iloc[:4])
+
+    # 2-D 與逐檔 1-D 結果相同；視窗加寬時轉折點變少
+    mask = pivot_mask(high, 3, 'high')
+    assert all((mask[i] == pivot_mask(high[i], 3, 'high')).all() for i in range(len(high)))
+    assert mask.sum() < pivot_mask(high, 2, 'high').sum()
+    assert not mask[:, :3].any() and not mask[:, -3:].any()
+    assert pivot_mask([1, 3, 2, 5, 4], 1, 'high').tolist() == [False, True, False, True, False]
+    assert pivot_mask([3, 3, 1, 3, 3], 1, 'low').tolist() == [False, False, True, False, False]
+
+    # 價格區間: 相近的價格合併並計算觸及次數
+    zones = cluster_zones([100.0, 100.5, 101.0, 110.0, 110.2, np.nan, 90.0], tolerance=0.01)
+    assert [(z['low'], z['high'], z['touches']) for z in zones] == \
+        [(90.0, 90.0, 1), (100.0, 101.0, 3), (110.0, 110.2, 2)]
+    assert zones[1]['price'] == 100.5
+    assert cluster_zones([]) == []
+    sr = fetcher.calculate_support_resistance(df, zones=True)
+    assert sum(z['touches'] for z in sr['zones']) == \
+        pivot_mask(high[-1], 2, 'high').sum() + pivot_mask(low[-1], 2, 'low').sum()
+    assert {z['type'] for z in sr['zones']} <= {'support', 'resistance'}
+
+    # 全市場: 最接近收盤價的支撐/壓力位與逐檔結果相同
+    levels = nearest_levels(high, low, close)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        panel = PricePanel(tmpdir, writable=True)
+        panel.add_dates(pd.bdate_range('2025-01-01', periods=close.shape[1]))
+        panel.add_symbols(['1101', '1102', '1103', '1104'])
+        for name, values in (('high', high), ('low', low), ('close', close)):
+            panel._arrays[name][:4, :close.shape[1]] = values
+        panel.flush()
+        market = market_support_resistance(PricePanel(tmpdir), lookback=close.shape[1])
+    for i in range(len(close)):
+        expected = legacy_support_resistance(pd.DataFrame({'high': high[i], 'low': low[i], 'close': close[i]}))
+        np.testing.assert_equal(levels['support'][i], (expected['support'] or [np.nan])[0])
+        np.testing.assert_equal(market['resistance'].iloc[i], (expected['resistance'] or [np.nan])[0])
+    print(f"✓ 支撐壓力位 ({len(sr['zones'])} 個價格區間)")
+
+
+def test_indicator_engine():
+    """測試串流技術指標: 逐根更新 (含序列化後接續) 與整段計算結果相同"""
+    import json
+    import numpy as np
+    import pandas as pd
+    from knowledge_base.tools.history_store import HistoryStore
+    from knowledge_base.tools.indicator_engine import IndicatorEngine
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    rng = np.random.default_rng(5)
+    n = 400
+    close = 100 + rng.normal(0, 1, n).cumsum()
+    close[100:130] = close[100]
+    df = pd.DataFrame({'high': close + rng.uniform(0, 1, n), 'low': close - rng.uniform(0, 1, n), 'close': close},
+                      index=pd.DatetimeIndex(pd.bdate_range('2024-01-01', periods=n), name='date'))
+    df.iloc[100:130, :2] = close[100]
+    df.iloc[200, 2] = np.nan
+    df.iloc[210, 0] = np.nan
+    expected = fetcher.calculate_technical_indicators(df)
+
+    engine = IndicatorEngine()
+    first = engine.update_frame(df.iloc[:150])
+    engine = IndicatorEngine.from_dict(json.loads(json.dumps(engine.to_dict())))
+    actual = pd.concat([first, engine.update_frame(df.iloc[150:])])
+    for col in IndicatorEngine.COLUMNS:
+        # 價格不變的區間 pandas 的滾動標準差約有 1e-6 的誤差 (引擎為精確的 0)
+        atol = 1e-5 if col.startswith('BB_') else 1e-9
+        np.testing.assert_allclose(actual[col], expected[col].astype(float), rtol=1e-9, atol=atol, err_msg=col)
+    assert engine.count == n and engine.last_date == df.index[-1].date()
+
+    # 不足 20 根時不加指標，不足 60 根時 MA60 為 None (同整段計算)
+    assert 'RSI' not in IndicatorEngine().apply(df.iloc[:19]).columns
+    short = IndicatorEngine().apply(df.iloc[:30])
+    assert short['MA60'].isna().all() and short['RSI'].equals(fetcher.calculate_technical_indicators(df.iloc[:30])['RSI'])
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # 狀態儲存於歷史資料庫，之後只計算新增的 K 線；最後一根被覆寫時重新計算
+        fetcher = _make_fetcher(tmpdir)
+        store = fetcher.history_store
+        bars = df.reset_index()
+        store.upsert_bars('2330', 'TWSE', bars.iloc[:300])
+        latest = fetcher.update_indicator_state('2330')
+        assert latest['bars'] == 300 and latest['date'] == df.index[299].date()
+        store.upsert_bars('2330', 'TWSE', bars.iloc[300:])
+        latest = fetcher.update_indicator_state('2330')
+        assert latest['bars'] == n
+        for col in IndicatorEngine.COLUMNS:
+            np.testing.assert_allclose(latest[col], float(expected[col].iloc[-1]), rtol=1e-9, err_msg=col)
+
+        changed = bars.iloc[[-1]].copy()
+        changed['close'] += 1
+        store.upsert_bars('2330', 'TWSE', changed)
+        assert store.load_indicator_state('2330') is None
+        assert fetcher.update_indicator_state('2330')['bars'] == n
+        assert store.load_indicator_state('2330')['count'] == n
+
+        # 技術指標快取: 結果等同由 bars + 暖身期整段計算，不論是否接續前一次的結果
+        fetcher._indicator_cache.clear()
+        warmup = fetcher.INDICATOR_WARMUP
+        fetcher.get_stock_history = lambda stock_id, bars=None: df.iloc[max(end - bars, 0):end]
+        for window, first_end in ((120, 100), (60, 380)):
+            # (120, 100): 歷史不足 bars + 暖身期，計算起點不變，接續計算最後一根
+            # (60, 380): 計算起點隨新 K 線後移，由新的起點重新計算
+            end = first_end
+            fetcher.get_history_with_indicators('2330', bars=window)
+            end = first_end + 1
+            warm = fetcher.get_history_with_indicators('2330', bars=window)
+            fetcher._indicator_cache.clear()
+            cold = fetcher.get_history_with_indicators('2330', bars=window)
+            assert len(warm) == min(window, end) and warm.index[-1] == df.index[first_end]
+            full = fetcher.calculate_technical_indicators(df.iloc[max(end - window - warmup, 0):end]).tail(window)
+            for col in IndicatorEngine.COLUMNS:
+                np.testing.assert_allclose(warm[col], cold[col].astype(float), rtol=1e-12, err_msg=col)
+                np.testing.assert_allclose(cold[col], full[col].astype(float), rtol=1e-9, err_msg=col)
+        store.close()
+    print("✓ 串流技術指標")
+
+
+def test_panel_indicators():
+    """測試全市場技術指標: 不等長 (NaN 填補) 的歷史與逐檔計算結果相同"""
+    import numpy as np
+    import pandas as pd
+    from knowledge_base.tools.indicator_engine import IndicatorEngine
+    from knowledge_base.tools.panel_indicators import panel_indicators, market_indicators
+    from knowledge_base.tools.price_panel import PricePanel
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    rng = np.random.default_rng(7)
+    symbols, days = 6, 300
+    dates = pd.DatetimeIndex(pd.bdate_range('2024-01-01', periods=days), name='date')
+    close = 50 + rng.normal(0, 1, (symbols, days)).cumsum(axis=1)
+    high = close + rng.uniform(0, 1, close.shape)
+    low = close - rng.uniform(0, 1, close.shape)
+    close[1, :120] = np.nan        # 較晚上市
+    close[2, 100:110] = np.nan     # 停牌
+    close[3, 250:] = np.nan        # 下市
+    close[4, :260] = np.nan        # 只有 40 根 (沒有 MA60)
+    close[5, :285] = np.nan        # 只有 15 根 (沒有指標)
+    high[0, 50] = np.nan
+
+    result = panel_indicators(high, low, close)
+    for i in range(symbols):
+        valid = ~np.isnan(close[i])
+        df = pd.DataFrame({'high': high[i], 'low': low[i], 'close': close[i]}, index=dates)[valid]
+        expected = fetcher.calculate_technical_indicators(df)
+        for col in IndicatorEngine.COLUMNS:
+            actual = result[col][i]
+            assert np.isnan(actual[~valid]).all()
+            if col not in expected.columns:
+                assert np.isnan(actual).all(), f"{i} {col}"
+                continue
+            np.testing.assert_allclose(actual[valid], expected[col].to_numpy(dtype=float),
+                                       rtol=1e-8, atol=1e-8, err_msg=f"{i} {col}")
+    assert np.isnan(result['MA60'][4]).all() and not np.isnan(result['MA20'][4]).all()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        panel = PricePanel(tmpdir, writable=True)
+        panel.add_dates(dates)
+        panel.add_symbols([f"{1101 + i}" for i in range(symbols)])
+        for name, values in (('high', high), ('low', low), ('close', close)):
+            panel._arrays[name][:symbols, :days] = values
+        panel.flush()
+        latest = market_indicators(PricePanel(tmpdir), day=dates[200])
+    assert latest.loc['1101', 'RSI'] == result['RSI'][0, 200]
+    assert np.isnan(latest.loc['1105', 'RSI'])
+    print("✓ 全市場技術指標")
+
+
+def test_indicator_cache():
+    """測試技術指標快取: 依最後一根 K 線與參數為鍵，LRU 依位元組上限淘汰"""
+    import numpy as np
+    import pandas as pd
+    from knowledge_base.tools.indicator_cache import IndicatorCache, estimate_size
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    arrays = [np.zeros(100) for _ in range(4)]
+    cache = IndicatorCache(max_bytes=2500)
+    for i, values in enumerate(arrays[:3]):
+        cache.put(('a', i), values)
+    assert len(cache) == 3 and cache.nbytes == 3 * estimate_size(arrays[0])
+    assert cache.get(('a', 0)) is arrays[0]
+    cache.put(('a', 3), arrays[3])
+    assert ('a', 1) not in cache and ('a', 0) in cache and len(cache) == 3
+    # 超過上限的值不快取，也不影響既有項目
+    cache.put(('a', 4), np.zeros(1000))
+    assert ('a', 4) not in cache and len(cache) == 3
+    assert cache.get_or_compute(('a', 0), lambda: None) is arrays[0]
+    assert cache.stats.hits == 2 and cache.peek(('a', 9)) is None and cache.stats.misses == 0
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+    # 串流指標狀態的滾動視窗也計入大小 (MA60 的視窗即有 60 個數值)
+    from knowledge_base.tools.indicator_engine import IndicatorEngine
+    engine = IndicatorEngine()
+    frame = engine.apply(pd.DataFrame({'high': np.arange(1.0, 101.0), 'low': np.arange(0.0, 100.0),
+                                       'close': np.arange(0.5, 100.5)},
+                                      index=pd.bdate_range('2024-01-01', periods=100, name='date')))
+    assert estimate_size(engine) > estimate_size(IndicatorEngine()) + 60 * sys.getsizeof(1.0)
+    entry = (frame, engine)
+    assert estimate_size(entry) == sys.getsizeof(entry) + estimate_size(frame) + estimate_size(engine)
+
+    fetcher = TWSEDataFetcher.__new__(TWSEDataFetcher)
+    fetcher._indicator_cache.clear()
+    stats = fetcher._cache_stats['indicators']
+    rng = np.random.default_rng(7)
+    close = 100 + rng.normal(0, 1, 101).cumsum()
+    bars = pd.DataFrame({'high': close + 0.5, 'low': close - 0.5, 'close': close},
+                        index=pd.DatetimeIndex(pd.bdate_range('2024-01-01', periods=101), name='date'))
+    df = bars.iloc[:100]
+    misses = stats.misses
+    first = fetcher.calculate_technical_indicators(df, stock_id='2330')
+    hits = stats.hits
+    second = fetcher.calculate_technical_indicators(df, stock_id='2330')
+    assert stats.hits == hits + 1 and stats.misses == misses + 1
+    pd.testing.assert_frame_equal(first, second)
+    pd.testing.assert_frame_equal(first, fetcher.calculate_technical_indicators(df))
+    # 回傳副本，修改結果不影響快取
+    second['RSI'] = 0.0
+    assert not (fetcher.calculate_technical_indicators(df, stock_id='2330')['RSI'] == 0.0).all()
+
+    # 新的一根 K 線、盤中收盤價改變或不同股票皆為不同的鍵
+    grown = bars
+    fetcher.calculate_technical_indicators(grown, stock_id='2330')
+    changed = df.copy()
+    changed.iloc[-1, changed.columns.get_loc('close')] += 1
+    fetcher.calculate_technical_indicators(changed, stock_id='2330')
+    fetcher.calculate_technical_indicators(df, stock_id='2317')
+    assert stats.misses == misses + 4
+    fetcher._indicator_cache.clear()
+    print("✓ 技術指標快取")
+
+
+def test_watchlist_prefetch():
+    """測試收盤後預先下載: 之後查詢自選股的行情與技術指標不需連網"""
+    from knowledge_base.tools.prefetch import WatchlistPrefetcher
+    from knowledge_base.tools.symbol_master import SymbolMaster
+
+    class QuoteSession(FakeTWSESession):
+        """另外回應全市場行情 (OpenAPI)"""
+
+        def get(self, url, params=None, timeout=None, **kwargs):
+            if 'openapi' in url:
+                self.calls.append(url)
+                return FakeResponse([])
+            return super().get(url, params=params, timeout=timeout, **kwargs)
+
+    responses = {
+        'opendata/t187ap03_L': [{'公司代號': '9999', '公司簡稱': '測試', '產業別': '24'}],
+        'STOCK_DAY_ALL': [{'Code': '9999', 'Name': '測試'}],
+        'mopsfe_opendata_t187ap03_O': [{'公司代號': '8888', '公司簡稱': '股票8888', '產業別': '24'}],
+        'tpex_mainboard_quotes': [{'SecuritiesCompanyCode': '8888', 'CompanyName': '股票8888'}],
+    }
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir, QuoteSession)
+        fetcher.symbols = SymbolMaster(lambda url: next(v for k, v in responses.items() if url.endswith(k)),
+                                       path=os.path.join(tmpdir, 'symbols.json'))
+        fetcher._indicator_cache.clear()
+
+        prefetcher = WatchlistPrefetcher(['9999', '9999'], fetcher=fetcher, run_at=(15, 30))
+        result = prefetcher.run_once()
+        assert result['stocks'] == 1 and result['failed'] == []
+        calls = len(fetcher.session.calls)
+
+        stats = fetcher._cache_stats['indicators']
+        hits = stats.hits
+        info = fetcher.get_stock_info('9999')
+        df = fetcher.get_history_with_indicators('9999')
+        assert len(fetcher.session.calls) == calls
+        assert stats.hits == hits + 1
+        assert info['name'] == '測試' and info['close'] == df['close'].iloc[-1]
+        assert 'RSI' in df.columns
+        state = fetcher.history_store.load_indicator_state('9999')
+        assert state['last_date'] == fetcher.history_store.last_date('9999').isoformat()
+
+        # 週五收盤後的下一次執行為下週一
+        assert prefetcher.next_run(datetime(2026, 2, 6, 16, 0)) == datetime(2026, 2, 9, 15, 30)
+        assert prefetcher.next_run(datetime(2026, 2, 6, 9, 0)) == datetime(2026, 2, 6, 15, 30)
+        fetcher.history_store.close()
+    print("✓ 自選股預先下載")
+
+
+def test_stock_info_types():
+    """測試股票資訊不論由本地資料庫或交易所取得，價量欄位皆為數值，工具輸出相同"""
+    from knowledge_base.tools.stock_tools import StockPriceTool
+    from knowledge_base.tools.symbol_master import SymbolMaster
+
+    responses = {
+        'opendata/t187ap03_L': [{'公司代號': '9999', '公司簡稱': '測試', '產業別': '24'}],
+        'STOCK_DAY_ALL': [{'Code': '9999', 'Name': '測試'}],
+        'mopsfe_opendata_t187ap03_O': [{'公司代號': '8888', '公司簡稱': '股票8888', '產業別': '24'}],
+        'tpex_mainboard_quotes': [{'SecuritiesCompanyCode': '8888', 'CompanyName': '股票8888'}],
+    }
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir)
+        fetcher.symbols = SymbolMaster(lambda url: next(v for k, v in responses.items() if url.endswith(k)),
+                                       path=os.path.join(tmpdir, 'symbols.json'))
+        live = fetcher.get_stock_info('9999')
+        fetcher.get_stock_history('9999', months=1)
+        calls = len(fetcher.session.calls)
+        stored = fetcher.get_stock_info('9999')
+        assert len(fetcher.session.calls) == calls
+
+        for info in (live, stored):
+            assert info['change'] == 1.0 and isinstance(info['close'], float)
+            assert info['trade_volume'] == 1000 and isinstance(info['trade_volume'], int)
+            assert info['transaction'] == 50 and isinstance(info['transaction'], int)
+
+        tool = StockPriceTool()
+        tool.fetcher = fetcher
+        text = tool._run('9999')
+        assert '漲跌：+1.00' in text and '成交量：1,000 股' in text and '成交金額：100,000 元' in text
+        fetcher.history_store.close()
+    print("✓ 股票資訊型別一致")
+
+
+def test_index_history():
+    """測試大盤指數: 兩個市場並行查詢，之後的摘要與本月走勢由快取回應"""
+    from knowledge_base.tools.twse_data import TWSEDataFetcher
+
+    class IndexSession(FakeTWSESession):
+        """另外回應 TPEx 櫃買指數 (當月每日資料)，記錄所有請求"""
+
+        def __init__(self):
+            super().__init__()
+            self.urls = []
+
+        def get(self, url, params=None, timeout=None, **kwargs):
+            self.urls.append(url)
+            if 'otc_idx_daily' in url:
+                roc_year, month, _ = url.split('d=')[1].split('/')
+                rows = [[row[0], "300.50", "+1.20", "1,000", "2,000", "30"]
+                        for row in _month_rows(f"date={int(roc_year) + 1911}{month}01")]
+                return FakeResponse({'aaData': rows})
+            return super().get(url, params=params, timeout=timeout, **kwargs)
+
+    TWSEDataFetcher._index_cache.clear()
+    TWSEDataFetcher._index_months.clear()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir, IndexSession)
+        twse, tpex = fetcher.get_market_summaries()
+        last = fetcher.calendar.last_sessions(1)[-1]
+        assert twse['date'] == tpex['date']
+        assert twse['index'] == 105.0 and twse['transaction'] == 100
+        assert tpex['index'] == 300.5 and tpex['change'] == 1.2 and tpex['volume'] == 1000
+        calls = len(fetcher.session.urls)
+
+        # 重複查詢與本月走勢不需再連網
+        assert fetcher.get_market_summaries() == [twse, tpex]
+        month = fetcher.get_index_history('TPEX', start=last.replace(day=1), end=last)
+        assert len(fetcher.session.urls) == calls
+        day = month.index[-1]
+        assert tpex['date'] == f"{day.year - 1911}/{day.month:02d}/{day.day:02d}"
+        assert list(month.columns) == TWSEDataFetcher.INDEX_COLUMNS
+        fetcher.history_store.close()
+    print("✓ 大盤指數快取")
+
+
+def test_price_panel():
+    """測試記憶體映射的全市場價量面板: 建立、唯讀開啟、每日附加與容量擴充"""
+    import numpy as np
+    import pandas as pd
+    from knowledge_base.tools.price_panel import PricePanel, build_price_panel, append_price_panel
+    from knowledge_base.tools.symbol_master import Symbol
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir)
+        bars = fetcher.get_stock_history('9999', start='2024-01-01', end='2024-03-31')
+        directory = os.path.join(tmpdir, 'panel')
+        build_price_panel(fetcher, '2024-01-01', end='2024-03-31', stock_ids=['9999', '9998'], directory=directory)
+
+        reader = PricePanel(directory)
+        assert reader.shape == (2, len(bars))
+        assert isinstance(reader.field('close'), np.memmap) and not reader.field('close').flags.writeable
+        assert reader.history('9999')['close'].tolist() == bars['close'].tolist()
+        day = bars.index[10]
+        assert reader.column('close', day)[0] == bars['close'].iloc[10] and np.isnan(reader.column('close', day)[1])
+        try:
+            reader.add_symbols(['1234'])
+            raise AssertionError("唯讀模式不可寫入")
+        except PermissionError:
+            pass
+
+        # 每日附加: 以全市場行情寫入新交易日 (含新股票)
+        class QuoteFetcher:
+            symbols = type('Symbols', (), {'symbols': lambda self: [Symbol('9999', '測試', 'TWSE'),
+                                                                  Symbol('1234', '新股', 'TWSE')]})()
+
+            def get_stock_info_many(self, stock_ids):
+                return pd.DataFrame({'date': ['113/04/01', '113/04/01'], 'open': [1.0, 2.0], 'high': [1.0, 2.0],
+                                     'low': [1.0, 2.0], 'close': [1.5, 2.5], 'trade_volume': [100, 200]},
+                                    index=pd.Index(['9999', '1234'], name='stock_id'))
+
+        assert append_price_panel(QuoteFetcher(), directory=directory).isoformat() == '2024-04-01'
+        assert reader.shape == (2, len(bars))
+        reader.reload()
+        assert reader.shape == (3, len(bars) + 1)
+        assert reader.column('close', '2024-04-01').tolist()[::2] == [1.5, 2.5]
+        assert reader.cross_section('2024-04-01').loc['1234', 'volume'] == 200
+
+        # 上市、上櫃行情日期不同時 (上櫃尚未更新)，各自寫入所屬的交易日
+        class LaggingQuoteFetcher(QuoteFetcher):
+            def get_stock_info_many(self, stock_ids):
+                return pd.DataFrame({'date': ['113/04/02', '113/04/01'], 'open': [3.0, 4.0], 'high': [3.0, 4.0],
+                                     'low': [3.0, 4.0], 'close': [3.5, 4.5], 'trade_volume': [300, 400]},
+                                    index=pd.Index(['9999', '5555'], name='stock_id'))
+
+        assert append_price_panel(LaggingQuoteFetcher(), directory=directory).isoformat() == '2024-04-02'
+        reader.reload()
+        assert reader.shape == (4, len(bars) + 2)
+        assert reader.cross_section('2024-04-02').loc['9999', 'close'] == 3.5
+        assert reader.cross_section('2024-04-01').loc['5555', 'close'] == 4.5
+        assert np.isnan(reader.cross_section('2024-04-02').loc['5555', 'close'])
+        assert reader.cross_section('2024-04-01').loc['9999', 'close'] == 1.5
+
+        # 超過預留容量時擴充，既有資料不變
+        writer = PricePanel(directory, writable=True)
+        writer.add_symbols(f"{i:04d}" for i in range(2000, 2300))
+        writer.flush()
+        reader.reload()
+        assert reader.shape == (304, len(bars) + 2)
+        assert reader.history('9999')['close'].iloc[:-2].tolist() == bars['close'].tolist()
+        fetcher.history_store.close()
+    print("✓ 全市場價量面板")
+
+
+def test_history_export():
+    """測試歷史行情串流匯出 (Parquet/Arrow 需要 pyarrow)"""
+    from knowledge_base.tools.history_export import iter_frames
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir)
+        store = fetcher.history_store
+        for stock_id in ('9999', '9998'):
+            fetcher._market_cache[stock_id] = 'TWSE'
+            fetcher.get_stock_history(stock_id, start='2023-01-01', end='2024-12-31')
+        assert store.stock_ids() == ['9998', '9999'] and store.stock_ids('TPEX') == []
+
+        # 每批約 batch_rows 列，同一檔股票不拆開
+        frames = list(iter_frames(store, batch_rows=100))
+        assert len(frames) == 2 and list(frames[0]['stock_id'].unique()) == ['9998']
+        total = sum(len(f) for f in frames)
+
+        with_indicators = next(iter_frames(store, ['9999'], start='2024-06-01',
+                                           indicators=fetcher.calculate_technical_indicators))
+        assert with_indicators['date'].min().date().isoformat() >= '2024-06-01'
+        assert with_indicators['MA60'].notna().all() and with_indicators['MA60'].dtype == 'float64'
+        store.close()
+    print("✓ 歷史行情串流匯出")
+
+
+def test_history_export_arrow():
+    """測試匯出 Parquet/Arrow: 所有批次使用同一個 schema (需要選用套件 pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        if 'pytest' in sys.modules:
+            import pytest
+            pytest.skip("未安裝 pyarrow")
+        print("△ 未安裝 pyarrow，略過 Parquet/Arrow 匯出測試")
+        return
+    import pandas as pd
+    from knowledge_base.tools.history_export import arrow_schema
+    from knowledge_base.tools.indicator_engine import IndicatorEngine
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fetcher = _make_fetcher(tmpdir)
+        store = fetcher.history_store
+        for stock_id in ('9999', '9998'):
+            fetcher._market_cache[stock_id] = 'TWSE'
+            fetcher.get_stock_history(stock_id, start='2023-01-01', end='2024-12-31')
+        total = len(store.load_bars('9998')) + len(store.load_bars('9999'))
+        # 新上市股票 (K 線不足 20 根，沒有技術指標欄位) 與有指標的股票併在同一批
+        store.upsert_bars('0001', 'TWSE', store.load_bars('9999').tail(5).reset_index())
+
+        path = os.path.join(tmpdir, 'export', 'market.parquet')
+        result = store.export_parquet(path, batch_rows=100, indicators=fetcher.calculate_technical_indicators)
+        assert result['rows'] == total + 5 and result['symbols'] == 3 and result['row_groups'] == 2
+        parquet = pq.ParquetFile(path)
+        assert parquet.metadata.num_row_groups == 2
+        table = parquet.read()
+        assert table.schema.equals(arrow_schema(indicators=True))
+        assert table.column_names[:3] == ['stock_id', 'market', 'date']
+        assert set(IndicatorEngine.COLUMNS) <= set(table.column_names)
+        df = table.to_pandas()
+        assert df.loc[df['stock_id'] == '9999', 'close'].tolist() == store.load_bars('9999')['close'].tolist()
+        assert df.loc[df['stock_id'] == '0001', 'RSI'].isna().all()
+        assert df.loc[df['stock_id'] == '9999', 'RSI'].notna().any()
+
+        # 沒有技術指標時只有價量欄位；沒有資料時仍為同一個 schema
+        assert store.to_arrow(['0001', '9999']).schema.equals(arrow_schema())
+
+        reader = store.to_arrow(['9999'], start='2024-01-01', end='2024-01-31')
+        assert reader.read_all().num_rows == len(store.load_bars('9999', start=date(2024, 1, 1), end=date(2024, 1, 31)))
+        empty = store.to_arrow(['0000']).read_all()
+        assert empty.num_rows == 0 and empty.schema.equals(arrow_schema())
+        assert isinstance(empty, pa.Table)
+        store.close()
+    print("✓ 歷史行情匯出 Parquet/Arrow")
+
+
+def main():
+    """主測試函數"""
+    print("=" * 50)
+    print("本地歷史行情資料庫測試")
+    print("=" * 50)
+
+    tests = [
+        test_history_store_roundtrip,
+        test_incremental_twse_history,
+        test_history_by_bars,
+        test_tpex_snapshot_shared,
+        test_tpex_snapshot_empty_payload,
+        test_trading_calendar,
+        test_trading_calendar_error_payload,
+        test_history_by_date_range,
+        test_clean_data,
+        test_buy_sell_points,
+        test_support_resistance,
+        test_indicator_engine,
+        test_panel_indicators,
+        test_indicator_cache,
+        test_watchlist_prefetch,
+        test_stock_info_types,
+        test_index_history,
+        test_price_panel,
+        test_history_export,
+        test_history_export_arrow,
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+        except Exception as e:
+            failed += 1
+            print(f"✗ {test.__name__} 失敗: {e!r}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
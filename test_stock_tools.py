@@ -33,7 +33,7 @@ def test_twse_data_fetcher():
         history = fetcher.get_stock_history("2330", months=1)
         if not history.empty:
             print(f"✓ 獲取到 {len(history)} 筆歷史數據")
-            print(f"  日期範圍: {history['date'].iloc[0]} ~ {history['date'].iloc[-1]}")
+            print(f"  日期範圍: {history.index[0]:%Y-%m-%d} ~ {history.index[-1]:%Y-%m-%d}")
         else:
             print("✗ 無法獲取歷史數據")
         